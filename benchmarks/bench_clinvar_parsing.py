@@ -0,0 +1,90 @@
+"""
+ClinVar parsing on a synthetic VEP-annotated ClinVar file: the previous `parse_vcf_line` (INFO values kept in
+the module-global dictionary) compared to the per-record parser writing TSV, loading a dataframe with
+`load_clinvar_vcf`, and loading with the early `nonsense_filter` against filtering the full dataframe in pandas
+as `data_processing.ipynb` does. The stale values of the previous parser are counted, and the filtered
+results are checked to be identical.
+
+Usage:
+    python benchmarks/bench_clinvar_parsing.py [n_records]
+"""
+import csv
+import gzip
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'context_analysis'))
+
+import pandas as pd  # noqa: E402
+
+from info_fields import InfoDecoder  # noqa: E402
+from output_writers import TableWriter  # noqa: E402
+from parse_vcf_clinvar import (clinvar_columns_dict, clinvar_info_names, clinvar_vep_fields, headers,  # noqa: E402
+                               load_clinvar_vcf, nonsense_filter, parse_clinvar_vcf, vep_names)
+from synthetic import make_clinvar_vcf  # noqa: E402
+from vep_fields import VepDecoder  # noqa: E402
+
+
+def old_parse_clinvar_vcf(vcf_file: str, output_file: str) -> None:
+    # Previous implementation: INFO values are written into a dictionary shared by all records
+    clinvar_info_dict = {info: idx for idx, info in enumerate(clinvar_info_names)}
+    info_decoder = InfoDecoder.from_vcf(vcf_file, clinvar_info_names)
+    vep_decoder = VepDecoder.from_vcf(vcf_file, clinvar_vep_fields, fallback_names=vep_names)
+    with gzip.open(vcf_file, 'rt') as input_file, TableWriter(output_file, headers) as table_writer:
+        for line in csv.reader(input_file, delimiter='\t'):
+            if line[0].startswith('#'):
+                continue
+            info = line[clinvar_columns_dict['INFO']]
+            clinvar_info_dict.update(info_decoder.decode(info, typed=False))
+            for vep_fields in vep_decoder.decode(vep_decoder.get_annotation(info)):
+                table_writer.write_row(['chr' + line[0]] + line[1:5] + [
+                    clinvar_info_dict['CLNSIG'], clinvar_info_dict['CLNVC'], clinvar_info_dict['GENEINFO'],
+                    clinvar_info_dict['MC']] + vep_fields)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(n_records: int = 200000) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        vcf_file = make_clinvar_vcf(os.path.join(tmp, 'clinvar.vcf.gz'), n_records)
+
+        _, old_seconds = timed(old_parse_clinvar_vcf, vcf_file, os.path.join(tmp, 'old.tsv'))
+        n_rows, tsv_seconds = timed(parse_clinvar_vcf, vcf_file, tmp, 'new.tsv')
+        clinvar_df, load_seconds = timed(load_clinvar_vcf, vcf_file)
+        filtered_df, filter_seconds = timed(load_clinvar_vcf, vcf_file, nonsense_filter)
+
+        start = time.perf_counter()
+        # Filters of data_processing.ipynb
+        expected = clinvar_df[
+            clinvar_df['CLNSIG'].str.contains('pathogenic', case=False) &
+            ~clinvar_df['CLNSIG'].str.contains('pathogenicity') &
+            clinvar_df['MC'].str.contains('nonsense', na=False) &
+            clinvar_df['Consequence'].str.contains('stop_gained') &
+            (clinvar_df['CANONICAL'] == 'YES')
+        ]
+        pandas_filter_seconds = load_seconds + time.perf_counter() - start
+
+        old = pd.read_csv(os.path.join(tmp, 'old.tsv'), sep='\t', dtype=str, keep_default_na=False)
+        new = pd.read_csv(os.path.join(tmp, 'new.tsv'), sep='\t', dtype=str, keep_default_na=False)
+        assert len(new) == n_rows == len(clinvar_df) == len(old)
+        stale = (old['GENEINFO'] != new['GENEINFO']).sum()
+        assert expected.reset_index(drop=True).astype(str).equals(filtered_df.astype(str))
+
+        print(f'{n_records} records, {n_rows} rows')
+        print(f'previous parser (TSV)            {old_seconds:8.2f} s, {stale} rows with a stale GENEINFO/MC')
+        print(f'parse_clinvar_vcf (TSV)          {tsv_seconds:8.2f} s ({old_seconds / tsv_seconds:.2f}x)')
+        print(f'load_clinvar_vcf                 {load_seconds:8.2f} s, '
+              f'{clinvar_df.memory_usage(deep=True).sum() / 2 ** 20:.0f} MiB')
+        print(f'load + pandas filters            {pandas_filter_seconds:8.2f} s, {len(expected)} rows')
+        print(f'load_clinvar_vcf(nonsense_filter) {filter_seconds:7.2f} s, {len(filtered_df)} rows '
+              f'({pandas_filter_seconds / filter_seconds:.1f}x, checked)')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
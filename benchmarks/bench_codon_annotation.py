@@ -0,0 +1,47 @@
+"""
+Codon/stop annotation and transition/transversion classification of all_nmd_undergo_final.csv (repeated
+`n_copies` times): row-wise `get_codon_info` and `classify_mutation_pair` with `DataFrame.apply` against
+`get_codon_info_batch` and `classify_mutation_pairs`. Both results are checked to be identical.
+
+Usage:
+    python benchmarks/bench_codon_annotation.py [n_copies]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'context_analysis'))
+
+import pandas as pd  # noqa: E402
+
+from analysis_functions import classify_mutation_pair, get_codon_info  # noqa: E402
+from codon_annotation import classify_mutation_pairs, get_codon_info_batch  # noqa: E402
+
+variants_csv = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', 'context_analysis', 'data', 'all_nmd_undergo_final.csv')
+
+
+def main(n_copies: int = 10) -> None:
+    variants = pd.read_csv(variants_csv, usecols=['REF', 'ALT', 'Context', 'Strand'])
+    variants = pd.concat([variants[variants['Context'].notna()]] * n_copies, ignore_index=True)
+    print(f'{len(variants)} variants')
+
+    start = time.perf_counter()
+    expected = variants.apply(lambda row: pd.Series(get_codon_info(row)), axis=1)
+    expected.columns = ['Codon_position', 'Codon', 'Stop_Codon'][:expected.shape[1]]
+    expected_pairs = pd.Series(list(zip(variants['REF'], variants['ALT']))).apply(classify_mutation_pair)
+    row_wise = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = get_codon_info_batch(variants)
+    pairs = classify_mutation_pairs(variants['REF'], variants['ALT'])
+    batched = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(result.astype(str), expected.reindex(columns=result.columns).astype(str))
+    assert list(pairs) == list(expected_pairs)
+    print(f'DataFrame.apply   {row_wise:8.2f} s')
+    print(f'batched           {batched:8.3f} s ({row_wise / batched:.0f}x)')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,85 @@
+"""
+Per-position chi-square tests of the contexts in all_nmd_undergo_final.csv and all_nmd_escape_final.csv
+(codon position 1/2/3 x NMD escape/undergo, contexts repeated `n_copies` times): the previous nested counting loops
+with one `chi2_contingency` call per position against one-hot counting and batched tests of `calculate_chi2_batch`.
+Chi-square values and p-values are checked to be equal.
+
+Usage:
+    python benchmarks/bench_context_statistics.py [n_copies]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'context_analysis'))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from scipy.stats import chi2_contingency  # noqa: E402
+from statsmodels.stats.multitest import multipletests  # noqa: E402
+
+from context_statistics import calculate_chi2_batch  # noqa: E402
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'context_analysis', 'data')
+
+
+def calculate_chi2_loops(context_ben, context_pat):
+    # Previous implementation of calculate_chi2_p_values (both counting loops are the same)
+    frequencies = []
+    for contexts in (context_pat, context_ben):
+        freq_array = np.zeros((len(contexts[0]), 4))
+        for seq in contexts:
+            for j, nt in enumerate(seq):
+                if nt == 'A':
+                    freq_array[j][0] += 1
+                elif nt == 'C':
+                    freq_array[j][1] += 1
+                elif nt == 'G':
+                    freq_array[j][2] += 1
+                elif nt == 'T':
+                    freq_array[j][3] += 1
+        frequencies.append(freq_array)
+    chi2_values, p_values = [], []
+    for i in range(frequencies[0].shape[0]):
+        try:
+            chi2, p_value, _, _ = chi2_contingency(np.array([frequencies[0][i], frequencies[1][i]]))
+        except ValueError:
+            chi2_values.append(np.nan)
+            p_values.append(1.0)
+        else:
+            chi2_values.append(chi2)
+            p_values.append(p_value)
+    return chi2_values, multipletests(p_values, method='fdr_bh')[1]
+
+
+def main(n_copies: int = 10) -> None:
+    groups = {}
+    for dataset in ('all_nmd_undergo_final', 'all_nmd_escape_final'):
+        variants = pd.read_csv(os.path.join(data_dir, f'{dataset}.csv'), usecols=['Codon_position', 'Context', 'Significance'])
+        variants = variants[variants['Context'].notna()]
+        for codon_position in ('1', '2', '3'):
+            group = variants[variants['Codon_position'].astype(str) == codon_position]
+            groups[f'{dataset}_{codon_position}'] = (
+                list(group.loc[group['Significance'] == 'benign', 'Context']) * n_copies,
+                list(group.loc[group['Significance'] == 'pathogenic', 'Context']) * n_copies,
+            )
+    n_contexts = sum(len(ben) + len(pat) for ben, pat in groups.values())
+    print(f'{len(groups)} groups, {n_contexts} contexts')
+
+    start = time.perf_counter()
+    expected = {name: calculate_chi2_loops(*contexts) for name, contexts in groups.items()}
+    loops = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = calculate_chi2_batch(groups)
+    batched = time.perf_counter() - start
+
+    for name, (chi2_values, _) in expected.items():
+        result = batch[batch['Group'] == name]
+        np.testing.assert_allclose(result['Chi2'], chi2_values, rtol=1e-9)
+    print(f'nested loops + chi2_contingency {loops:8.2f} s')
+    print(f'calculate_chi2_batch            {batched:8.3f} s ({loops / batched:.0f}x)')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,109 @@
+"""
+Building the max median tissue expression table from a GTEx-like transcript TPM table: the steps of
+`expression_data_collecting.ipynb` (whole table in pandas, samples renamed to tissues, one `pd.concat` per tissue
+with several samples) against the streaming `max_median_expression` in the calling process and with `processes`
+worker processes. Every case runs in a separate process to measure its peak memory, and the tables are checked to
+be identical (up to float32 rounding of the medians).
+
+Usage:
+    python benchmarks/bench_expression_data.py [n_transcripts] [n_samples] [processes]
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'transcript_conservativity', 'code'))
+
+from expression_data import max_median_block, max_median_expression, tissue_groups  # noqa: E402
+from synthetic import make_gtex_tables  # noqa: E402
+
+
+def notebook_max_median(gtex_file: str, annotation_file: str) -> pd.DataFrame:
+    """
+    Max median expression as computed in expression_data_collecting.ipynb.
+    """
+    expression_full_annot = pd.read_csv(gtex_file, delimiter='\t')
+    name_annot = pd.read_csv(annotation_file, delimiter=',')
+    new_column_names = dict(zip(name_annot['SAMPID'], name_annot['SMTS']))
+    for old_name, new_name in new_column_names.items():
+        if old_name in expression_full_annot.columns:
+            expression_full_annot.rename(columns={old_name: new_name}, inplace=True)
+    for col_name in set(expression_full_annot.columns):
+        if list(expression_full_annot.columns).count(col_name) > 1:
+            data = np.median(expression_full_annot[col_name].values, axis=1).reshape(len(expression_full_annot), 1)
+            new_df = pd.DataFrame(data, columns=[col_name])
+            expression_full_annot = pd.concat([expression_full_annot.drop(col_name, axis=1), new_df], axis=1)
+    max_median = expression_full_annot.iloc[:, 2:].max(axis=1)
+    max_median_expr = expression_full_annot.iloc[:, :2].copy()
+    max_median_expr['Max_median_expression'] = max_median
+    max_median_expr.columns = ['ID_transcript', 'ID_gene', 'Max_median_expression']
+    return max_median_expr
+
+
+def check_missing_tpms(n_transcripts: int = 2000, n_samples: int = 200) -> None:
+    """
+    `max_median_block` skips missing TPMs as pandas medians do, and a tissue without TPMs as `DataFrame.max` does.
+    """
+    rng = np.random.default_rng(0)
+    tissues = rng.choice(['Tissue 0', 'Tissue 1', 'Tissue 2', 'Tissue 3'], n_samples)
+    values = rng.exponential(5, (n_transcripts, n_samples)).astype(np.float32)
+    values[rng.random(values.shape) < 0.1] = np.nan
+    values[:10][:, tissues == 'Tissue 0'] = np.nan
+    values[10] = np.nan
+    samples = [f'S{idx}' for idx in range(n_samples)]
+    _, order, bounds = tissue_groups(samples, dict(zip(samples, tissues)))
+    expected = pd.DataFrame(values, columns=tissues).T.groupby(level=0).median().max()
+    assert np.allclose(max_median_block(values, order, bounds), expected, rtol=1e-6, equal_nan=True)
+
+
+def run_case(case: str, gtex_file: str, annotation_file: str, output_file: str) -> None:
+    start = time.perf_counter()
+    if case == 'notebook':
+        notebook_max_median(gtex_file, annotation_file).to_csv(output_file, sep='\t', index=False)
+    else:
+        max_median_expression(gtex_file, annotation_file, output_file, processes=int(case))
+    seconds = time.perf_counter() - start
+    print(json.dumps({'seconds': seconds, 'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+
+def main(n_transcripts: int = 20000, n_samples: int = 2000, processes: int = 2) -> None:
+    check_missing_tpms()
+    with tempfile.TemporaryDirectory() as tmp:
+        gtex_file, annotation_file = make_gtex_tables(tmp, n_transcripts, n_samples)
+        size_mb = os.path.getsize(gtex_file) / 2 ** 20
+
+        cases = [('notebook', 'notebook'), ('max_median_expression', '1'),
+                 (f'max_median_expression, {processes} processes', str(processes))]
+        results, stats = [], []
+        for name, case in cases:
+            output_file = os.path.join(tmp, f'{case}.tsv')
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', case, gtex_file,
+                                     annotation_file, output_file], capture_output=True, text=True, check=True)
+            stats.append(json.loads(result.stdout.strip().splitlines()[-1]))
+            results.append(pd.read_csv(output_file, sep='\t'))
+
+        expected = results[0]
+        for table in results[1:]:
+            assert table[['ID_transcript', 'ID_gene']].equals(expected[['ID_transcript', 'ID_gene']])
+            assert np.allclose(table['Max_median_expression'], expected['Max_median_expression'], rtol=1e-6)
+
+        print(f'{n_transcripts} transcripts x {n_samples} samples, {size_mb:.0f} MB table, {os.cpu_count()} CPUs')
+        baseline = stats[0]
+        for (name, _), case_stats in zip(cases, stats):
+            print(f'{name:<36} {case_stats["seconds"]:7.2f} s ({baseline["seconds"] / case_stats["seconds"]:.1f}x) '
+                  f'{case_stats["max_rss_mb"]:9.1f} MB max RSS '
+                  f'({baseline["max_rss_mb"] / case_stats["max_rss_mb"]:.1f}x less)')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--case']:
+        run_case(*sys.argv[2:6])
+    else:
+        main(*map(int, sys.argv[1:]))
@@ -0,0 +1,82 @@
+"""
+Sequence contexts and strand inference for the variants of all_nmd_undergo_final.csv against a synthetic gencode
+transcript FASTA: per-row pyfaidx access (`get_context` with `iterrows` and `check_ref` with `apply`, previous
+behaviour) against batched gathers from a `TranscriptStore`. Both results are checked to be identical.
+
+Usage:
+    python benchmarks/bench_get_context.py [n_copies]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'context_analysis'))
+
+import pandas as pd  # noqa: E402
+from pyfaidx import Fasta  # noqa: E402
+
+from analysis_functions import check_ref, get_context, get_strand  # noqa: E402
+from sequence_store import TranscriptStore  # noqa: E402
+from synthetic import make_transcript_fasta  # noqa: E402
+
+variants_csv = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', 'context_analysis', 'data', 'all_nmd_undergo_final.csv')
+
+
+def get_context_iterrows(df, transcript_fasta, left_len, right_len):
+    # Previous implementation of get_context
+    contexts = []
+    for index, row in df.iterrows():
+        transcript_id = row['Canonical_transcript']
+        position_of_interest = row['cDNA_position']
+        if transcript_id in transcript_fasta:
+            transcript_length = len(transcript_fasta[transcript_id])
+            if left_len < position_of_interest < transcript_length - right_len:
+                sequence_of_interest = str(transcript_fasta[transcript_id][position_of_interest - left_len: position_of_interest + right_len])
+            else:
+                sequence_of_interest = None
+        else:
+            sequence_of_interest = None
+        contexts.append(sequence_of_interest)
+    df['Context'] = contexts
+
+
+def main(n_copies: int = 1) -> None:
+    variants = pd.read_csv(variants_csv, usecols=['REF', 'Canonical_transcript', 'cDNA_position'])
+    variants = pd.concat([variants] * n_copies, ignore_index=True)
+    # Transcripts end shortly after their last variant, so some contexts do not fit; every 50th transcript is missing
+    transcript_lengths = variants.groupby('Canonical_transcript')['cDNA_position'].max() + 20
+    transcript_lengths = transcript_lengths.drop(transcript_lengths.index[::50])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fasta_file = make_transcript_fasta(os.path.join(tmp, 'transcripts.fa'), transcript_lengths.to_dict())
+        transcript_fasta = Fasta(fasta_file, key_function=lambda x: x.split('.')[0])
+        print(f'{len(variants)} variants, {len(transcript_lengths)} transcripts')
+
+        old = variants.copy()
+        start = time.perf_counter()
+        get_context_iterrows(old, transcript_fasta, 13, 12)
+        old = old[old['Context'].notna()].copy()
+        old['Strand'] = old.apply(check_ref, axis=1, transcript_fasta=transcript_fasta)
+        per_row = time.perf_counter() - start
+
+        start = time.perf_counter()
+        store = TranscriptStore.from_fasta(fasta_file, key_function=lambda x: x.split('.')[0])
+        load = time.perf_counter() - start
+
+        new = variants.copy()
+        start = time.perf_counter()
+        get_context(new, store, 13, 12)
+        new = new[new['Context'].notna()].copy()
+        new['Strand'] = get_strand(new, store)
+        batched = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(new, old)
+    print(f'pyfaidx per row          {per_row:8.2f} s')
+    print(f'TranscriptStore (load)   {load:8.2f} s')
+    print(f'TranscriptStore batched  {batched:8.2f} s ({per_row / batched:.0f}x)')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
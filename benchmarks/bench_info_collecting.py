@@ -0,0 +1,89 @@
+"""
+Peak memory (max RSS) and time of building the per-transcript AC table from several chromosome tables:
+`info_collecting` + `info_filtering` (the whole genome in memory) against the out-of-core `collect_transcripts`.
+Input files are generated and every case runs in a separate process, so that peak RSS values are independent.
+
+Usage:
+    python benchmarks/bench_info_collecting.py [n_files] [n_rows_per_file]
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'transcript_conservativity', 'code'))
+
+import pandas as pd  # noqa: E402
+
+from data_processing_functions import (  # noqa: E402
+    aggregate_transcripts, collect_transcripts, filter_lof_variants, info_collecting, population_ac
+)
+from synthetic import make_variant_table  # noqa: E402
+
+cases = ('info_collecting', 'collect_transcripts')
+
+
+def run_case(case: str, files: list, output_file: str) -> None:
+    start = time.perf_counter()
+    if case == 'info_collecting':
+        result = aggregate_transcripts(filter_lof_variants(info_collecting(files)))
+    else:
+        result = collect_transcripts(files)
+    result.to_pickle(output_file)
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'seconds': time.perf_counter() - start, 'max_rss_mb': max_rss_mb}))
+
+
+def write_files(files: list, n_rows_per_file: int) -> None:
+    for idx, file in enumerate(files):
+        table = make_variant_table(n_rows_per_file, seed=idx)
+        # Columns of the `vcf_parsing` output that are not used by the aggregation
+        for column in ('AN', 'AF', 'EXON', 'INTRON', 'LoF_info'):
+            table[column] = '.'
+        # As expected by `info_collecting`, only the first file has a header
+        table.to_csv(file, sep='\t', index=False, header=idx == 0)
+
+
+def check_missing_counts(tmp: str, n_rows: int = 20000) -> None:
+    """
+    `collect_transcripts` reads the '.' that `vcf_parsing` writes for missing counts as NaN.
+    """
+    table = make_variant_table(n_rows, seed=1000)
+    counts = ['AC'] + population_ac
+    table[counts] = table[counts].astype(object)
+    table.loc[::5, ['AC', 'AC_afr']] = '.'
+    file = os.path.join(tmp, 'missing_counts.tsv')
+    table.to_csv(file, sep='\t', index=False)
+    expected = aggregate_transcripts(filter_lof_variants(
+        pd.read_csv(file, sep='\t', na_values={column: ['.'] for column in counts})))
+    pd.testing.assert_frame_equal(collect_transcripts([file], chunksize=n_rows // 4), expected, check_dtype=False)
+
+
+def main(n_files: int = 4, n_rows_per_file: int = 1_000_000) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        check_missing_counts(tmp)
+        files = [os.path.join(tmp, f'chr{idx + 1}.tsv') for idx in range(n_files)]
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--generate', str(n_rows_per_file)] + files,
+                       check=True)
+
+        results = []
+        for case in cases:
+            output_file = os.path.join(tmp, f'{case}.pkl')
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', case, output_file] + files,
+                                    capture_output=True, text=True, check=True)
+            stats = json.loads(result.stdout.strip().splitlines()[-1])
+            results.append(pd.read_pickle(output_file))
+            print(f'{case:<22} {stats["seconds"]:8.1f} s {stats["max_rss_mb"]:10.1f} MB max RSS')
+        pd.testing.assert_frame_equal(results[1], results[0], check_dtype=False)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--generate']:
+        write_files(sys.argv[3:], int(sys.argv[2]))
+    elif sys.argv[1:2] == ['--case']:
+        run_case(sys.argv[2], sys.argv[4:], sys.argv[3])
+    else:
+        main(*map(int, sys.argv[1:]))
@@ -0,0 +1,62 @@
+"""
+Microbenchmarks of INFO decoding: the old per-key `startswith` scans against `InfoDecoder`.
+
+Usage:
+    python benchmarks/bench_info_fields.py [n_repeats]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'context_analysis'))
+
+from info_fields import InfoDecoder  # noqa: E402
+from parse_vcf_canonical import get_population_data, population_names, vcf_columns_dict  # noqa: E402
+from parse_vcf_clinvar import clinvar_info_names  # noqa: E402
+from synthetic import example_vcf, read_template  # noqa: E402
+
+
+def old_population_data(line):
+    # Previous implementation of get_population_data
+    frequency = {}
+    for element in line[vcf_columns_dict['INFO']].split(';'):
+        for pop in population_names:
+            if element.startswith(f'{pop}='):
+                frequency[pop] = element.split('=')[-1]
+    return frequency
+
+
+def old_clinvar_info(info, clinvar_info_dict):
+    # Previous INFO loop of parse_vcf_line
+    for element in info.split(';'):
+        for category in clinvar_info_names:
+            if element.startswith(f'{category}='):
+                clinvar_info_dict[category] = element.split('=')[-1]
+    return clinvar_info_dict
+
+
+def main(n_repeats: int = 5) -> None:
+    header, records = read_template(example_vcf)
+    decoder = InfoDecoder.from_header(header, population_names)
+    clinvar_decoder = InfoDecoder(dict.fromkeys(clinvar_info_names, 'String'))
+    # gnomAD INFO lines are much wider than ClinVar ones, so they are the worst case for both decoders
+    infos = [record[vcf_columns_dict['INFO']] for record in records]
+
+    for record in records:
+        assert old_population_data(record) == get_population_data(record, decoder)
+
+    cases = {
+        'get_population_data (old)': lambda: [old_population_data(record) for record in records],
+        'get_population_data (InfoDecoder)': lambda: [get_population_data(record, decoder) for record in records],
+        'InfoDecoder typed': lambda: [decoder.decode(info) for info in infos],
+        'InfoDecoder typed, 1 lazy key': lambda: [decoder.decode(info, keys=('AC',)) for info in infos],
+        'ClinVar INFO loop (old)': lambda: [old_clinvar_info(info, {}) for info in infos],
+        'ClinVar InfoDecoder': lambda: [clinvar_decoder.decode(info, typed=False) for info in infos],
+    }
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=1, repeat=n_repeats))
+        print(f'{name:<36} {seconds / len(records) * 1e6:10.1f} us/record')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,111 @@
+"""
+Stages of `info_filtering`, each against its previous implementation (results are checked to be identical):
+per-transcript aggregation (per-column groupby loops against `aggregate_transcripts`) and LOEUF/exon/expression
+lookup (a `str.contains` scan per transcript against the ID index). The old lookup is timed on `n_lookup` transcripts
+and extrapolated to all of them.
+
+Usage:
+    python benchmarks/bench_info_filtering.py [n_rows] [n_lookup]
+"""
+import os
+import sys
+import time
+import warnings
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'transcript_conservativity', 'code'))
+
+import numpy as np  # noqa: E402
+
+from data_processing_functions import aggregate_transcripts, attach_by_id, build_id_index, population_ac  # noqa: E402
+from synthetic import make_lookup_tables, make_variant_table  # noqa: E402
+
+
+def aggregate_transcripts_loops(gene_data):
+    # Previous implementation from info_filtering
+    transcript_list, sum_ac, gene_names, gene_id, alt_sum = [], [], [], [], []
+    sum_population_ac = [[] for _ in population_ac]
+    for key, group in gene_data.groupby('Feature')['AC']:
+        transcript_list.append(key)
+        sum_ac.append(group.sum())
+    for idx, el in enumerate(population_ac):
+        for key, group in gene_data.groupby('Feature')[el]:
+            sum_population_ac[idx].append(sum([group.sum()]))
+    for key, group in gene_data.groupby('Feature')['SYMBOL']:
+        gene_names.extend(group.unique())
+    for key, group in gene_data.groupby('Feature')['Gene']:
+        gene_id.extend(group.unique())
+    for key, group in gene_data.groupby('Feature')['ALT']:
+        alt_sum.append(len(group.sum()))
+    result = gene_data.loc[gene_data.groupby('Feature')['AC'].idxmax(), ['Feature', 'Consequence', 'AC']]
+    columns = {'Transcript_ID': transcript_list, 'AC': sum_ac}
+    columns.update(dict(zip(population_ac, sum_population_ac)))
+    columns.update({'Gene_name': gene_names, 'Gene_id': gene_id, 'Variant': alt_sum,
+                    'Max_AC_in_transcript': list(result['AC']), 'Consequence_of_max_AC': list(result['Consequence'])})
+    return pd.DataFrame(columns)
+
+
+def lookup_contains(transcripts, constraint_transcript, expression_transcript):
+    # Previous implementation from info_filtering
+    loeuf_values, exon_numbers, expression = [], [], []
+    for transcript in transcripts:
+        loeuf = list(constraint_transcript[constraint_transcript['transcript'].str.contains(transcript)]['lof.oe_ci.upper'])
+        exon = list(constraint_transcript[constraint_transcript['transcript'].str.contains(transcript)]['num_coding_exons'])
+        expression_level = list(expression_transcript[expression_transcript['ID_transcript'].str.contains(transcript)]['Max_median_expression'])
+        loeuf_values.append(loeuf[0] if loeuf != [] else np.nan)
+        exon_numbers.append(exon[0] if exon != [] else np.nan)
+        expression.append(expression_level[0] if expression_level != [] else np.nan)
+    return pd.DataFrame({'Transcript_ID': transcripts, 'LOEUF_transcript': loeuf_values,
+                         'Exon_number': exon_numbers, 'Max_median_expression': expression})
+
+
+def lookup_index(transcripts, constraint_transcript, expression_transcript):
+    result = pd.DataFrame({'Transcript_ID': transcripts})
+    constraint_index = build_id_index(constraint_transcript, 'transcript', ['lof.oe_ci.upper', 'num_coding_exons'])
+    expression_index = build_id_index(expression_transcript, 'ID_transcript', ['Max_median_expression'])
+    result, _ = attach_by_id(result, 'Transcript_ID', constraint_index,
+                             {'lof.oe_ci.upper': 'LOEUF_transcript', 'num_coding_exons': 'Exon_number'})
+    result, _ = attach_by_id(result, 'Transcript_ID', expression_index,
+                                 {'Max_median_expression': 'Max_median_expression'})
+    return result
+
+
+def main(n_rows: int = 2_000_000, n_lookup: int = 500) -> None:
+    table = make_variant_table(n_rows)
+    gene_data = table[(table['Feature_Type'] == 'Transcript') & (table['BIOTYPE'] == 'protein_coding') &
+                      table['Consequence'].isin(['stop_gained', 'frameshift_variant',
+                                                 'splice_donor_variant', 'splice_acceptor_variant'])]
+    print(f'{n_rows} rows, {len(gene_data)} after filtering, {gene_data["Feature"].nunique()} transcripts')
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        start = time.perf_counter()
+        expected = aggregate_transcripts_loops(gene_data)
+        loops = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = aggregate_transcripts(gene_data)
+    single_pass = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(result, expected)
+    print(f'groupby loops       {loops:8.2f} s')
+    print(f'aggregate_transcripts {single_pass:6.2f} s ({loops / single_pass:.0f}x)')
+
+    constraint, expression = make_lookup_tables()
+    transcripts = list(result['Transcript_ID'])
+    start = time.perf_counter()
+    expected = lookup_contains(transcripts[:n_lookup], constraint, expression)
+    contains = (time.perf_counter() - start) * len(transcripts) / min(n_lookup, len(transcripts))
+
+    start = time.perf_counter()
+    looked_up = lookup_index(transcripts, constraint, expression)
+    indexed = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(looked_up.iloc[:n_lookup], expected, check_dtype=False)
+    print(f'str.contains lookup {contains:8.2f} s (extrapolated from {min(n_lookup, len(transcripts))} transcripts)')
+    print(f'ID index lookup     {indexed:8.2f} s ({contains / indexed:.0f}x)')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,63 @@
+"""
+Rows/sec of the old per-row `write_to_output` and of the buffered `TableWriter` used by `parse_vcf`.
+Rows are parsed once from a synthetically scaled chr22 example and then written by each output sink.
+
+Usage:
+    python benchmarks/bench_output_writer.py [n_records] [n_rows]
+"""
+import csv
+import gzip
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'context_analysis'))
+
+from output_writers import TableWriter, get_output_file  # noqa: E402
+from parse_vcf_canonical import headers, parse_line, vcf_columns_dict  # noqa: E402
+from synthetic import scale_vcf  # noqa: E402
+
+
+def write_to_output(output_file, data):
+    # Previous implementation: reopen the file for every row
+    with open(output_file, 'a', newline='', encoding='utf-8') as output_file:
+        tsv_writer = csv.writer(output_file, delimiter='\t')
+        tsv_writer.writerow(data)
+
+
+def main(n_records: int = 2000, n_rows: int = 1000000) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        vcf_file = scale_vcf(os.path.join(tmp, 'synthetic_chr22.vcf.gz'), n_records)
+
+        # Parsed rows are reused, so that only the output sinks are compared
+        with gzip.open(vcf_file, 'rt') as input_file:
+            rows = [parse_line(line) for line in csv.reader(input_file, delimiter='\t')
+                    if line[vcf_columns_dict['CHROM']].startswith('chr') and line[vcf_columns_dict['FILTER']] == 'PASS']
+        rows = [rows[i % len(rows)] for i in range(n_rows)]
+
+        results = {}
+        start = time.perf_counter()
+        per_row_file = os.path.join(tmp, 'per_row.tsv')
+        with open(per_row_file, 'w', newline='', encoding='utf-8') as table_file:
+            csv.writer(table_file, delimiter='\t').writerow(headers)
+        for row in rows:
+            write_to_output(per_row_file, row)
+        results['per-row write_to_output'] = time.perf_counter() - start
+
+        for compression in (None, 'gzip', 'bgzip'):
+            output_file = get_output_file(vcf_file, tmp, f'buffered_{compression}', compression)
+            start = time.perf_counter()
+            with TableWriter(output_file, headers, compression=compression) as table_writer:
+                table_writer.write_rows(rows)
+            results[f'TableWriter ({compression or "plain"})'] = time.perf_counter() - start
+
+        with open(per_row_file, 'rb') as old, open(get_output_file(vcf_file, tmp, 'buffered_None'), 'rb') as new:
+            assert old.read() == new.read(), 'Buffered output differs from per-row output'
+
+    for name, seconds in results.items():
+        print(f'{name:<28} {seconds:8.2f} s {n_rows / seconds:12.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,45 @@
+"""
+`parse_vcf` through the on-disk `ParseCache`: time of the first run (miss: fingerprint, parse, store as Parquet)
+against later runs (hit: fingerprint and read the cached columns) on a synthetic VCF file.
+
+Usage:
+    python benchmarks/bench_parse_cache.py [n_records]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'context_analysis'))
+
+from parse_cache import ParseCache, cached_parse_vcf  # noqa: E402
+from synthetic import scale_vcf  # noqa: E402
+
+
+def main(n_records: int = 20000) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        vcf_file = scale_vcf(os.path.join(tmp, 'synthetic_chr22.vcf.gz'), n_records)
+        cache = ParseCache(os.path.join(tmp, 'cache'), verbose=False)
+
+        start = time.perf_counter()
+        parsed = cached_parse_vcf(vcf_file, cache)
+        miss = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cached = cached_parse_vcf(vcf_file, cache)
+        hit = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cached_parse_vcf(vcf_file, cache, columns=['Chr', 'Position', 'AC', 'Consequence'])
+        hit_columns = time.perf_counter() - start
+
+        assert parsed.equals(cached)
+        print(f'{n_records} records, {len(parsed)} rows')
+        print(f'miss (parse)          {miss:8.2f} s')
+        print(f'hit                   {hit:8.3f} s ({miss / hit:.0f}x)')
+        print(f'hit, 4 columns        {hit_columns:8.3f} s ({miss / hit_columns:.0f}x)')
+        cache.report()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
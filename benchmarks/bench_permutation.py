@@ -0,0 +1,73 @@
+"""
+Gene-stratified permutation test of the codon position 1 contexts of all_nmd_undergo_final.csv: a loop with one
+label shuffle, Python counting and `chi2_contingency` per permutation and position (timed on `n_naive` permutations
+and extrapolated) against the vectorized `permutation_chi2_test` in one and in several processes.
+
+Usage:
+    python benchmarks/bench_permutation.py [n_permutations] [processes] [n_naive]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'context_analysis'))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from scipy.stats import chi2_contingency  # noqa: E402
+
+from context_statistics import permutation_chi2_test  # noqa: E402
+
+variants_csv = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', 'context_analysis', 'data', 'all_nmd_undergo_final.csv')
+
+
+def naive_permutations(contexts, labels, genes, n_permutations, seed=42):
+    rng = np.random.default_rng(seed)
+    for _ in range(n_permutations):
+        permuted = labels.copy()
+        for gene in np.unique(genes):
+            in_gene = np.flatnonzero(genes == gene)
+            permuted[in_gene] = rng.permutation(labels[in_gene])
+        for position in range(len(contexts[0])):
+            table = np.zeros((2, 4))
+            for context, label in zip(contexts, permuted):
+                if context[position] in 'ACGT':
+                    table[int(label), 'ACGT'.index(context[position])] += 1
+            try:
+                chi2_contingency(table[:, table.sum(axis=0) > 0])
+            except ValueError:
+                pass
+
+
+def main(n_permutations: int = 10000, processes: int = 4, n_naive: int = 3) -> None:
+    variants = pd.read_csv(variants_csv, usecols=['Gene_symbol', 'Codon_position', 'Context', 'Significance'])
+    variants = variants[variants['Context'].notna() & (variants['Codon_position'].astype(str) == '1')]
+    ben = variants[variants['Significance'] == 'benign']
+    pat = variants[variants['Significance'] == 'pathogenic']
+    print(f'{len(ben)} benign and {len(pat)} pathogenic contexts, {variants["Gene_symbol"].nunique()} genes')
+
+    contexts = list(pat['Context']) + list(ben['Context'])
+    labels = np.array([True] * len(pat) + [False] * len(ben))
+    genes = np.concatenate([pat['Gene_symbol'].to_numpy(), ben['Gene_symbol'].to_numpy()])
+    start = time.perf_counter()
+    naive_permutations(contexts, labels, genes, n_naive)
+    naive = (time.perf_counter() - start) * n_permutations / n_naive
+
+    args = (list(ben['Context']), list(pat['Context']), list(ben['Gene_symbol']), list(pat['Gene_symbol']))
+    start = time.perf_counter()
+    serial = permutation_chi2_test(*args, n_permutations=n_permutations, processes=1)
+    one_process = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parallel = permutation_chi2_test(*args, n_permutations=n_permutations, processes=processes)
+    many_processes = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(serial, parallel)
+    print(f'naive loop (extrapolated)  {naive:10.1f} s')
+    print(f'vectorized, 1 process      {one_process:10.1f} s ({naive / one_process:.0f}x)')
+    print(f'vectorized, {processes} processes    {many_processes:10.1f} s ({naive / many_processes:.0f}x)')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,86 @@
+"""
+Per-stage profiles of the three parsers (`parse_vcf`, `parse_clinvar_vcf` and `vcf_parsing`) on synthetic inputs
+with `RunProfile`, and the overhead of the instrumentation: every parser is also run without a profile, and the
+outputs are checked to be identical. JSON reports are written to `report_dir` if it is given.
+
+Usage:
+    python benchmarks/bench_run_profile.py [n_records] [report_dir]
+"""
+import contextlib
+import filecmp
+import gzip
+import io
+import os
+import sys
+import tempfile
+import time
+
+import pysam
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchmarks_dir, '..', 'context_analysis'))
+sys.path.insert(0, os.path.join(benchmarks_dir, '..', 'transcript_conservativity', 'code'))
+
+from parse_vcf_canonical import parse_vcf  # noqa: E402
+from parse_vcf_clinvar import parse_clinvar_vcf  # noqa: E402
+from run_profile import RunProfile  # noqa: E402
+from synthetic import make_clinvar_vcf, scale_vcf  # noqa: E402
+from vcf_parser import vcf_parsing  # noqa: E402
+
+
+def to_bgzf(gzip_file: str, bgzf_file: str) -> str:
+    with gzip.open(gzip_file, 'rb') as input_file, pysam.BGZFile(bgzf_file, 'wb') as output_file:
+        for chunk in iter(lambda: input_file.read(1 << 22), b''):
+            output_file.write(chunk)
+    return bgzf_file
+
+
+def run_parse_vcf(vcf_file: str, output_dir: str, profile=None) -> str:
+    parse_vcf(vcf_file, output_dir, 'canonical.tsv', profile=profile)
+    return os.path.join(output_dir, 'canonical.tsv')
+
+
+def run_parse_clinvar_vcf(vcf_file: str, output_dir: str, profile=None) -> str:
+    parse_clinvar_vcf(vcf_file, output_dir, 'clinvar.tsv', profile=profile)
+    return os.path.join(output_dir, 'clinvar.tsv')
+
+
+def run_vcf_parsing(vcf_file: str, output_dir: str, profile=None) -> str:
+    with contextlib.redirect_stdout(io.StringIO()):
+        vcf_parsing(vcf_file, output_dir=output_dir, profile=profile)
+    return os.path.join(output_dir, os.path.basename(vcf_file).split('.')[0] + '.tsv')
+
+
+def main(n_records: int = 100000, report_dir: str = '') -> None:
+    n_records = int(n_records)
+    with tempfile.TemporaryDirectory() as tmp:
+        gnomad_file = to_bgzf(scale_vcf(os.path.join(tmp, 'gnomad.vcf.gz'), n_records),
+                              os.path.join(tmp, 'gnomad.bgz'))
+        clinvar_file = make_clinvar_vcf(os.path.join(tmp, 'clinvar.vcf.gz'), n_records)
+        parsers = [('parse_vcf', run_parse_vcf, gnomad_file),
+                   ('parse_clinvar_vcf', run_parse_clinvar_vcf, clinvar_file),
+                   ('vcf_parsing', run_vcf_parsing, gnomad_file)]
+
+        print(f'{n_records} records per input, {os.cpu_count()} CPUs')
+        for name, run, vcf_file in parsers:
+            plain_dir, profiled_dir = os.path.join(tmp, f'{name}_plain'), os.path.join(tmp, f'{name}_profiled')
+            os.makedirs(plain_dir)
+            os.makedirs(profiled_dir)
+            start = time.perf_counter()
+            plain_output = run(vcf_file, plain_dir)
+            plain_seconds = time.perf_counter() - start
+
+            report_file = os.path.join(report_dir, f'{name}.json') if report_dir else None
+            profile = RunProfile(report_file, progress_interval=None, rss_interval=0.5)
+            start = time.perf_counter()
+            profiled_output = run(vcf_file, profiled_dir, profile)
+            profiled_seconds = time.perf_counter() - start
+            assert filecmp.cmp(plain_output, profiled_output, shallow=False)
+
+            print('\n'.join(profile.summary()))
+            print(f'  without profile {plain_seconds:.2f} s, with profile {profiled_seconds:.2f} s '
+                  f'({(profiled_seconds / plain_seconds - 1) * 100:+.1f}% overhead)\n')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
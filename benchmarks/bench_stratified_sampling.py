@@ -0,0 +1,86 @@
+"""
+Per-gene matched sampling of pathogenic and benign variants: the loop of the NMD notebooks
+(`df[df['Gene_symbol'] == gene].sample(n=min_count)` for every gene of both sets) against `matched_sample`,
+and `matched_sample_indices` drawing many replicates at once. Per-gene counts of every sample are checked to be
+the matched quotas, and sampling frequencies of the rows are checked to be uniform within genes.
+
+Usage:
+    python benchmarks/bench_stratified_sampling.py [n_pathogenic] [n_benign] [n_genes] [n_replicates]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'context_analysis'))
+
+from stratified_sampling import matched_quotas, matched_sample, matched_sample_indices  # noqa: E402
+
+
+def notebook_sampling(pat_df: pd.DataFrame, ben_df: pd.DataFrame):
+    """
+    Matched sampling as in get_context_nmd_undergo.ipynb.
+    """
+    common_genes = set(pat_df['Gene_symbol']) & set(ben_df['Gene_symbol'])
+    ben_df = ben_df[ben_df['Gene_symbol'].isin(common_genes)]
+    pat_df = pat_df[pat_df['Gene_symbol'].isin(common_genes)]
+    min_counts = pd.concat([pat_df['Gene_symbol'].value_counts(), ben_df['Gene_symbol'].value_counts()],
+                           axis=1).min(axis=1)
+    pat_final = pd.concat([pat_df[pat_df['Gene_symbol'] == gene].sample(n=min_count, random_state=42)
+                           for gene, min_count in min_counts.items()])
+    ben_final = pd.concat([ben_df[ben_df['Gene_symbol'] == gene].sample(n=min_count, random_state=42)
+                           for gene, min_count in min_counts.items()])
+    return pat_final, ben_final
+
+
+def make_variants(n_rows: int, n_genes: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    # Skewed gene sizes, as for real genes
+    genes = np.minimum(rng.zipf(1.3, n_rows), n_genes) - 1
+    return pd.DataFrame({'Gene_symbol': pd.Series(genes).map('GENE{}'.format),
+                         'Context': rng.choice(['ACGTACGTACGTACGTACGTACGTA', 'TTGCATTGCATTGCATTGCATTGCA'], n_rows)})
+
+
+def main(n_pathogenic: int = 20000, n_benign: int = 200000, n_genes: int = 5000, n_replicates: int = 1000) -> None:
+    pat_df = make_variants(n_pathogenic, n_genes, 0)
+    ben_df = make_variants(n_benign, n_genes, 1)
+    quotas = matched_quotas(pat_df['Gene_symbol'], ben_df['Gene_symbol'])
+
+    start = time.perf_counter()
+    pat_loop, ben_loop = notebook_sampling(pat_df, ben_df)
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pat_sample, ben_sample = matched_sample(pat_df, ben_df)
+    vectorized_time = time.perf_counter() - start
+
+    for loop, sample in ((pat_loop, pat_sample), (ben_loop, ben_sample)):
+        assert loop['Gene_symbol'].value_counts().sort_index().equals(sample['Gene_symbol'].value_counts().sort_index())
+        assert sample.index.is_unique
+
+    start = time.perf_counter()
+    pat_indices, ben_indices = matched_sample_indices(pat_df, ben_df, n_replicates=n_replicates)
+    replicates_time = time.perf_counter() - start
+
+    # Every replicate keeps the quotas; rows of a sampled gene are drawn with equal frequencies
+    expected_counts = quotas.sort_index()
+    for indices in pat_indices[:10]:
+        assert pat_df['Gene_symbol'].iloc[indices].value_counts().sort_index().equals(expected_counts)
+    frequencies = np.bincount(ben_indices.ravel(), minlength=len(ben_df)) / n_replicates
+    genes = ben_df['Gene_symbol']
+    expected = (genes.map(quotas) / genes.map(genes.value_counts())).fillna(0).to_numpy()
+    assert np.abs(frequencies - expected).max() < 5 / np.sqrt(n_replicates)
+
+    print(f'{n_pathogenic} pathogenic, {n_benign} benign variants, {len(quotas)} common genes, '
+          f'{quotas.sum()} variants per set')
+    print(f'notebook loop                  {loop_time:8.2f} s')
+    print(f'matched_sample                 {vectorized_time:8.3f} s ({loop_time / vectorized_time:.0f}x)')
+    print(f'{n_replicates} replicates at once      {replicates_time:8.2f} s '
+          f'({replicates_time / n_replicates * 1000:.2f} ms per replicate, '
+          f'{loop_time * n_replicates / replicates_time:.0f}x the loop)')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
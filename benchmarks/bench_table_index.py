@@ -0,0 +1,80 @@
+"""
+Per-gene access to a parsed variant table: loading the whole chromosome TSV and filtering it in pandas,
+as `gene_examples_analysis.ipynb` does, against `IndexedTable` queries by gene symbol, transcript ID and region
+on the bgzipped table indexed with `index_parser_output`. Query results are checked to be identical.
+
+Usage:
+    python benchmarks/bench_table_index.py [n_rows] [n_queries]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'context_analysis'))
+
+from synthetic import make_variant_table  # noqa: E402
+from table_index import IndexedTable, index_parser_output  # noqa: E402
+
+
+def time_queries(query, keys) -> float:
+    """
+    Median time of a query over the keys, in milliseconds.
+    """
+    times = []
+    for key in keys:
+        start = time.perf_counter()
+        query(key)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) * 1000
+
+
+def main(n_rows: int = 1_000_000, n_queries: int = 50) -> None:
+    table = make_variant_table(n_rows, localized=True)
+    rng = np.random.default_rng(0)
+    genes = rng.choice(table['SYMBOL'].unique(), n_queries, replace=False)
+    transcripts = rng.choice(table['Feature'].unique(), n_queries, replace=False)
+    starts = rng.choice(table['POS'].to_numpy(), n_queries)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        table_file = os.path.join(tmp, 'chr1.tsv')
+        table.to_csv(table_file, sep='\t', index=False)
+
+        start = time.perf_counter()
+        table_file = index_parser_output(table_file, 'vcf_parsing')
+        index_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        full = pd.read_csv(table_file, sep='\t')
+        load_time = time.perf_counter() - start
+        filter_time = time_queries(lambda gene: full[full['SYMBOL'] == gene], genes)
+
+        with IndexedTable(table_file) as indexed:
+            for gene in genes[:10]:
+                expected = full[full['SYMBOL'] == gene].reset_index(drop=True)
+                pd.testing.assert_frame_equal(indexed.gene(gene), expected)
+            for transcript in transcripts[:10]:
+                expected = full[full['Feature'] == transcript].reset_index(drop=True)
+                pd.testing.assert_frame_equal(indexed.transcript(transcript), expected)
+            for position in starts[:10]:
+                expected = full[full['POS'].between(position, position + 100_000)].reset_index(drop=True)
+                pd.testing.assert_frame_equal(indexed.region('chr1', position, position + 100_000), expected)
+
+            gene_time = time_queries(indexed.gene, genes)
+            transcript_time = time_queries(indexed.transcript, transcripts)
+            region_time = time_queries(lambda position: indexed.region('chr1', position, position + 100_000), starts)
+
+        print(f'{n_rows} rows, {table["SYMBOL"].nunique()} genes, {n_queries} queries (median times)')
+        print(f'index (bgzip + tabix + keys)  {index_time:9.2f} s, once')
+        print(f'load TSV + filter gene        {load_time * 1000 + filter_time:9.1f} ms '
+              f'(load {load_time:.2f} s, filter {filter_time:.1f} ms)')
+        print(f'IndexedTable.gene             {gene_time:9.2f} ms')
+        print(f'IndexedTable.transcript       {transcript_time:9.2f} ms')
+        print(f'IndexedTable.region (100 kb)  {region_time:9.2f} ms')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
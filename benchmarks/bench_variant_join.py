@@ -0,0 +1,76 @@
+"""
+gnomAD ⇄ ClinVar joins of the NMD notebooks on genome-wide synthetic tables: `pd.concat` + `drop_duplicates`
+(removal of ClinVar variants from the benign set) and an outer `merge` on the CHROM/POS/REF/ALT string
+columns with the `_x`/`_y` columns filled by hand, compared to `join_variants` on 64-bit variant keys.
+Results are checked to be identical.
+
+Usage:
+    python benchmarks/bench_variant_join.py [n_gnomad] [n_clinvar]
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'context_analysis'))
+
+from synthetic import make_variant_sets  # noqa: E402
+from variant_keys import VariantKeyEncoder, join_variants, variant_columns  # noqa: E402
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def notebook_anti_join(gnomad, clinvar):
+    merged = pd.concat([gnomad, clinvar], ignore_index=True)
+    filtered = merged.drop_duplicates(subset=variant_columns, keep=False)
+    return filtered[~filtered['CLNSIG'].notna()].drop(columns=['CLNSIG'])
+
+
+def notebook_outer_join(gnomad, clinvar):
+    merged = gnomad.merge(clinvar, on=variant_columns, how='outer', indicator=True)
+    merged = merged.drop_duplicates(subset=variant_columns, keep='first', ignore_index=True)
+    for column in ('Consequence', 'cDNA_position'):
+        merged[f'{column}_x'] = merged[f'{column}_x'].fillna(merged[f'{column}_y'])
+    merged = merged.drop(columns=['Consequence_y', 'cDNA_position_y', '_merge'])
+    return merged.rename(columns={'Consequence_x': 'Consequence', 'cDNA_position_x': 'cDNA_position'})
+
+
+def sort_rows(df):
+    return df.sort_values(variant_columns).reset_index(drop=True)
+
+
+def main(n_gnomad: int = 2000000, n_clinvar: int = 200000) -> None:
+    gnomad, clinvar = make_variant_sets(n_gnomad, n_clinvar)
+    print(f'{len(gnomad)} gnomAD rows, {len(clinvar)} ClinVar rows')
+
+    expected, pandas_seconds = timed(notebook_anti_join, gnomad, clinvar)
+    result, keys_seconds = timed(join_variants, gnomad, clinvar, 'anti')
+    # concat makes AC float in the notebook version
+    pd.testing.assert_frame_equal(sort_rows(expected), sort_rows(result), check_dtype=False)
+    print(f'anti join   pandas {pandas_seconds:7.2f} s   join_variants {keys_seconds:7.2f} s '
+          f'({pandas_seconds / keys_seconds:.1f}x), {len(result)} rows')
+
+    expected, pandas_seconds = timed(notebook_outer_join, gnomad, clinvar)
+    result, keys_seconds = timed(join_variants, gnomad, clinvar, 'outer', coalesce=True)
+    pd.testing.assert_frame_equal(sort_rows(expected), sort_rows(result[expected.columns]), check_dtype=False)
+    print(f'outer join  pandas {pandas_seconds:7.2f} s   join_variants {keys_seconds:7.2f} s '
+          f'({pandas_seconds / keys_seconds:.1f}x), {len(result)} rows')
+
+    encoder = VariantKeyEncoder()
+    gnomad_keys, encode_seconds = timed(encoder.encode_frame, gnomad)
+    clinvar_keys = encoder.encode_frame(clinvar)
+    print(f'encoding {len(gnomad)} variants: {encode_seconds:.2f} s, '
+          f'{len(encoder.fallback_alleles)} allele pairs in the fallback table')
+    keys = {'encoder': encoder, 'left_keys': gnomad_keys, 'right_keys': clinvar_keys}
+    _, anti_seconds = timed(join_variants, gnomad, clinvar, 'anti', **keys)
+    _, outer_seconds = timed(join_variants, gnomad, clinvar, 'outer', coalesce=True, **keys)
+    print(f'with precomputed keys: anti join {anti_seconds:.2f} s, outer join {outer_seconds:.2f} s')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,85 @@
+"""
+Memory of a loaded `vcf_parsing` table: `pd.read_csv(..., low_memory=False)` as in the notebooks (object and
+float64/int64 columns) against `read_table` with the compact dtypes of `vcf_parsing_schema` (uint32 counts,
+float32 frequencies, categorical annotations, pooled gene/transcript IDs). The table is parsed from a synthetic
+VCF file; every case is loaded in a separate process to measure its peak memory, and the values are checked to be
+identical.
+
+Usage:
+    python benchmarks/bench_variant_schema.py [n_records]
+"""
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'transcript_conservativity', 'code'))
+
+from synthetic import scale_vcf  # noqa: E402
+from variant_schema import read_table  # noqa: E402
+from vcf_parser import vcf_parsing  # noqa: E402
+
+cases = ('read_csv', 'read_table')
+
+
+def run_case(case: str, table_file: str, output_file: str) -> None:
+    start = time.perf_counter()
+    if case == 'read_csv':
+        table = pd.read_csv(table_file, sep='\t', low_memory=False)
+    else:
+        table = read_table(table_file)
+    seconds = time.perf_counter() - start
+    table.to_pickle(output_file)
+    print(json.dumps({'seconds': seconds, 'frame_mb': table.memory_usage(deep=True).sum() / 2 ** 20,
+                      'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+
+def assert_same_values(expected: pd.DataFrame, loaded: pd.DataFrame) -> None:
+    for column in expected.columns:
+        values = loaded[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(object)
+        if pd.api.types.is_numeric_dtype(values.dtype):
+            assert np.allclose(pd.to_numeric(expected[column], errors='coerce').astype(float),
+                               values.astype(float), rtol=1e-6, equal_nan=True), column
+        else:
+            expected_values = expected[column].astype(object)
+            assert expected_values.where(expected_values.notna(), None).equals(
+                values.astype(object).where(values.notna(), None)), column
+
+
+def main(n_records: int = 100000) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        vcf_file = scale_vcf(os.path.join(tmp, 'synthetic_chr22.vcf.gz'), n_records)
+        with contextlib.redirect_stdout(io.StringIO()):
+            vcf_parsing(vcf_file, output_dir=tmp)
+        table_file = os.path.join(tmp, 'synthetic_chr22.tsv')
+
+        results, stats = [], []
+        for case in cases:
+            output_file = os.path.join(tmp, f'{case}.pkl')
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', case, table_file,
+                                     output_file], capture_output=True, text=True, check=True)
+            stats.append(json.loads(result.stdout.strip().splitlines()[-1]))
+            results.append(pd.read_pickle(output_file))
+        assert_same_values(*results)
+
+        print(f'{n_records} records, {len(results[0])} rows, {results[0].shape[1]} columns')
+        for case, case_stats in zip(cases, stats):
+            print(f'{case:<12} {case_stats["seconds"]:6.2f} s {case_stats["frame_mb"]:9.1f} MB frame '
+                  f'({stats[0]["frame_mb"] / case_stats["frame_mb"]:.1f}x) {case_stats["max_rss_mb"]:9.1f} MB max RSS')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--case']:
+        run_case(*sys.argv[2:5])
+    else:
+        main(*map(int, sys.argv[1:]))
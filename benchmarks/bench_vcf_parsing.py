@@ -0,0 +1,109 @@
+"""
+Throughput of `vcf_parsing` (TSV output) on the chr22 example scaled to `n_records` records: the previous
+row builder (first ALT allele only, a new row list per transcript written with `csv.writer`) compared to the
+per-allele path (`iter_vcf_alleles` + `write_tsv`). Outputs of bi-allelic records are checked to be identical.
+
+A multi-allelic version of the same file is then parsed to check that AC/AF and VEP annotations are split
+by allele (ALLELE_NUM), which the previous row builder did not do.
+
+Usage:
+    python benchmarks/bench_vcf_parsing.py [n_records]
+"""
+import csv
+import filecmp
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'transcript_conservativity', 'code'))
+
+import cyvcf2  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from synthetic import make_multiallelic_vcf, scale_vcf  # noqa: E402
+from vcf_parser import column_names, get_vep_field_mapping, info_fields_to_extract, vcf_parsing  # noqa: E402
+
+
+def old_iter_vcf_rows(vcf):
+    # Previous row builder: ALT[0] only, INFO tuples of multi-allelic records are written as they are
+    vep_field_mapping = None
+    for variant in vcf:
+        if 'PASS' in variant.FILTERS:
+            vep_annotation = variant.INFO.get('vep')
+            variant_data = [variant.CHROM, variant.POS, variant.ID, variant.REF, variant.ALT[0]]
+            info_data = [variant.INFO.get(field, '.') for field in info_fields_to_extract[:-1]]
+            if vep_annotation:
+                vep_transcripts = vep_annotation.split(',')
+                if vep_field_mapping is None:
+                    vep_field_mapping = get_vep_field_mapping(vcf, vep_transcripts[0].count('|') + 1)
+                    max_split = max(vep_field_mapping) + 1
+                for transcript in vep_transcripts:
+                    split_transcript = transcript.split('|', max_split)
+                    vep_fields = []
+                    for key in vep_field_mapping.keys():
+                        try:
+                            vep_fields.append(split_transcript[key])
+                        except Exception:
+                            vep_fields.append('.')
+                    yield variant_data + info_data + vep_fields
+            else:
+                yield variant_data + info_data + ['.', '.']
+
+
+def old_vcf_parsing(vcf_file: str, output_file: str) -> None:
+    with open(output_file, 'w', newline='') as tsvfile:
+        writer = csv.writer(tsvfile, delimiter='\t')
+        writer.writerow(column_names)
+        writer.writerows(old_iter_vcf_rows(cyvcf2.VCF(vcf_file)))
+
+
+def run_parser(vcf_file: str, output_dir: str) -> float:
+    start = time.perf_counter()
+    with redirect_stdout(StringIO()):
+        vcf_parsing(vcf_file, output_dir=output_dir)
+    return time.perf_counter() - start
+
+
+def main(n_records: int = 20000) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        vcf_file = scale_vcf(os.path.join(tmp, 'synthetic.vcf.gz'), n_records)
+        multiallelic_file = make_multiallelic_vcf(os.path.join(tmp, 'multiallelic.vcf.gz'), n_records)
+
+        start = time.perf_counter()
+        old_vcf_parsing(vcf_file, os.path.join(tmp, 'old.tsv'))
+        old_seconds = time.perf_counter() - start
+        new_seconds = run_parser(vcf_file, os.path.join(tmp, 'new'))
+        assert filecmp.cmp(os.path.join(tmp, 'old.tsv'), os.path.join(tmp, 'new', 'synthetic.tsv'), shallow=False)
+
+        start = time.perf_counter()
+        for _ in cyvcf2.VCF(vcf_file):
+            pass
+        iteration_seconds = time.perf_counter() - start
+
+        print(f'{n_records} records')
+        print(f'cyvcf2 iteration only   {iteration_seconds:8.2f} s {n_records / iteration_seconds:10.0f} records/s')
+        print(f'previous row builder    {old_seconds:8.2f} s {n_records / old_seconds:10.0f} records/s')
+        print(f'per-allele path         {new_seconds:8.2f} s {n_records / new_seconds:10.0f} records/s '
+              f'({old_seconds / new_seconds:.2f}x)')
+
+        multi_seconds = run_parser(multiallelic_file, os.path.join(tmp, 'new'))
+        single = pd.read_csv(os.path.join(tmp, 'new', 'synthetic.tsv'), sep='\t', dtype=str)
+        multi = pd.read_csv(os.path.join(tmp, 'new', 'multiallelic.tsv'), sep='\t', dtype=str)
+        first = multi[multi['ALLELE_NUM'] != '2'].reset_index(drop=True)
+        second = multi[multi['ALLELE_NUM'] == '2'].reset_index(drop=True)
+        # The first allele keeps the rows of the bi-allelic file, the second one gets its own ALT and counts
+        assert first.equals(single)
+        is_snv = (single['REF'].str.len() == 1) & (single['ALT'].str.len() == 1)
+        assert len(second) == is_snv.sum()
+        assert (second['ALT'] != single.loc[is_snv, 'ALT'].to_numpy()).all()
+        assert (second['AC'].astype(int) == single.loc[is_snv, 'AC'].astype(int).to_numpy() // 2).all()
+        assert (second['AN'] == single.loc[is_snv, 'AN'].to_numpy()).all()
+        print(f'multi-allelic file      {multi_seconds:8.2f} s {len(multi)} rows, '
+              f'{len(second)} rows of second alleles (checked)')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,65 @@
+"""
+Peak memory (max RSS) and time of `vcf_parsing` when all rows are buffered in a list before writing
+(previous behaviour), in streaming mode and in streaming mode with the `is_lof_transcript` pushdown filter.
+Every case runs in a separate process, so that peak RSS values are independent.
+
+Usage:
+    python benchmarks/bench_vcf_parsing_memory.py [n_records]
+"""
+import csv
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'transcript_conservativity', 'code'))
+
+import cyvcf2  # noqa: E402
+
+from synthetic import scale_vcf  # noqa: E402
+from vcf_parser import column_names, is_lof_transcript, iter_vcf_rows, vcf_parsing  # noqa: E402
+
+cases = ('buffered', 'streaming', 'streaming + is_lof_transcript')
+
+
+def run_case(case: str, vcf_file: str) -> None:
+    start = time.perf_counter()
+    if case == 'buffered':
+        # Previous behaviour: collect all rows, then write them
+        data = list(iter_vcf_rows(cyvcf2.VCF(vcf_file)))
+        with open(os.path.join('processed_data', 'buffered.tsv'), 'w', newline='') as tsvfile:
+            writer = csv.writer(tsvfile, delimiter='\t')
+            writer.writerow(column_names)
+            writer.writerows(data)
+    else:
+        vcf_parsing(vcf_file, row_filter=is_lof_transcript if 'is_lof_transcript' in case else None)
+    seconds = time.perf_counter() - start
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    output_file = os.path.join('processed_data', 'buffered.tsv' if case == 'buffered' else
+                               os.path.basename(vcf_file).split('.')[0] + '.tsv')
+    with open(output_file, 'rb') as table:
+        rows = sum(1 for _ in table) - 1
+    print(json.dumps({'seconds': seconds, 'max_rss_mb': max_rss_mb, 'rows': rows}))
+
+
+def main(n_records: int = 100000) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        vcf_file = scale_vcf(os.path.join(tmp, 'synthetic_chr22.vcf.gz'), n_records)
+        os.makedirs(os.path.join(tmp, 'processed_data'))
+        for case in cases:
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', case, vcf_file],
+                                    cwd=tmp, capture_output=True, text=True, check=True)
+            stats = json.loads(result.stdout.strip().splitlines()[-1])
+            # Every case, the LoF filter included, must write rows, or it measures an empty run
+            assert stats['rows'] > 0, f'{case} wrote no rows'
+            print(f'{case:<32} {stats["seconds"]:8.1f} s {stats["max_rss_mb"]:10.1f} MB max RSS {stats["rows"]:10d} rows')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--case']:
+        run_case(sys.argv[2], sys.argv[3])
+    else:
+        main(*map(int, sys.argv[1:]))
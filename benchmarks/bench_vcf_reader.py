@@ -0,0 +1,89 @@
+"""
+Reading a bgzipped gnomAD-like VCF file: `gzip.open(..., 'rt')` + `csv.reader` (the previous reader of both
+context-analysis parsers) against `iter_vcf_records` with 1 and `threads` decompression threads, as bare iteration
+and as the whole `parse_vcf` run. Records and parser outputs are checked to be identical.
+
+Usage:
+    python benchmarks/bench_vcf_reader.py [n_records] [threads]
+"""
+import csv
+import filecmp
+import gzip
+import os
+import sys
+import tempfile
+import time
+
+import pysam
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'context_analysis'))
+
+import parse_vcf_canonical  # noqa: E402
+from parse_vcf_canonical import parse_vcf  # noqa: E402
+from synthetic import scale_vcf  # noqa: E402
+from vcf_reader import iter_vcf_records  # noqa: E402
+
+
+def read_csv_records(vcf_file: str):
+    """
+    Records as the parsers read them before (header lines are filtered as `parse_vcf` does).
+    """
+    with gzip.open(vcf_file, 'rt') as input_file:
+        for line in csv.reader(input_file, delimiter='\t'):
+            if not line[0].startswith('#'):
+                yield line
+
+
+def parse_vcf_csv(vcf_file: str, output_dir: str, output_filename: str) -> None:
+    """
+    `parse_vcf` with the previous reader.
+    """
+    output_file = os.path.join(output_dir, output_filename)
+    with parse_vcf_canonical.TableWriter(output_file, parse_vcf_canonical.headers) as table_writer:
+        for line in read_csv_records(vcf_file):
+            if line[0].startswith('chr') and line[6] == 'PASS':
+                table_writer.write_row(parse_vcf_canonical.parse_line(line))
+
+
+def timed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main(n_records: int = 100000, threads: int = 4) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        gzip_file = scale_vcf(os.path.join(tmp, 'synthetic_chr22.vcf.gz'), n_records)
+        vcf_file = os.path.join(tmp, 'synthetic_chr22.vcf.bgz')
+        with gzip.open(gzip_file, 'rb') as input_file, pysam.BGZFile(vcf_file, 'wb') as output_file:
+            for chunk in iter(lambda: input_file.read(1 << 22), b''):
+                output_file.write(chunk)
+        size_mb = os.path.getsize(vcf_file) / 2 ** 20
+
+        records = list(iter_vcf_records(vcf_file, threads))
+        assert records == [line[:8] for line in read_csv_records(vcf_file)]
+        del records
+
+        print(f'{n_records} records, {size_mb:.1f} MB bgzipped, {os.cpu_count()} CPUs')
+        cases = [
+            ('gzip + csv.reader', lambda: sum(1 for _ in read_csv_records(vcf_file))),
+            ('iter_vcf_records, 1 thread', lambda: sum(1 for _ in iter_vcf_records(vcf_file, 1))),
+            (f'iter_vcf_records, {threads} threads', lambda: sum(1 for _ in iter_vcf_records(vcf_file, threads))),
+        ]
+        baseline = None
+        for name, case in cases:
+            seconds = timed(case)
+            baseline = baseline or seconds
+            print(f'{name:<32} {seconds:7.2f} s {n_records / seconds:10.0f} records/s '
+                  f'{size_mb / seconds:7.1f} MB/s ({baseline / seconds:.1f}x)')
+
+        csv_seconds = timed(parse_vcf_csv, vcf_file, tmp, 'csv.tsv')
+        reader_seconds = timed(parse_vcf, vcf_file, tmp, 'reader.tsv', 10000, None, True, 'tsv', False, threads)
+        assert filecmp.cmp(os.path.join(tmp, 'csv.tsv'), os.path.join(tmp, 'reader.tsv'), shallow=False)
+        print(f'{"parse_vcf, gzip + csv.reader":<32} {csv_seconds:7.2f} s {n_records / csv_seconds:10.0f} records/s')
+        print(f'{"parse_vcf, iter_vcf_records":<32} {reader_seconds:7.2f} s '
+              f'{n_records / reader_seconds:10.0f} records/s ({csv_seconds / reader_seconds:.2f}x)')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
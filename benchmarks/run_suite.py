@@ -0,0 +1,308 @@
+"""
+Benchmark suite of the main entry points at several input scales, with regression thresholds and memory tracking:
+`parse_vcf`, `parse_clinvar_vcf` and `vcf_parsing` (with and without the `is_lof_transcript` filter) on synthetic gnomAD-v4-shaped and ClinVar-shaped VCF files,
+`info_filtering` on a `vcf_parsing`-shaped table, `get_context` on a synthetic gencode transcript FASTA and
+`calculate_chi2_p_values` on random contexts.
+
+Inputs are generated once per scale in `work_dir` (10^7 records take hours and tens of GB, use a persistent
+`--work-dir` for large scales). Every case runs in a separate process: the run time of the function, its throughput,
+the peak RSS and the RSS before the call (after loading the inputs) are measured. Results are compared to the
+thresholds file: a case regresses when its time or peak RSS exceeds the threshold by more than the tolerance, and
+the script then exits with status 1. Thresholds are machine-specific; `--save-thresholds` stores the measured values
+as the new thresholds.
+
+Usage:
+    python benchmarks/run_suite.py [--scales 1e4,1e5] [--cases parse_vcf,get_context] [--work-dir DIR]
+                                   [--thresholds FILE] [--tolerance 0.25] [--save-thresholds] [--output FILE]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+from pyfaidx import Fasta
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchmarks_dir, '..', 'context_analysis'))
+sys.path.insert(0, os.path.join(benchmarks_dir, '..', 'transcript_conservativity', 'code'))
+
+from analysis_functions import calculate_chi2_p_values, get_context  # noqa: E402
+from data_processing_functions import info_filtering  # noqa: E402
+from parse_vcf_canonical import parse_vcf  # noqa: E402
+from parse_vcf_clinvar import parse_clinvar_vcf  # noqa: E402
+from run_profile import current_rss_mb, peak_rss_mb  # noqa: E402
+from synthetic import (make_clinvar_vcf, make_gnomad_vcf, make_lookup_tables, make_transcript_fasta,  # noqa: E402
+                       make_variant_table)
+from vcf_parser import is_lof_transcript, vcf_parsing  # noqa: E402
+
+default_thresholds = os.path.join(benchmarks_dir, 'suite_thresholds.json')
+
+# Absolute slack of the time thresholds, so that timer noise of millisecond cases is not reported as a regression
+time_slack = 0.05
+
+
+def gnomad_input(work_dir: str, n: int) -> str:
+    vcf_file = os.path.join(work_dir, f'gnomad_{n}.vcf.gz')
+    if not os.path.exists(vcf_file):
+        make_gnomad_vcf(vcf_file + '.tmp', n)
+        os.replace(vcf_file + '.tmp', vcf_file)
+    return vcf_file
+
+
+def clinvar_input(work_dir: str, n: int) -> str:
+    vcf_file = os.path.join(work_dir, f'clinvar_{n}.vcf.gz')
+    if not os.path.exists(vcf_file):
+        make_clinvar_vcf(vcf_file + '.tmp', n)
+        os.replace(vcf_file + '.tmp', vcf_file)
+    return vcf_file
+
+
+def variant_table_input(work_dir: str, n: int) -> tuple:
+    table_file = os.path.join(work_dir, f'variant_table_{n}.pkl')
+    constraint_file = os.path.join(work_dir, f'constraint_{n}.tsv')
+    expression_file = os.path.join(work_dir, f'expression_{n}.tsv')
+    if not os.path.exists(table_file):
+        n_transcripts = max(100, min(20000, n // 20))
+        constraint, expression = make_lookup_tables(n_transcripts)
+        constraint.to_csv(constraint_file, sep='\t', index=False)
+        expression.to_csv(expression_file, sep='\t', index=False)
+        make_variant_table(n, n_transcripts).to_pickle(table_file + '.tmp')
+        os.replace(table_file + '.tmp', table_file)
+    return table_file, constraint_file, expression_file
+
+
+def context_input(work_dir: str, n: int) -> tuple:
+    variants_file = os.path.join(work_dir, f'context_variants_{n}.pkl')
+    fasta_file = os.path.join(work_dir, f'transcripts_{n}.fa')
+    if not os.path.exists(variants_file):
+        rng = np.random.default_rng(0)
+        n_transcripts = max(100, min(20000, n // 50))
+        lengths = rng.integers(300, 5000, n_transcripts)
+        transcript_lengths = {f'ENST{idx:011d}': int(length) for idx, length in enumerate(lengths)}
+        make_transcript_fasta(fasta_file, transcript_lengths)
+        transcript_idx = rng.integers(0, n_transcripts, n)
+        variants = pd.DataFrame({
+            'Canonical_transcript': pd.Series(transcript_idx).map('ENST{:011d}'.format),
+            'cDNA_position': (rng.random(n) * lengths[transcript_idx]).astype(int) + 1,
+        })
+        variants.to_pickle(variants_file + '.tmp')
+        os.replace(variants_file + '.tmp', variants_file)
+    return variants_file, fasta_file
+
+
+def chi2_input(work_dir: str, n: int) -> str:
+    contexts_file = os.path.join(work_dir, f'contexts_{n}.pkl')
+    if not os.path.exists(contexts_file):
+        rng = np.random.default_rng(0)
+        bases = np.frombuffer(b'ACGT', dtype=np.uint8)
+        # Pathogenic contexts are slightly enriched in G around the variant
+        context_ben = bases[rng.integers(0, 4, (n, 25))]
+        context_pat = bases[rng.choice(4, (n, 25), p=[0.24, 0.24, 0.28, 0.24])]
+        with open(contexts_file + '.tmp', 'wb') as output_file:
+            pickle.dump(([row.tobytes().decode() for row in context_ben],
+                         [row.tobytes().decode() for row in context_pat]), output_file)
+        os.replace(contexts_file + '.tmp', contexts_file)
+    return contexts_file
+
+
+def run_parse_vcf(vcf_file: str, output_dir: str) -> int:
+    return parse_vcf(vcf_file, output_dir, 'parse_vcf.tsv')
+
+
+def run_parse_clinvar_vcf(vcf_file: str, output_dir: str) -> int:
+    return parse_clinvar_vcf(vcf_file, output_dir, 'parse_clinvar_vcf.tsv')
+
+
+def run_vcf_parsing(vcf_file: str, output_dir: str) -> None:
+    with contextlib.redirect_stdout(io.StringIO()):
+        vcf_parsing(vcf_file, output_dir=output_dir)
+
+
+def run_vcf_parsing_lof(vcf_file: str, output_dir: str) -> None:
+    with contextlib.redirect_stdout(io.StringIO()):
+        vcf_parsing(vcf_file, row_filter=is_lof_transcript, output_dir=output_dir)
+
+
+def setup_info_filtering(inputs: tuple, output_dir: str) -> tuple:
+    table_file, constraint_file, expression_file = inputs
+    return pd.read_pickle(table_file), constraint_file, expression_file
+
+
+def run_info_filtering(gene_data, constraint_file: str, expression_file: str) -> int:
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return len(info_filtering(gene_data, constraint_file, expression_file))
+
+
+def setup_get_context(inputs: tuple, output_dir: str) -> tuple:
+    variants_file, fasta_file = inputs
+    return pd.read_pickle(variants_file), Fasta(fasta_file, key_function=lambda x: x.split('.')[0])
+
+
+def run_get_context(variants, transcript_fasta) -> int:
+    get_context(variants, transcript_fasta, 13, 12)
+    return int(variants['Context'].notna().sum())
+
+
+def setup_chi2(contexts_file: str, output_dir: str) -> tuple:
+    with open(contexts_file, 'rb') as input_file:
+        return pickle.load(input_file)
+
+
+def run_chi2(context_ben, context_pat) -> int:
+    return len(calculate_chi2_p_values(context_ben, context_pat)[1])
+
+
+def setup_paths(inputs: str, output_dir: str) -> tuple:
+    return inputs, output_dir
+
+
+def output_rows(output_dir: str) -> int:
+    """
+    Number of data rows of the TSV tables written to the output directory of a case.
+    """
+    rows = 0
+    for name in os.listdir(output_dir):
+        with open(os.path.join(output_dir, name), 'rb') as table:
+            rows += sum(1 for _ in table) - 1
+    return rows
+
+
+# Case name: (input generator, setup of the arguments before timing, timed function, unit of the scale).
+# Timed functions return the number of output items, or None when they write tables to the output directory
+cases = {
+    'parse_vcf': (gnomad_input, setup_paths, run_parse_vcf, 'records'),
+    'parse_clinvar_vcf': (clinvar_input, setup_paths, run_parse_clinvar_vcf, 'records'),
+    'vcf_parsing': (gnomad_input, setup_paths, run_vcf_parsing, 'records'),
+    'vcf_parsing_lof': (gnomad_input, setup_paths, run_vcf_parsing_lof, 'records'),
+    'info_filtering': (variant_table_input, setup_info_filtering, run_info_filtering, 'rows'),
+    'get_context': (context_input, setup_get_context, run_get_context, 'variants'),
+    'calculate_chi2_p_values': (chi2_input, setup_chi2, run_chi2, 'contexts'),
+}
+
+
+def run_case(name: str, n: int, work_dir: str) -> None:
+    """
+    Run one case in the current process and print its measurements as JSON. A case without output fails, so that
+    a generator or filter change cannot make a case measure an empty run.
+    """
+    make_input, setup, run, _ = cases[name]
+    output_dir = tempfile.mkdtemp(dir=work_dir)
+    args = setup(make_input(work_dir, n), output_dir)
+    setup_rss = current_rss_mb()
+    start = time.perf_counter()
+    outputs = run(*args)
+    seconds = time.perf_counter() - start
+    if outputs is None:
+        outputs = output_rows(output_dir)
+    if not outputs:
+        raise RuntimeError(f'{name} at {n} produced no output')
+    print(json.dumps({'seconds': seconds, 'items_per_second': n / seconds, 'outputs': outputs,
+                      'setup_rss_mb': setup_rss, 'max_rss_mb': peak_rss_mb()}))
+
+
+def measure(name: str, n: int, work_dir: str) -> dict:
+    """
+    Generate the inputs of a case (not measured) and run it in a separate process.
+    """
+    cases[name][0](work_dir, n)
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', name, str(n), work_dir],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'{name} at {n} failed:\n{result.stderr}')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def check_thresholds(results: dict, thresholds: dict, tolerance: float) -> list:
+    """
+    Compare the measurements to the thresholds.
+
+    Returns:
+        list: Descriptions of the regressions.
+    """
+    regressions = []
+    for name, scales in results.items():
+        for n, measured in scales.items():
+            limits = thresholds.get(name, {}).get(n)
+            if limits is None:
+                continue
+            for metric, slack in (('seconds', time_slack), ('max_rss_mb', 0.0)):
+                if measured[metric] > limits[metric] * (1 + tolerance) + slack:
+                    regressions.append(f'{name} at {n}: {metric} {measured[metric]:.2f} > '
+                                       f'{limits[metric]:.2f} + {tolerance:.0%}')
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark suite with regression thresholds.')
+    parser.add_argument('--scales', default='1e4', help='Comma-separated input sizes, e.g. 1e4,1e5,1e6.')
+    parser.add_argument('--cases', default=','.join(cases), help='Comma-separated case names.')
+    parser.add_argument('--work-dir', help='Directory of the generated inputs, kept between runs. '
+                                           'Defaults to a temporary directory.')
+    parser.add_argument('--thresholds', default=default_thresholds, help='JSON file of the thresholds.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed excess over the thresholds.')
+    parser.add_argument('--save-thresholds', action='store_true', help='Store the measurements as thresholds.')
+    parser.add_argument('--output', help='JSON file of the measurements.')
+    args = parser.parse_args()
+
+    scales = [int(float(scale)) for scale in args.scales.split(',')]
+    names = args.cases.split(',')
+    unknown = set(names) - set(cases)
+    if unknown:
+        parser.error(f'Unknown cases: {", ".join(sorted(unknown))}')
+    thresholds = {}
+    if os.path.exists(args.thresholds):
+        with open(args.thresholds) as thresholds_file:
+            thresholds = json.load(thresholds_file)
+
+    with contextlib.ExitStack() as stack:
+        work_dir = args.work_dir or stack.enter_context(tempfile.TemporaryDirectory())
+        os.makedirs(work_dir, exist_ok=True)
+        results = {}
+        print(f'{"case":<24} {"scale":>9} {"seconds":>9} {"items/s":>11} {"outputs":>9} {"max RSS":>10} '
+              f'{"RSS growth":>11}  threshold')
+        for name in names:
+            for n in scales:
+                measured = measure(name, n, work_dir)
+                results.setdefault(name, {})[str(n)] = measured
+                limits = thresholds.get(name, {}).get(str(n))
+                limit_text = f'{limits["seconds"]:.2f} s, {limits["max_rss_mb"]:.0f} MB' if limits else '-'
+                print(f'{name:<24} {n:>9} {measured["seconds"]:9.2f} {measured["items_per_second"]:11.0f} '
+                      f'{measured["outputs"]:9d} '
+                      f'{measured["max_rss_mb"]:7.0f} MB {measured["max_rss_mb"] - measured["setup_rss_mb"]:8.0f} MB  '
+                      f'{limit_text}')
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.save_thresholds:
+        for name, scales_results in results.items():
+            for n, measured in scales_results.items():
+                thresholds.setdefault(name, {})[n] = {'seconds': round(measured['seconds'], 3),
+                                                      'max_rss_mb': round(measured['max_rss_mb'], 1)}
+        with open(args.thresholds, 'w') as thresholds_file:
+            json.dump(thresholds, thresholds_file, indent=2)
+        print(f'Thresholds saved to {args.thresholds}')
+        return
+
+    regressions = check_thresholds(results, thresholds, args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--case']:
+        run_case(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+    else:
+        main()
@@ -0,0 +1,525 @@
+import gzip
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Small gnomAD v4 exome fragment shipped with the repository
+example_vcf = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '..', 'transcript_conservativity', 'data', 'example_chr22.vcf')
+
+
+# Positions of VEP fields in the gnomAD v4 annotation layout (48 fields per transcript)
+vep_field_index = {'Allele': 0, 'Consequence': 1, 'IMPACT': 2, 'SYMBOL': 3, 'Gene': 4, 'Feature_type': 5,
+                   'Feature': 6, 'BIOTYPE': 7, 'CANONICAL': 24, 'LoF': 44, 'LoF_filter': 45, 'LoF_flags': 46}
+
+# Consequences of the synthetic LoF transcripts, the ones kept by `is_lof_transcript` and `info_filtering`
+lof_consequences = ['stop_gained', 'frameshift_variant', 'splice_donor_variant', 'splice_acceptor_variant']
+
+
+def make_lof_transcript(fields: List[str], consequence: str, gene: int, transcript: int) -> List[str]:
+    """
+    Turn the VEP fields of a template transcript (all pseudogenes or snRNA in the chr22 example) into a high
+    confidence LoF variant of a protein-coding transcript.
+
+    Args:
+        fields (List[str]): VEP fields of the template transcript in the gnomAD v4 layout.
+        consequence (str): One of `lof_consequences`.
+        gene (int): Number of the synthetic gene (gene 'LOFG<gene>').
+        transcript (int): Number of the transcript within the gene.
+
+    Returns:
+        List[str]: New VEP fields.
+    """
+    fields = fields.copy()
+    fields[vep_field_index['Consequence']] = consequence
+    fields[vep_field_index['IMPACT']] = 'HIGH'
+    fields[vep_field_index['SYMBOL']] = f'LOFG{gene}'
+    fields[vep_field_index['Gene']] = f'ENSG{90000000000 + gene:011d}'
+    fields[vep_field_index['Feature_type']] = 'Transcript'
+    fields[vep_field_index['Feature']] = f'ENST{90000000000 + gene * 100 + transcript:011d}'
+    fields[vep_field_index['BIOTYPE']] = 'protein_coding'
+    fields[vep_field_index['LoF']] = 'HC'
+    fields[vep_field_index['LoF_filter']] = ''
+    fields[vep_field_index['LoF_flags']] = ''
+    return fields
+
+
+def make_lof_record(record: List[str], consequence: str, gene: int) -> List[str]:
+    """
+    Replace the VEP annotation of a template record by LoF annotations of protein-coding transcripts of one gene.
+
+    Args:
+        record (List[str]): Template record split by tabs.
+        consequence (str): One of `lof_consequences`.
+        gene (int): Number of the synthetic gene.
+
+    Returns:
+        List[str]: New record.
+    """
+    prefix, _, vep = record[7].rpartition('vep=')
+    transcripts = ['|'.join(make_lof_transcript(transcript.split('|'), consequence, gene, t))
+                   for t, transcript in enumerate(vep.split(','))]
+    return record[:7] + [f'{prefix}vep={",".join(transcripts)}'] + record[8:]
+
+
+def read_template(template_vcf: str = example_vcf) -> Tuple[List[str], List[List[str]]]:
+    """
+    Read header lines and records of a template VCF file.
+
+    Args:
+        template_vcf (str): Path to the (uncompressed) template VCF file. Default is the chr22 example.
+
+    Returns:
+        Tuple[List[str], List[List[str]]]: Header lines and records split by tabs.
+    """
+    header, records = [], []
+    with open(template_vcf) as vcf:
+        for line in vcf:
+            if line.startswith('#'):
+                header.append(line)
+            else:
+                records.append(line.rstrip('\n').split('\t'))
+    return header, records
+
+
+def scale_vcf(output_file: str, n_records: int, template_vcf: str = example_vcf, lof_fraction: float = 0.05,
+              seed: int = 0) -> str:
+    """
+    Write a compressed VCF file with `n_records` records by repeating the template records.
+    Each repetition is shifted by the span of the template, so positions stay sorted. A random `lof_fraction` of the
+    records is annotated as LoF variants of protein-coding transcripts (`make_lof_record`), so that the LoF filters
+    of the parsers keep rows.
+
+    Args:
+        output_file (str): Path to the output '.vcf.gz' file.
+        n_records (int): Number of records to write.
+        template_vcf (str): Path to the template VCF file. Default is the chr22 example.
+        lof_fraction (float): Fraction of LoF records. Default is 0.05.
+        seed (int): Random seed of the LoF records. Default is 0.
+
+    Returns:
+        str: Path to the output file.
+    """
+    header, records = read_template(template_vcf)
+    return write_scaled_records(output_file, header, records, make_lof_records(records), n_records, lof_fraction,
+                                seed)
+
+
+def make_lof_records(records: List[List[str]]) -> List[List[str]]:
+    """
+    LoF versions of the template records (`make_lof_record`) with the consequences of `lof_consequences` in turn
+    and 50 recurring genes.
+
+    Args:
+        records (List[List[str]]): Template records split by tabs.
+
+    Returns:
+        List[List[str]]: LoF records in the order of `records`.
+    """
+    return [make_lof_record(record, lof_consequences[r % len(lof_consequences)], r % 50)
+            for r, record in enumerate(records)]
+
+
+def write_scaled_records(output_file: str, header: List[str], records: List[List[str]],
+                         lof_records: List[List[str]], n_records: int, lof_fraction: float, seed: int) -> str:
+    """
+    Write `n_records` records repeating the template records, shifted by the span of the template, with a random
+    `lof_fraction` of them taken from `lof_records`. The same seed selects the same LoF records, so files written from
+    versions of the same template (e.g. with added alleles) stay comparable record by record.
+
+    Args:
+        output_file (str): Path to the output '.vcf.gz' file.
+        header (List[str]): Header lines.
+        records (List[List[str]]): Template records split by tabs.
+        lof_records (List[List[str]]): LoF versions of `records`.
+        n_records (int): Number of records to write.
+        lof_fraction (float): Fraction of LoF records.
+        seed (int): Random seed of the LoF records.
+
+    Returns:
+        str: Path to the output file.
+    """
+    rng = np.random.default_rng(seed)
+    first_pos = int(records[0][1])
+    span = int(records[-1][1]) - first_pos + 1
+
+    batch_size = 10000
+    with gzip.open(output_file, 'wt', compresslevel=1) as vcf:
+        vcf.writelines(header)
+        for i in range(n_records):
+            if i % batch_size == 0:
+                is_lof = rng.random(batch_size) < lof_fraction
+            record = (lof_records if is_lof[i % batch_size] else records)[i % len(records)]
+            shift = (i // len(records)) * span
+            vcf.write('\t'.join([record[0], str(int(record[1]) + shift)] + record[2:]) + '\n')
+    return output_file
+
+
+def make_gnomad_vcf(output_file: str, n_records: int, mean_transcripts: float = 4.0, pass_fraction: float = 0.9,
+                    seed: int = 0, template_vcf: str = example_vcf, lof_fraction: float = 0.05,
+                    n_lof_genes: int = 500) -> str:
+    """
+    Write a compressed gnomAD-v4-shaped VCF file with random records built from the template: the INFO column of a
+    random template record (about 10 kB with ~480 keys, as in gnomAD v4) with a random AC, random SNV and short indel
+    alleles at increasing positions, a FILTER other than PASS for `1 - pass_fraction` of the records and a VEP
+    annotation with 1 + Poisson(`mean_transcripts` - 1) transcripts drawn from the template annotations
+    (the first one canonical, all with distinct transcript IDs). A random `lof_fraction` of the records are LoF
+    variants (`lof_consequences`, LoF=HC) of protein-coding transcripts of one of `n_lof_genes` genes; these
+    transcripts recur across records, so per-transcript and per-gene aggregates have several variants.
+
+    Args:
+        output_file (str): Path to the output '.vcf.gz' file.
+        n_records (int): Number of records to write.
+        mean_transcripts (float): Mean number of VEP transcripts per record. Default is 4.
+        pass_fraction (float): Fraction of PASS records. Default is 0.9.
+        seed (int): Random seed. Default is 0.
+        template_vcf (str): Path to the template VCF file. Default is the chr22 example.
+        lof_fraction (float): Fraction of LoF records. Default is 0.05.
+        n_lof_genes (int): Number of genes of the LoF records. Default is 500.
+
+    Returns:
+        str: Path to the output file.
+    """
+    rng = np.random.default_rng(seed)
+    header, records = read_template(template_vcf)
+    info_prefixes, vep_pool = [], []
+    for record in records:
+        prefix, _, vep = record[7].rpartition('vep=')
+        # The AC value is drawn per record
+        info_prefixes.append(prefix.split(';', 1)[1])
+        vep_pool.extend(transcript.split('|') for transcript in vep.split(','))
+    allele_idx, feature_idx, canonical_idx = (vep_field_index[field] for field in ('Allele', 'Feature', 'CANONICAL'))
+
+    chrom = records[0][0]
+    batch_size = 10000
+    position = int(records[0][1])
+    with gzip.open(output_file, 'wt', compresslevel=1) as vcf:
+        vcf.writelines(header)
+        for start in range(0, n_records, batch_size):
+            size = min(batch_size, n_records - start)
+            positions = position + np.cumsum(rng.integers(1, 60, size))
+            position = int(positions[-1])
+            template_idx = rng.integers(0, len(records), size)
+            n_transcripts = 1 + rng.poisson(max(mean_transcripts - 1, 0), size)
+            transcript_idx = rng.integers(0, len(vep_pool), int(n_transcripts.sum()))
+            refs = rng.choice(['A', 'C', 'G', 'T'], size)
+            alts = rng.choice(['C', 'G', 'T', 'AT', 'CTG', 'A'], size, p=[0.3, 0.3, 0.3, 0.05, 0.03, 0.02])
+            alts = np.where(alts == refs, 'T', alts)
+            alts = np.where(alts == refs, 'G', alts)
+            filters = np.where(rng.random(size) < pass_fraction, 'PASS', rng.choice(['AC0', 'AS_VQSR'], size))
+            acs = rng.geometric(0.2, size)
+            is_lof = rng.random(size) < lof_fraction
+            lof_genes = rng.integers(0, n_lof_genes, size)
+            consequences = rng.choice(lof_consequences, size)
+
+            lines = []
+            offset = 0
+            for i in range(size):
+                transcripts = []
+                for t in range(n_transcripts[i]):
+                    fields = vep_pool[transcript_idx[offset + t]]
+                    if is_lof[i]:
+                        fields = make_lof_transcript(fields, consequences[i], lof_genes[i], t)
+                    else:
+                        fields = fields.copy()
+                        fields[feature_idx] = f'ENST{(start + i) * 8 + t:011d}'
+                    fields[allele_idx] = alts[i]
+                    fields[canonical_idx] = 'YES' if t == 0 else ''
+                    transcripts.append('|'.join(fields))
+                offset += n_transcripts[i]
+                info = f'AC={acs[i]};{info_prefixes[template_idx[i]]}vep={",".join(transcripts)}'
+                lines.append(f'{chrom}\t{positions[i]}\trs{start + i}\t{refs[i]}\t{alts[i]}\t.\t{filters[i]}\t{info}\n')
+            vcf.writelines(lines)
+    return output_file
+
+
+def make_multiallelic_vcf(output_file: str, n_records: int, template_vcf: str = example_vcf,
+                          lof_fraction: float = 0.05, seed: int = 0) -> str:
+    """
+    Write a compressed VCF file like `scale_vcf`, in which every SNV record gets a second ALT allele:
+    AC/AF become per-allele pairs (the second allele has half of the count of the first one) and
+    the VEP annotations are repeated for the second allele with ALLELE_NUM=2. With the same arguments as
+    `scale_vcf`, the records (LoF records included) are those of `scale_vcf` with the added allele.
+
+    Args:
+        output_file (str): Path to the output '.vcf.gz' file.
+        n_records (int): Number of records to write.
+        template_vcf (str): Path to the template VCF file. Default is the chr22 example.
+        lof_fraction (float): Fraction of LoF records. Default is 0.05.
+        seed (int): Random seed of the LoF records. Default is 0.
+
+    Returns:
+        str: Path to the output file.
+    """
+    header, records = read_template(template_vcf)
+
+    def add_allele(record: List[str]) -> List[str]:
+        ref, alt = record[3], record[4]
+        if len(ref) != 1 or len(alt) != 1:
+            return record
+        second_alt = next(base for base in 'ACGT' if base not in (ref, alt))
+        info = []
+        for item in record[7].split(';'):
+            key, _, value = item.partition('=')
+            if key == 'AC':
+                item = f'AC={value},{int(value) // 2}'
+            elif key == 'AF':
+                item = f'AF={value},{float(value) / 2:.5e}'
+            elif key == 'vep':
+                annotations = value.split(',')
+                second = []
+                for annotation in annotations:
+                    fields = annotation.split('|')
+                    fields[0], fields[17] = second_alt, '2'
+                    second.append('|'.join(fields))
+                item = 'vep=' + ','.join(annotations + second)
+            info.append(item)
+        return record[:4] + [f'{alt},{second_alt}'] + record[5:7] + [';'.join(info)] + record[8:]
+
+    lof_records = [add_allele(record) for record in make_lof_records(records)]
+    records = [add_allele(record) for record in records]
+    return write_scaled_records(output_file, header, records, lof_records, n_records, lof_fraction, seed)
+
+
+def make_clinvar_vcf(output_file: str, n_records: int, seed: int = 0) -> str:
+    """
+    Write a compressed ClinVar-like VCF file annotated with VEP (CSQ with 1-4 transcripts per record).
+    About 10% of the records have no GENEINFO and no MC, as in the real file.
+
+    Args:
+        output_file (str): Path to the output '.vcf.gz' file.
+        n_records (int): Number of records to write.
+        seed (int): Random seed. Default is 0.
+
+    Returns:
+        str: Path to the output file.
+    """
+    rng = np.random.default_rng(seed)
+    csq_format = ('Allele|Consequence|IMPACT|SYMBOL|Gene|Feature_type|Feature|BIOTYPE|EXON|INTRON|HGVSc|HGVSp|'
+                  'cDNA_position|CDS_position|Protein_position|Amino_acids|Codons|Existing_variation|DISTANCE|'
+                  'STRAND|FLAGS|SYMBOL_SOURCE|HGNC_ID|CANONICAL')
+    clnsig = ['Pathogenic', 'Likely_pathogenic', 'Pathogenic/Likely_pathogenic', 'Benign', 'Likely_benign',
+              'Uncertain_significance', 'Conflicting_classifications_of_pathogenicity']
+    molecular_consequences = ['SO:0001587|nonsense', 'SO:0001583|missense_variant', 'SO:0001627|intron_variant',
+                              'SO:0001819|synonymous_variant', 'SO:0001589|frameshift_variant']
+    consequences = {'SO:0001587|nonsense': 'stop_gained', 'SO:0001583|missense_variant': 'missense_variant',
+                    'SO:0001627|intron_variant': 'intron_variant', 'SO:0001819|synonymous_variant':
+                    'synonymous_variant', 'SO:0001589|frameshift_variant': 'frameshift_variant'}
+    header = ['##fileformat=VCFv4.1\n']
+    for key in ('ALLELEID', 'CLNDN', 'CLNDISDB', 'CLNHGVS', 'CLNREVSTAT', 'CLNSIG', 'CLNVC', 'CLNVCSO',
+                'GENEINFO', 'MC', 'ORIGIN', 'RS'):
+        header.append(f'##INFO=<ID={key},Number=.,Type=String,Description="{key}">\n')
+    header.append(f'##INFO=<ID=CSQ,Number=.,Type=String,Description="Consequence annotations from Ensembl VEP. '
+                  f'Format: {csq_format}">\n')
+    header.append('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+
+    chroms = [str(chrom) for chrom in range(1, 23)]
+    with gzip.open(output_file, 'wt', compresslevel=1) as vcf:
+        vcf.writelines(header)
+        for i in range(n_records):
+            chrom = chroms[i * len(chroms) // n_records]
+            ref, alt = rng.choice(['A', 'C', 'G', 'T'], 2, replace=False)
+            gene = int(rng.integers(0, 5000))
+            mc = molecular_consequences[rng.integers(0, len(molecular_consequences))]
+            info = [f'ALLELEID={i}', f'CLNDN=Disease_{gene}|not_provided', f'CLNDISDB=MedGen:C{gene:07d}',
+                    f'CLNHGVS=NC_000001.11:g.{1000 + i}{ref}>{alt}',
+                    'CLNREVSTAT=criteria_provided,_single_submitter',
+                    f'CLNSIG={clnsig[rng.integers(0, len(clnsig))]}', 'CLNVC=single_nucleotide_variant',
+                    'CLNVCSO=SO:0001483']
+            if rng.random() > 0.1:
+                info += [f'GENEINFO=G{gene}:{gene}', f'MC={mc}']
+            info += ['ORIGIN=1', f'RS={1000000 + i}']
+            transcripts = []
+            for t in range(int(rng.integers(1, 5))):
+                consequence = consequences[mc] if t == 0 else 'intron_variant'
+                fields = [''] * 24
+                fields[:8] = [alt, consequence, 'HIGH', f'G{gene}', f'ENSG{gene:011d}', 'Transcript',
+                              f'ENST{gene * 4 + t:011d}', 'protein_coding']
+                fields[12] = str(int(rng.integers(1, 5000)))
+                fields[23] = 'YES' if t == 0 else ''
+                transcripts.append('|'.join(fields))
+            info.append('CSQ=' + ','.join(transcripts))
+            vcf.write(f'{chrom}\t{1000 + i * 97}\t{i}\t{ref}\t{alt}\t.\t.\t{";".join(info)}\n')
+    return output_file
+
+
+def make_variant_table(n_rows: int, n_transcripts: int = 20000, seed: int = 0,
+                       localized: bool = False) -> pd.DataFrame:
+    """
+    Generate a table shaped like the `vcf_parsing` output of a chromosome: one row per variant and transcript,
+    with a mix of biotypes, feature types and consequences, so that `info_filtering` keeps a part of the rows.
+
+    Args:
+        n_rows (int): Number of rows.
+        n_transcripts (int): Number of distinct transcripts. Default is 20000.
+        seed (int): Random seed. Default is 0.
+        localized (bool): Place the rows of every transcript in its own region of the chromosome, as in real data,
+            instead of spreading them over the whole chromosome. Default is False.
+
+    Returns:
+        pd.DataFrame: Variant table with the columns used by `info_filtering`.
+    """
+    rng = np.random.default_rng(seed)
+    transcript_idx = rng.integers(0, n_transcripts, n_rows)
+    if localized:
+        transcript_idx.sort()
+    gene_idx = transcript_idx // 4
+    table = pd.DataFrame({
+        'CHROM': 'chr1',
+        'POS': np.sort(rng.integers(1, 248_000_000, n_rows)),
+        'REF': rng.choice(['A', 'C', 'G', 'T'], n_rows),
+        'ALT': rng.choice(['A', 'C', 'G', 'T', 'AT', 'CTG'], n_rows, p=[0.22, 0.22, 0.22, 0.22, 0.08, 0.04]),
+        'AC': rng.geometric(0.3, n_rows),
+    })
+    for pop in ('afr', 'amr', 'nfe', 'asj', 'sas', 'eas', 'mid', 'fin'):
+        table[f'AC_{pop}'] = rng.binomial(table['AC'], 0.12)
+    table['Consequence'] = rng.choice(
+        ['stop_gained', 'frameshift_variant', 'splice_donor_variant', 'splice_acceptor_variant',
+         'missense_variant', 'synonymous_variant', 'intron_variant'], n_rows)
+    table['SYMBOL'] = pd.Series(gene_idx).map('GENE{}'.format)
+    table['Gene'] = pd.Series(gene_idx).map('ENSG{:011d}'.format)
+    table['Feature_Type'] = rng.choice(['Transcript', 'RegulatoryFeature'], n_rows, p=[0.95, 0.05])
+    table['Feature'] = pd.Series(transcript_idx).map('ENST{:011d}'.format)
+    table['BIOTYPE'] = rng.choice(['protein_coding', 'lncRNA', 'nonsense_mediated_decay'], n_rows, p=[0.7, 0.2, 0.1])
+    return table
+
+
+def make_variant_sets(n_gnomad: int, n_clinvar: int, overlap: float = 0.2,
+                      seed: int = 0) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Generate genome-wide gnomAD-like and ClinVar-like variant tables sharing a part of their variants,
+    with the columns that the NMD notebooks join on and carry over (cDNA_position, Consequence, ...).
+
+    Args:
+        n_gnomad (int): Number of gnomAD rows (slightly fewer after removing random duplicates).
+        n_clinvar (int): Number of ClinVar rows (slightly fewer after removing random duplicates).
+        overlap (float): Fraction of the ClinVar variants that are also in the gnomAD table. Default is 0.2.
+        seed (int): Random seed. Default is 0.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: gnomAD and ClinVar tables.
+    """
+    rng = np.random.default_rng(seed)
+
+    def random_variants(n: int) -> pd.DataFrame:
+        alts = rng.choice(['A', 'C', 'G', 'T', 'AT', 'CTG', 'GATTACAGATTACA'], n,
+                          p=[0.22, 0.22, 0.22, 0.22, 0.06, 0.04, 0.02])
+        return pd.DataFrame({
+            'CHROM': rng.choice([f'chr{chrom}' for chrom in list(range(1, 23)) + ['X', 'Y']], n),
+            'POS': rng.integers(1, 248_000_000, n),
+            'REF': rng.choice(['A', 'C', 'G', 'T'], n),
+            'ALT': alts,
+        })
+
+    gnomad = random_variants(n_gnomad).drop_duplicates(ignore_index=True)
+    n_gnomad = len(gnomad)
+    gnomad['AC'] = rng.geometric(0.3, n_gnomad)
+    gnomad['Consequence'] = rng.choice(['stop_gained', 'frameshift_variant'], n_gnomad)
+    gnomad['cDNA_position'] = rng.integers(1, 5000, n_gnomad).astype(float)
+
+    n_shared = int(n_clinvar * overlap)
+    clinvar = pd.concat([gnomad[['CHROM', 'POS', 'REF', 'ALT']].sample(n_shared, random_state=seed),
+                         random_variants(n_clinvar - n_shared)], ignore_index=True).drop_duplicates(ignore_index=True)
+    n_clinvar = len(clinvar)
+    clinvar['CLNSIG'] = rng.choice(['Pathogenic', 'Likely_pathogenic'], n_clinvar)
+    clinvar['Consequence'] = 'stop_gained'
+    clinvar['cDNA_position'] = rng.integers(1, 5000, n_clinvar).astype(float)
+    return gnomad, clinvar.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def make_lookup_tables(n_transcripts: int = 20000, seed: int = 0) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Generate gnomAD constraint and GTEx expression tables for the transcripts of `make_variant_table`.
+    Transcript IDs carry version suffixes, about 10% of the transcripts are missing from each table
+    and unrelated transcripts are added, as in the real files.
+
+    Args:
+        n_transcripts (int): Number of distinct transcripts of the variant table. Default is 20000.
+        seed (int): Random seed. Default is 0.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: Constraint table ('transcript', 'lof.oe_ci.upper', 'num_coding_exons')
+            and expression table ('ID_transcript', 'Max_median_expression').
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.arange(2 * n_transcripts)
+    constraint_ids = rng.permutation(ids[rng.random(len(ids)) < 0.9])
+    expression_ids = rng.permutation(ids[rng.random(len(ids)) < 0.9])
+    constraint = pd.DataFrame({
+        'transcript': [f'ENST{idx:011d}.{1 + idx % 7}' for idx in constraint_ids],
+        'lof.oe_ci.upper': rng.uniform(0.03, 2, len(constraint_ids)).round(3),
+        'num_coding_exons': rng.integers(1, 60, len(constraint_ids)),
+    })
+    expression = pd.DataFrame({
+        'ID_transcript': [f'ENST{idx:011d}.{1 + idx % 5}' for idx in expression_ids],
+        'Max_median_expression': rng.exponential(10, len(expression_ids)).round(2),
+    })
+    return constraint, expression
+
+
+def make_transcript_fasta(output_file: str, transcript_lengths: Dict[str, int], seed: int = 0) -> str:
+    """
+    Write a FASTA file of random transcript sequences with gencode-like headers
+    ('>ENST00000423902.7|ENSG...|...'), 60 bases per line. The file is gzipped if its name ends with '.gz'.
+
+    Args:
+        output_file (str): Path to the output '.fa' or '.fa.gz' file.
+        transcript_lengths (Dict[str, int]): Length of every transcript by version-less transcript ID.
+        seed (int): Random seed. Default is 0.
+
+    Returns:
+        str: Path to the output file.
+    """
+    rng = np.random.default_rng(seed)
+    bases = np.frombuffer(b'ACGT', dtype=np.uint8)
+    fasta = gzip.open(output_file, 'wt', compresslevel=1) if output_file.endswith('.gz') else open(output_file, 'w')
+    with fasta:
+        for idx, (transcript_id, length) in enumerate(transcript_lengths.items()):
+            sequence = bases[rng.integers(0, 4, length)].tobytes().decode()
+            fasta.write(f'>{transcript_id}.{1 + idx % 9}|ENSG{idx:011d}.1|-|-|T{idx}-201|G{idx}|{length}|protein_coding|\n')
+            fasta.writelines(sequence[start:start + 60] + '\n' for start in range(0, length, 60))
+    return output_file
+
+
+def make_gtex_tables(output_dir: str, n_transcripts: int = 20000, n_samples: int = 2000, n_tissues: int = 30,
+                     seed: int = 0) -> Tuple[str, str]:
+    """
+    Write a GTEx-like transcript TPM table ('transcript_id', 'gene_id' and one column per sample) and the sample
+    annotation ('SAMPID', 'SMTS'). Tissues have different numbers of samples, some of them a single one, and about
+    1% of the samples are missing from the annotation, as in the real files.
+
+    Args:
+        output_dir (str): Output directory.
+        n_transcripts (int): Number of transcripts. Default is 20000.
+        n_samples (int): Number of samples. Default is 2000.
+        n_tissues (int): Number of tissues. Default is 30.
+        seed (int): Random seed. Default is 0.
+
+    Returns:
+        Tuple[str, str]: Paths to the TPM table and the annotation.
+    """
+    rng = np.random.default_rng(seed)
+    samples = [f'GTEX-{idx:05d}-SM-{idx % 97:04d}' for idx in range(n_samples)]
+    tissue_weights = rng.pareto(1.0, n_tissues) + 0.01
+    tissues = rng.choice([f'Tissue {idx}' for idx in range(n_tissues)], n_samples,
+                         p=tissue_weights / tissue_weights.sum())
+    annotated = rng.random(n_samples) > 0.01
+    annotation_file = os.path.join(output_dir, 'sample_names_annotation.csv')
+    pd.DataFrame({'SAMPID': np.array(samples)[annotated], 'SMTS': tissues[annotated]}).to_csv(annotation_file,
+                                                                                              index=False)
+
+    gtex_file = os.path.join(output_dir, 'GTEx_table.csv')
+    with open(gtex_file, 'w') as output_file:
+        output_file.write('\t'.join(['transcript_id', 'gene_id'] + samples) + '\n')
+        for start in range(0, n_transcripts, 1000):
+            ids = np.arange(start, min(start + 1000, n_transcripts))
+            # Most transcripts are barely expressed, a few are expressed in every tissue
+            tpm = rng.exponential(rng.exponential(5, (len(ids), 1)), (len(ids), n_samples))
+            tpm[rng.random(tpm.shape) < 0.3] = 0
+            rows = pd.DataFrame(tpm.round(2), columns=samples)
+            rows.insert(0, 'gene_id', [f'ENSG{idx // 4:011d}.{1 + idx % 3}' for idx in ids])
+            rows.insert(0, 'transcript_id', [f'ENST{idx:011d}.{1 + idx % 5}' for idx in ids])
+            rows.to_csv(output_file, sep='\t', index=False, header=False)
+    return gtex_file, annotation_file
@@ -2,49 +2,64 @@ from typing import List, Tuple, Union
 
 import numpy as np
 import pandas as pd
-from scipy.stats import chi2_contingency, stats
+from scipy.stats import stats
 from statsmodels.stats.multitest import multipletests
 
+from context_statistics import chi2_2xk, count_nucleotides
+from sequence_store import get_transcript_store
+
 transitions = [('A', 'G'), ('G', 'A'), ('C', 'T'), ('T', 'C')]
 transversions = [('A', 'C'), ('C', 'A'), ('A', 'T'), ('T', 'A'),
                  ('G', 'C'), ('C', 'G'), ('G', 'T'), ('T', 'G')]
+complement_bases = {'A': 'T', 'T': 'A', 'C': 'G', 'G': 'C'}
 
 
 def get_context(df: pd.DataFrame, transcript_fasta: dict, left_len: int, right_len: int) -> str:
     """
     Add sequences context to the dataframe.
+    Contexts of all variants are gathered at once from a `TranscriptStore`; if a pyfaidx `Fasta` or a dictionary
+    is given, the transcripts of the dataframe are loaded into a store first.
 
     Args:
         df (pd.DataFrame): The dataframe containing transcript and position information.
-        transcript_fasta (dict): A dictionary containing transcript sequences.
+        transcript_fasta (dict): A dictionary containing transcript sequences or a `TranscriptStore`.
         left_len (int): The length of the left flanking region.
         right_len (int): The length of the right flanking region.
 
     Returns:
         str: A message indicating that contexts have been added to the dataframe.
     """
-    contexts = []
+    store = get_transcript_store(transcript_fasta, df['Canonical_transcript'])
+    df['Context'] = store.get_windows(df['Canonical_transcript'], df['cDNA_position'], left_len, right_len)
+    message = 'Contexts have been added to the dataframe!'
 
-    for index, row in df.iterrows():
-        transcript_id = row['Canonical_transcript']
-        position_of_interest = row['cDNA_position']
+    return message
 
-        if transcript_id in transcript_fasta:
-            transcript_length = len(transcript_fasta[transcript_id])
 
-            if left_len < position_of_interest < transcript_length - right_len:
-                sequence_of_interest = str(transcript_fasta[transcript_id][position_of_interest - left_len: position_of_interest + right_len])
-            else:
-                sequence_of_interest = None
-        else:
-            sequence_of_interest = None
-        
-        contexts.append(sequence_of_interest)
+def get_strand(df: pd.DataFrame, transcript_fasta: dict, center: int = 12) -> pd.Series:
+    """
+    Vectorized `check_ref`: checks for all variants at once if the reference matches the target letter
+    in the context and determines whether the variant is on the + or - strand.
 
-    df['Context'] = contexts
-    message = 'Contexts have been added to the dataframe!'
+    Args:
+        df (pd.DataFrame): The dataframe with 'Canonical_transcript', 'cDNA_position', 'Context' and 'REF' columns.
+        transcript_fasta (dict): A dictionary containing transcript sequences or a `TranscriptStore`.
+        center (int): Index of the variant in the context. Default is 12 (as for `get_context(df, ..., 13, 12)`).
 
-    return message
+    Returns:
+        pd.Series: '+' if the reference matches the transcript base, '-' if it is complementary to it,
+            'Not_defined' otherwise (also for unknown transcripts and missing contexts).
+    """
+    store = get_transcript_store(transcript_fasta, df['Canonical_transcript'])
+    fasta_base = store.get_bases(df['Canonical_transcript'], df['cDNA_position'])
+    context_base = df['Context'].str[center].fillna('').to_numpy(dtype=str)
+    ref = df['REF'].astype(str)
+    matches = (context_base == fasta_base) & (fasta_base != '')
+
+    strand = np.where(matches & (context_base == ref.to_numpy(dtype=str)), '+',
+                      np.where(matches & (context_base == ref.map(complement_bases).fillna('').to_numpy(dtype=str)),
+                               '-', 'Not_defined'))
+    return pd.Series(strand, index=df.index, dtype=object)
 
 
 def check_ref(row: pd.Series, transcript_fasta: dict) -> str:
@@ -66,8 +81,6 @@ def check_ref(row: pd.Series, transcript_fasta: dict) -> str:
     variant = str(row['Context'][12])
     ref = row['REF']
 
-    complement_bases = {'A': 'T', 'T': 'A', 'C': 'G', 'G': 'C'}
-
     if transcript_id in transcript_fasta:
         fasta_sequence = str(transcript_fasta[transcript_id][int(cDNA_position) - 1])
 
@@ -95,7 +108,6 @@ def get_codon_info(row: pd.Series) -> Union[Tuple[int, str, str], Tuple[str, str
     context = row['Context']
     strand = row['Strand']
     alt = row['ALT']
-    complement_bases = {'A': 'T', 'T': 'A', 'C': 'G', 'G': 'C'}
 
     if strand == '+':
         updated_context = context[:12] + alt + context[13:]
@@ -157,6 +169,7 @@ def filter_and_convert_to_list(column: pd.Series) -> List[str]:
 def calculate_chi2_p_values(context_ben: (List[str]), context_pat: (List[str])) -> Tuple[List[float], List[float]]:
     """
     Calculate chi-squared values and p-values (with FDR) for two sets of context sequences.
+    To test many sets at once with FDR over all of them, use `context_statistics.calculate_chi2_batch`.
 
     Args:
         context_ben (List[str]): List of context sequences for benign samples.
@@ -165,49 +178,7 @@ def calculate_chi2_p_values(context_ben: (List[str]), context_pat: (List[str]))
     Returns:
         Tuple[List[float], List[float]]: Chi-squared values and p-values.
     """
-    sequences_array_ben = np.array(context_ben)
-    sequences_array_pat = np.array(context_pat)
-
-    freq_array_ben = np.zeros((len(sequences_array_ben[0]), 4))
-    freq_array_pat = np.zeros((len(sequences_array_pat[0]), 4))
-
-    for seq in sequences_array_ben:
-        for j, nt in enumerate(seq):
-            if nt == 'A':
-                freq_array_ben[j][0] += 1
-            elif nt == 'C':
-                freq_array_ben[j][1] += 1
-            elif nt == 'G':
-                freq_array_ben[j][2] += 1
-            elif nt == 'T':
-                freq_array_ben[j][3] += 1
-
-    for seq in sequences_array_pat:
-        for j, nt in enumerate(seq):
-            if nt == 'A':
-                freq_array_pat[j][0] += 1
-            elif nt == 'C':
-                freq_array_pat[j][1] += 1
-            elif nt == 'G':
-                freq_array_pat[j][2] += 1
-            elif nt == 'T':
-                freq_array_pat[j][3] += 1
-
-    chi2_values = []
-    p_values = []
-
-    for i in range(freq_array_pat.shape[0]):
-        contingency_table = np.array([freq_array_pat[i], freq_array_ben[i]])
-        try:
-            chi2, p_value, _, _ = chi2_contingency(contingency_table)
-        except ValueError as e:
-            # pseudo p-value in case of error
-            chi2_values.append(np.nan)
-            p_values.append(1.0)
-        else:
-            chi2_values.append(chi2)
-            p_values.append(p_value)
-
+    chi2_values, p_values = chi2_2xk(count_nucleotides(context_pat), count_nucleotides(context_ben))
     _, p_values_corrected, _, _ = multipletests(p_values, method='fdr_bh')
 
-    return chi2_values,  p_values_corrected
+    return list(chi2_values), p_values_corrected
@@ -0,0 +1,155 @@
+from typing import Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from analysis_functions import get_codon_info, transitions, transversions
+
+stop_codons = ['TAA', 'TAG', 'TGA']
+
+# Complement of every byte (letters other than A/C/G/T are kept)
+complement_table = np.arange(256, dtype=np.uint8)
+for base, complement in zip(b'ACGT', b'TGCA'):
+    complement_table[base] = complement
+
+# Transition/transversion class of every (REF, ALT) byte pair: 0 - Other, 1 - Transition, 2 - Transversion
+mutation_classes = np.array(['Other', 'Transition', 'Transversion'], dtype=object)
+mutation_class_table = np.zeros((256, 256), dtype=np.uint8)
+for class_code, pairs in ((1, transitions), (2, transversions)):
+    for ref, alt in pairs:
+        mutation_class_table[ord(ref), ord(alt)] = class_code
+
+
+def to_byte_matrix(sequences: List[str], length: int) -> np.ndarray:
+    """
+    Convert strings of equal length into an (N, length) uint8 array in a single operation.
+
+    Args:
+        sequences (List[str]): ASCII strings, all of length `length`.
+        length (int): Length of the strings.
+
+    Returns:
+        np.ndarray: Byte codes of shape (N, length).
+    """
+    return np.frombuffer(''.join(sequences).encode(), dtype=np.uint8).reshape(len(sequences), length)
+
+
+def codon_codes(matrix: np.ndarray, start: int) -> np.ndarray:
+    """
+    Encode the 3-mers matrix[:, start:start + 3] as integers for lookups.
+
+    Args:
+        matrix (np.ndarray): Byte codes of shape (N, L).
+        start (int): Start of the 3-mers.
+
+    Returns:
+        np.ndarray: Integer codes of shape (N,).
+    """
+    codon = matrix[:, start:start + 3].astype(np.uint32)
+    return (codon[:, 0] << 16) | (codon[:, 1] << 8) | codon[:, 2]
+
+
+def annotate_codons(contexts: Iterable, strands: Iterable, alts: Iterable, center: int = 12) -> pd.DataFrame:
+    """
+    Vectorized `get_codon_info`: replace the reference base of every context by the ALT allele (complemented on
+    the - strand) and find the codon position of the variant that gives a stop codon, for all variants at once.
+
+    Variants with a single-base ALT and contexts of the most common length are processed as byte arrays;
+    other variants (e.g. indels) are passed to `get_codon_info` one by one.
+
+    Args:
+        contexts (Iterable): Context sequences with the variant at index `center`.
+        strands (Iterable): Strands from `check_ref`/`get_strand` ('+', '-' or 'Not_defined').
+        alts (Iterable): ALT alleles.
+        center (int): Index of the variant in the contexts. Default is 12.
+
+    Returns:
+        pd.DataFrame: 'Codon_position' (3, 2 or 1; 'No_stop' or 'No_strand' otherwise), 'Codon' (the original codon)
+            and 'Stop_Codon' (the resulting stop codon, missing if there is none), as returned by `get_codon_info`.
+    """
+    contexts = pd.Series(list(contexts), dtype=object)
+    strands = pd.Series(list(strands), dtype=object)
+    alts = pd.Series(list(alts), dtype=object)
+    n = len(contexts)
+
+    codon_position = np.full(n, 'No_stop', dtype=object)
+    codon = np.full(n, 'No_stop', dtype=object)
+    stop_codon = np.full(n, None, dtype=object)
+
+    no_strand = ~strands.isin(['+', '-']).to_numpy()
+    codon_position[no_strand] = 'No_strand'
+    codon[no_strand] = 'No_strand'
+
+    lengths = contexts.str.len()
+    length = int(lengths[~no_strand].mode().iloc[0]) if (~no_strand).any() else 0
+    batched = ~no_strand & (lengths == length).to_numpy() & (alts.str.len() == 1).to_numpy() & (length >= center + 3)
+
+    if batched.any():
+        context_matrix = to_byte_matrix(list(contexts[batched]), length)
+        alt_bytes = np.frombuffer(''.join(alts[batched]).encode(), dtype=np.uint8)
+        minus = (strands[batched] == '-').to_numpy()
+        updated = context_matrix.copy()
+        updated[:, center] = np.where(minus, complement_table[alt_bytes], alt_bytes)
+
+        stop_codes = codon_codes(to_byte_matrix(stop_codons, 3), 0)
+        found = np.zeros(len(updated), dtype=bool)
+        positions = np.zeros(len(updated), dtype=np.int64)
+        starts = np.zeros(len(updated), dtype=np.int64)
+        # The variant is the 3rd, 2nd or 1st base of the codon; the first match wins, as in `get_codon_info`
+        for position, start in ((3, center - 2), (2, center - 1), (1, center)):
+            is_stop = ~found & np.isin(codon_codes(updated, start), stop_codes)
+            positions[is_stop] = position
+            starts[is_stop] = start
+            found |= is_stop
+
+        rows = np.flatnonzero(batched)[found]
+        windows = starts[found][:, None] + np.arange(3)
+        original = np.take_along_axis(context_matrix[found], windows, axis=1)
+        resulting = np.take_along_axis(updated[found], windows, axis=1)
+        codon_position[rows] = positions[found]
+        codon[rows] = np.ascontiguousarray(original).view('S3').ravel().astype(str)
+        stop_codon[rows] = np.ascontiguousarray(resulting).view('S3').ravel().astype(str)
+
+    for row in np.flatnonzero(~no_strand & ~batched):
+        info = get_codon_info({'Context': contexts[row], 'Strand': strands[row], 'ALT': alts[row]})
+        codon_position[row], codon[row] = info[0], info[1]
+        stop_codon[row] = info[2] if len(info) == 3 else None
+
+    return pd.DataFrame({'Codon_position': codon_position, 'Codon': codon, 'Stop_Codon': stop_codon})
+
+
+def get_codon_info_batch(df: pd.DataFrame, center: int = 12) -> pd.DataFrame:
+    """
+    Codon annotation of a whole dataframe, replacing `df.apply(lambda row: pd.Series(get_codon_info(row)), axis=1)`.
+
+    Args:
+        df (pd.DataFrame): The dataframe with 'Context', 'Strand' and 'ALT' columns.
+        center (int): Index of the variant in the contexts. Default is 12.
+
+    Returns:
+        pd.DataFrame: 'Codon_position', 'Codon' and 'Stop_Codon' columns with the index of `df`.
+    """
+    return annotate_codons(df['Context'], df['Strand'], df['ALT'], center).set_axis(df.index)
+
+
+def classify_mutation_pairs(refs: Iterable, alts: Iterable) -> np.ndarray:
+    """
+    Vectorized `classify_mutation_pair`: classify (REF, ALT) pairs with a lookup table of byte pairs.
+
+    Args:
+        refs (Iterable): Reference alleles.
+        alts (Iterable): Alternative alleles.
+
+    Returns:
+        np.ndarray: 'Transition', 'Transversion' or 'Other' (also for multi-base alleles) for every pair.
+    """
+    refs = pd.Series(list(refs), dtype=object)
+    alts = pd.Series(list(alts), dtype=object)
+    single = ((refs.str.len() == 1) & (alts.str.len() == 1)).to_numpy()
+    classes = np.zeros(len(refs), dtype=np.uint8)
+    if single.any():
+        ref_bytes = np.frombuffer(''.join(refs[single]).encode(), dtype=np.uint8)
+        alt_bytes = np.frombuffer(''.join(alts[single]).encode(), dtype=np.uint8)
+        classes[single] = mutation_class_table[ref_bytes, alt_bytes]
+    return mutation_classes[classes]
+
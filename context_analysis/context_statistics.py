@@ -0,0 +1,236 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2
+from statsmodels.stats.multitest import multipletests
+
+nucleotides = 'ACGT'
+
+# Column of every nucleotide in the one-hot encoding, -1 for other letters (N, lowercase, ...)
+nucleotide_index = np.full(256, -1, dtype=np.int8)
+for idx, nt in enumerate(nucleotides):
+    nucleotide_index[ord(nt)] = idx
+
+
+def one_hot_contexts(contexts: Sequence[str]) -> np.ndarray:
+    """
+    One-hot encode context sequences of equal length in a single operation.
+
+    Args:
+        contexts (Sequence[str]): Context sequences.
+
+    Returns:
+        np.ndarray: Boolean array of shape (N, L, 4) with columns A, C, G, T; other letters are all False.
+
+    Raises:
+        ValueError: If the contexts have different lengths.
+    """
+    if len(contexts) == 0:
+        return np.zeros((0, 0, 4), dtype=bool)
+    length = len(contexts[0])
+    joined = ''.join(contexts).encode()
+    if len(joined) != length * len(contexts):
+        raise ValueError('All contexts must have the same length')
+    codes = nucleotide_index[np.frombuffer(joined, dtype=np.uint8).reshape(len(contexts), length)]
+    return codes[..., None] == np.arange(4, dtype=np.int8)
+
+
+def count_nucleotides(contexts: Sequence[str]) -> np.ndarray:
+    """
+    Count nucleotides at every position of the contexts.
+
+    Args:
+        contexts (Sequence[str]): Context sequences of equal length.
+
+    Returns:
+        np.ndarray: Counts of shape (L, 4) with columns A, C, G, T.
+    """
+    return one_hot_contexts(contexts).sum(axis=0)
+
+
+def chi2_statistic(tables: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pearson chi-square statistics of a batch of contingency tables.
+
+    Args:
+        tables (np.ndarray): Counts of shape (..., r, k).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Statistics of shape (...), in which cells with a zero expected frequency
+            do not contribute, and a mask of tables without such cells.
+    """
+    tables = tables.astype(float)
+    total = tables.sum(axis=(-2, -1), keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected = tables.sum(axis=-1, keepdims=True) * tables.sum(axis=-2, keepdims=True) / total
+        cells = np.where(expected > 0, (tables - expected) ** 2 / expected, 0)
+    return cells.sum(axis=(-2, -1)), (expected > 0).all(axis=(-2, -1))
+
+
+def chi2_2xk(counts_a: np.ndarray, counts_b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pearson chi-square tests of independence of 2 x k contingency tables in one batched pass.
+    Every pair of rows of `counts_a` and `counts_b` is one table, as in `scipy.stats.chi2_contingency`
+    (without Yates' correction, which scipy applies only to 2 x 2 tables).
+
+    Args:
+        counts_a (np.ndarray): Counts of the first group, shape (..., k).
+        counts_b (np.ndarray): Counts of the second group, same shape.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Chi-square values and p-values of shape (...). Tables with a zero
+            expected frequency (a nucleotide absent from both groups) get NaN chi-square and p-value 1.0,
+            as `calculate_chi2_p_values` did for the error raised by scipy.
+    """
+    statistic, valid = chi2_statistic(np.stack([counts_a, counts_b], axis=-2))
+    dof = np.shape(counts_a)[-1] - 1
+
+    chi2_values = np.where(valid, statistic, np.nan)
+    p_values = np.where(valid, chi2.sf(statistic, dof), 1.0)
+    return chi2_values, p_values
+
+
+def calculate_chi2_batch(groups: Dict[str, Tuple[List[str], List[str]]]) -> pd.DataFrame:
+    """
+    Per-position chi-square tests for many groups of contexts at once
+    (e.g. codon position 1/2/3 x NMD escape/undergo), with FDR correction over the whole batch.
+
+    Args:
+        groups (Dict[str, Tuple[List[str], List[str]]]): Benign and pathogenic contexts by group name.
+            All contexts of a group must have the same length.
+
+    Returns:
+        pd.DataFrame: One row per group and position (1-based) with chi-square, p-value and
+            FDR-corrected (Benjamini-Hochberg) p-value over all tests of the batch.
+    """
+    results = []
+    for name, (context_ben, context_pat) in groups.items():
+        chi2_values, p_values = chi2_2xk(count_nucleotides(context_pat), count_nucleotides(context_ben))
+        results.append(pd.DataFrame({
+            'Group': name,
+            'Position': np.arange(1, len(chi2_values) + 1),
+            'Chi2': chi2_values,
+            'P_value': p_values,
+        }))
+    batch = pd.concat(results, ignore_index=True)
+    if len(batch):
+        batch['P_value_FDR'] = multipletests(batch['P_value'], method='fdr_bh')[1]
+    else:
+        batch['P_value_FDR'] = pd.Series(dtype=float)
+    return batch
+
+
+def shuffle_within_strata(labels: np.ndarray, strata: np.ndarray, n_permutations: int,
+                          rng: np.random.Generator) -> np.ndarray:
+    """
+    Shuffle labels independently within every stratum (gene), for many permutations at once.
+
+    Args:
+        labels (np.ndarray): Labels of shape (N,).
+        strata (np.ndarray): Integer stratum codes of shape (N,).
+        n_permutations (int): Number of permutations.
+        rng (np.random.Generator): Random generator.
+
+    Returns:
+        np.ndarray: Permuted labels of shape (n_permutations, N); every stratum keeps its own labels.
+    """
+    by_stratum = np.argsort(strata, kind='stable')
+    # Sorting random keys inside stratum blocks gives an independent shuffle of every block
+    keys = rng.random((n_permutations, len(labels)))
+    shuffled = np.lexsort((keys, np.broadcast_to(strata[by_stratum], keys.shape)), axis=-1)
+    permuted = np.empty((n_permutations, len(labels)), dtype=labels.dtype)
+    permuted[:, by_stratum] = labels[by_stratum][shuffled]
+    return permuted
+
+
+def count_permutation_exceedances(one_hot: np.ndarray, labels: np.ndarray, strata: np.ndarray,
+                                  observed: np.ndarray, n_permutations: int,
+                                  seed: np.random.SeedSequence) -> np.ndarray:
+    """
+    Count permutations with per-position chi-square statistics at least as large as the observed ones
+    (run in a worker process). Counts of all permutations are computed with one matrix product.
+
+    Args:
+        one_hot (np.ndarray): One-hot contexts of shape (N, L, 4).
+        labels (np.ndarray): Boolean labels (True for pathogenic) of shape (N,).
+        strata (np.ndarray): Integer stratum codes of shape (N,).
+        observed (np.ndarray): Observed statistics of shape (L,).
+        n_permutations (int): Number of permutations.
+        seed (np.random.SeedSequence): Seed of the permutations.
+
+    Returns:
+        np.ndarray: Number of permutations with a statistic >= the observed one, per position.
+    """
+    n, length, _ = one_hot.shape
+    flat = one_hot.reshape(n, length * 4).astype(np.float32)
+    permuted = shuffle_within_strata(labels, strata, n_permutations, np.random.default_rng(seed))
+
+    counts_a = (permuted.astype(np.float32) @ flat).reshape(n_permutations, length, 4)
+    counts_b = flat.sum(axis=0).reshape(length, 4) - counts_a
+    statistic, _ = chi2_statistic(np.stack([counts_a, counts_b], axis=-2))
+    # Tolerance for float rounding of statistics equal to the observed one
+    return (statistic >= observed - 1e-9 * np.maximum(observed, 1)).sum(axis=0)
+
+
+def permutation_chi2_test(context_ben: List[str], context_pat: List[str],
+                          genes_ben: Optional[Sequence[str]] = None, genes_pat: Optional[Sequence[str]] = None,
+                          n_permutations: int = 10000, batch_size: int = 1000,
+                          processes: Optional[int] = 1, seed: int = 42) -> pd.DataFrame:
+    """
+    Permutation test of per-position context differences between pathogenic and benign variants.
+    Pathogenic/benign labels are shuffled within genes (the matched per-gene sampling of the datasets is
+    kept in every permutation), per-position chi-square statistics of all permutations of a batch are computed
+    with vectorized counting, and batches run in a process pool. Cells with a zero expected frequency do not
+    contribute to the statistic, so sparse positions get a valid p-value instead of the asymptotic fallback of 1.0.
+
+    The result is reproducible for a given `seed` and `batch_size` regardless of the number of processes,
+    since every batch gets its own seed spawned from `seed`.
+
+    Args:
+        context_ben (List[str]): Context sequences of benign variants.
+        context_pat (List[str]): Context sequences of pathogenic variants.
+        genes_ben (Sequence[str], optional): Gene of every benign variant. Defaults to None (no strata).
+        genes_pat (Sequence[str], optional): Gene of every pathogenic variant. Defaults to None.
+        n_permutations (int): Number of permutations. Default is 10000.
+        batch_size (int): Number of permutations counted at once (and per task). Default is 1000.
+        processes (int, optional): Number of worker processes; 1 runs in the current process,
+            None uses all CPUs. Default is 1.
+        seed (int): Random seed. Default is 42.
+
+    Returns:
+        pd.DataFrame: One row per position (1-based): observed chi-square, asymptotic p-value
+            (with the degrees of freedom of the observed nucleotides), permutation p-value ((1 + exceedances) / (1 + n_permutations)) and its FDR-corrected value.
+    """
+    one_hot = one_hot_contexts(list(context_pat) + list(context_ben))
+    labels = np.zeros(len(one_hot), dtype=bool)
+    labels[:len(context_pat)] = True
+    if genes_ben is None or genes_pat is None:
+        strata = np.zeros(len(one_hot), dtype=np.int64)
+    else:
+        strata = pd.factorize(np.concatenate([np.asarray(genes_pat), np.asarray(genes_ben)]))[0]
+
+    counts = one_hot.sum(axis=0)
+    counts_pat = one_hot[labels].sum(axis=0)
+    observed, _ = chi2_statistic(np.stack([counts_pat, counts - counts_pat], axis=-2))
+    # Nucleotides absent from a position do not add degrees of freedom
+    dof = (counts > 0).sum(axis=-1) - 1
+
+    sizes = [min(batch_size, n_permutations - start) for start in range(0, n_permutations, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(one_hot, labels, strata, observed, size, task_seed) for size, task_seed in zip(sizes, seeds)]
+    if processes == 1:
+        exceedances = sum(count_permutation_exceedances(*task) for task in tasks)
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            exceedances = sum(executor.map(count_permutation_exceedances, *zip(*tasks)))
+
+    p_values = (1 + exceedances) / (1 + n_permutations)
+    return pd.DataFrame({
+        'Position': np.arange(1, len(observed) + 1),
+        'Chi2': observed,
+        'P_value_asymptotic': np.where(dof > 0, chi2.sf(observed, np.maximum(dof, 1)), 1.0),
+        'P_value_permutation': p_values,
+        'P_value_FDR': multipletests(p_values, method='fdr_bh')[1],
+    })
@@ -0,0 +1,135 @@
+import gzip
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# Converters for the VCF INFO field types
+info_type_converters: Dict[str, Callable[[str], Any]] = {
+    'Integer': int,
+    'Float': float,
+    'String': str,
+    'Character': str,
+}
+
+# Parser for the ##INFO header lines
+info_header_pattern = re.compile(r'^##INFO=<ID=([^,>]+),Number=([^,>]+),Type=([^,>]+)')
+
+
+class InfoDecoder:
+    """
+    Single-pass decoder of the VCF INFO column, built once from the ##INFO header lines.
+
+    The INFO string is split on ';' once and every element is looked up in a dictionary of requested keys,
+    so the cost does not depend on the number of requested keys. Values are converted according to the header
+    types (Integer/Float/String/Flag) only when typed decoding is requested.
+    """
+
+    def __init__(self, info_types: Dict[str, str], info_numbers: Optional[Dict[str, str]] = None,
+                 keys: Optional[Iterable[str]] = None) -> None:
+        """
+        Args:
+            info_types (Dict[str, str]): INFO key to header type ('Integer', 'Float', 'String', 'Character' or 'Flag').
+            info_numbers (Dict[str, str], optional): INFO key to header Number ('1', 'A', 'R', '.', ...).
+                Keys with Number other than '0' or '1' are decoded into lists. Defaults to '1' for all keys.
+            keys (Iterable[str], optional): Keys to decode. Defaults to all keys from `info_types`.
+        """
+        self.info_types = info_types
+        self.info_numbers = info_numbers or {}
+        self.keys = frozenset(keys if keys is not None else info_types)
+
+    @classmethod
+    def from_header(cls, header_lines: Iterable[str], keys: Optional[Iterable[str]] = None) -> 'InfoDecoder':
+        """
+        Build a decoder from the VCF header lines.
+
+        Args:
+            header_lines (Iterable[str]): Lines of the VCF header (other than ##INFO lines are ignored).
+            keys (Iterable[str], optional): Keys to decode. Defaults to all keys declared in the header.
+
+        Returns:
+            InfoDecoder: Decoder for the declared INFO fields.
+        """
+        info_types, info_numbers = {}, {}
+        for line in header_lines:
+            match = info_header_pattern.match(line)
+            if match:
+                key, number, info_type = match.groups()
+                info_types[key] = info_type
+                info_numbers[key] = number
+        return cls(info_types, info_numbers, keys)
+
+    @classmethod
+    def from_vcf(cls, vcf_file: str, keys: Optional[Iterable[str]] = None) -> 'InfoDecoder':
+        """
+        Build a decoder from the header of a (compressed or plain) VCF file.
+
+        Args:
+            vcf_file (str): Path to the VCF file.
+            keys (Iterable[str], optional): Keys to decode. Defaults to all keys declared in the header.
+
+        Returns:
+            InfoDecoder: Decoder for the declared INFO fields.
+        """
+        return cls.from_header(read_header(vcf_file), keys)
+
+    def decode(self, info: str, keys: Optional[Iterable[str]] = None, typed: bool = True) -> Dict[str, Any]:
+        """
+        Decode the requested keys of an INFO string.
+
+        Args:
+            info (str): Content of the INFO column.
+            keys (Iterable[str], optional): Keys to decode for this call. Defaults to the keys of the decoder.
+            typed (bool): Convert values according to the header types. Default is True;
+                with False the raw strings are returned.
+
+        Returns:
+            Dict[str, Any]: Decoded values of the requested keys present in the INFO string.
+        """
+        wanted = self.keys if keys is None else frozenset(keys)
+        values = {}
+        for element in info.split(';'):
+            key, separator, value = element.partition('=')
+            if key in wanted:
+                values[key] = self.convert(key, value) if typed else value if separator else True
+        return values
+
+    def convert(self, key: str, value: str) -> Any:
+        """
+        Convert a raw INFO value according to the header type and number of the key.
+
+        Args:
+            key (str): INFO key.
+            value (str): Raw value.
+
+        Returns:
+            Any: Converted value (a list for multi-value keys, True for flags, None for missing values).
+        """
+        info_type = self.info_types.get(key, 'String')
+        if info_type == 'Flag':
+            return True
+        converter = info_type_converters.get(info_type, str)
+        if self.info_numbers.get(key, '1') in ('0', '1'):
+            return None if value == '.' else converter(value)
+        return [None if item == '.' else converter(item) for item in value.split(',')]
+
+
+def read_header(vcf_file: str) -> List[str]:
+    """
+    Read the meta-information lines of a VCF file.
+
+    Args:
+        vcf_file (str): Path to the VCF file (gzip/bgzip compressed or plain).
+
+    Returns:
+        List[str]: Header lines starting with '##'.
+    """
+    with open(vcf_file, 'rb') as raw_file:
+        compressed = raw_file.read(2) == b'\x1f\x8b'
+    opener = gzip.open if compressed else open
+
+    header_lines = []
+    with opener(vcf_file, 'rt') as input_file:
+        for line in input_file:
+            if not line.startswith('##'):
+                break
+            header_lines.append(line.rstrip('\n'))
+    return header_lines
@@ -0,0 +1,323 @@
+import csv
+import gzip
+import io
+import os
+import shutil
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+# Supported output compression modes
+compression_modes = (None, 'gzip', 'bgzip')
+
+# Supported output formats
+output_formats = ('tsv', 'parquet')
+
+# Values treated as missing when converting parsed strings to numbers
+missing_values = ('', '.', None)
+
+
+class TableWriter:
+    """
+    Buffered TSV writer that keeps a single output handle open for the whole parsing run.
+
+    Rows are collected in an in-memory text buffer and written to the file in batches of `flush_size` rows.
+    Output can be written as plain text, gzip or bgzip (BGZF, readable by tabix/samtools).
+    """
+
+    def __init__(self, output_file: str, header: Optional[List[str]] = None,
+                 flush_size: int = 10000, compression: Optional[str] = None) -> None:
+        """
+        Args:
+            output_file (str): Path to the output TSV file.
+            header (List[str], optional): Column names written as the first line. Defaults to no header.
+            flush_size (int): Number of rows buffered in memory before they are written to the file. Default is 10000.
+            compression (str, optional): None for plain text, 'gzip' or 'bgzip'. Default is None.
+        """
+        if compression not in compression_modes:
+            raise ValueError(f'Unknown compression mode: {compression}. Choose one of {compression_modes}')
+        if flush_size < 1:
+            raise ValueError('flush_size must be a positive integer')
+
+        self.output_file = output_file
+        self.header = header
+        self.flush_size = flush_size
+        self.compression = compression
+        self.rows_written = 0
+        self._handle = None
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, delimiter='\t')
+        self._buffered_rows = 0
+
+    def __enter__(self) -> 'TableWriter':
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def open(self) -> None:
+        """
+        Open the output handle and write the header line.
+        """
+        if self.compression == 'gzip':
+            self._handle = gzip.open(self.output_file, 'wb')
+        elif self.compression == 'bgzip':
+            import pysam
+            self._handle = pysam.BGZFile(self.output_file, 'wb')
+        else:
+            self._handle = open(self.output_file, 'wb')
+
+        if self.header:
+            self._writer.writerow(self.header)
+            self.flush()
+
+    def write_row(self, row: List) -> None:
+        """
+        Add a single row to the buffer, flushing it to the file when it is full.
+
+        Args:
+            row (List): Values of the row.
+        """
+        self._writer.writerow(row)
+        self._buffered_rows += 1
+        if self._buffered_rows >= self.flush_size:
+            self.flush()
+
+    def write_rows(self, rows: Iterable[List]) -> None:
+        """
+        Add several rows to the buffer.
+
+        Args:
+            rows (Iterable[List]): Rows to be written.
+        """
+        for row in rows:
+            self.write_row(row)
+
+    def flush(self) -> None:
+        """
+        Write all buffered rows to the output file.
+        """
+        data = self._buffer.getvalue()
+        if data:
+            self._handle.write(data.encode('utf-8'))
+        self.rows_written += self._buffered_rows
+        self._buffered_rows = 0
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+    def copy_from(self, input_file: str) -> None:
+        """
+        Append the content of an uncompressed table (e.g. a part written by a worker process) to the output.
+
+        Args:
+            input_file (str): Path to the table to copy.
+        """
+        self.flush()
+        with open(input_file, 'rb') as table_file:
+            for chunk in iter(lambda: table_file.read(1 << 20), b''):
+                self._handle.write(chunk)
+
+    def close(self) -> None:
+        """
+        Flush the remaining rows and close the output handle.
+        """
+        if self._handle is not None:
+            self.flush()
+            self._handle.close()
+            self._handle = None
+
+
+class ParquetWriter:
+    """
+    Buffered writer of a Parquet dataset partitioned by chromosome, with the same interface as `TableWriter`.
+
+    Rows are collected in memory and written as Arrow record batches of `flush_size` rows to
+    `<output_dir>/<partition_column>=<value>/part-0.parquet` (hive partitioning), so readers can select columns
+    and skip chromosomes without reading them. Column types are given by name: 'string', 'category'
+    (dictionary-encoded string), 'int32', 'int64', 'float32' or 'float64'.
+    """
+
+    def __init__(self, output_dir: str, header: List[str], column_types: Optional[Dict[str, str]] = None,
+                 partition_column: Optional[str] = None, flush_size: int = 100000) -> None:
+        """
+        Args:
+            output_dir (str): Path to the dataset directory. An existing directory is replaced.
+            header (List[str]): Column names of the rows.
+            column_types (Dict[str, str], optional): Column name to type name. Columns not listed are strings.
+            partition_column (str, optional): Column used for partitioning, e.g. chromosome. Default is no partitioning.
+            flush_size (int): Number of rows in a record batch. Default is 100000.
+        """
+        if flush_size < 1:
+            raise ValueError('flush_size must be a positive integer')
+
+        self.output_dir = output_dir
+        self.header = header
+        self.column_types = column_types or {}
+        self.partition_column = partition_column
+        self.flush_size = flush_size
+        self.rows_written = 0
+        self._rows = []
+        self._writers = {}
+        self._schema = None
+
+    def __enter__(self) -> 'ParquetWriter':
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def open(self) -> None:
+        """
+        Create the dataset directory and the Arrow schema.
+        """
+        import pyarrow as pa
+
+        arrow_types = {
+            'string': pa.string(), 'category': pa.dictionary(pa.int32(), pa.string()),
+            'int32': pa.int32(), 'int64': pa.int64(), 'float32': pa.float32(), 'float64': pa.float64()
+        }
+        if os.path.isdir(self.output_dir):
+            shutil.rmtree(self.output_dir)
+        os.makedirs(self.output_dir)
+        self._schema = pa.schema([(column, arrow_types[self.column_types.get(column, 'string')])
+                                  for column in self.header if column != self.partition_column])
+
+    def write_row(self, row: List) -> None:
+        """
+        Add a single row to the buffer, writing a record batch when it is full.
+
+        Args:
+            row (List): Values of the row in `header` order.
+        """
+        self._rows.append(row)
+        if len(self._rows) >= self.flush_size:
+            self.flush()
+
+    def write_rows(self, rows: Iterable[List]) -> None:
+        """
+        Add several rows to the buffer.
+
+        Args:
+            rows (Iterable[List]): Rows to be written.
+        """
+        for row in rows:
+            self.write_row(row)
+
+    def flush(self) -> None:
+        """
+        Write the buffered rows as one record batch per partition.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self._rows:
+            return
+
+        partitions = {}
+        if self.partition_column is None:
+            partitions[None] = self._rows
+        else:
+            partition_index = self.header.index(self.partition_column)
+            for row in self._rows:
+                partitions.setdefault(row[partition_index], []).append(row)
+
+        for partition, rows in partitions.items():
+            columns = dict(zip(self.header, zip(*rows)))
+            arrays = [pa.array(convert_column(columns[field.name], self.column_types.get(field.name, 'string')),
+                               type=field.type)
+                      for field in self._schema]
+            if partition not in self._writers:
+                partition_dir = self.output_dir
+                if self.partition_column is not None:
+                    partition_dir = os.path.join(self.output_dir, f'{self.partition_column}={partition}')
+                    os.makedirs(partition_dir, exist_ok=True)
+                self._writers[partition] = pq.ParquetWriter(os.path.join(partition_dir, 'part-0.parquet'),
+                                                            self._schema)
+            self._writers[partition].write_batch(pa.RecordBatch.from_arrays(arrays, schema=self._schema))
+
+        self.rows_written += len(self._rows)
+        self._rows = []
+
+    def close(self) -> None:
+        """
+        Write the remaining rows and close the Parquet files.
+        """
+        if self._schema is not None:
+            self.flush()
+            for writer in self._writers.values():
+                writer.close()
+            self._writers = {}
+            self._schema = None
+
+
+def convert_column(values: Iterable[Any], column_type: str) -> List[Any]:
+    """
+    Convert parsed values of a column to Python objects of the column type. Missing values become None.
+
+    Args:
+        values (Iterable[Any]): Parsed values (strings or numbers).
+        column_type (str): Type name: 'string', 'category', 'int32', 'int64', 'float32' or 'float64'.
+
+    Returns:
+        List[Any]: Converted values.
+    """
+    if column_type.startswith('int'):
+        return [None if value in missing_values else int(value) for value in values]
+    if column_type.startswith('float'):
+        return [None if value in missing_values else float(value) for value in values]
+    return [None if value is None else str(value) for value in values]
+
+
+def read_parquet_table(dataset_dir: str, columns: Optional[List[str]] = None,
+                       filters: Optional[List[tuple]] = None) -> pd.DataFrame:
+    """
+    Read a Parquet dataset written by `ParquetWriter` into a dataframe, reading only the selected columns
+    and the row groups and partitions matching the filters.
+
+    Args:
+        dataset_dir (str): Path to the dataset directory.
+        columns (List[str], optional): Columns to read. Defaults to all columns.
+        filters (List[tuple], optional): Predicates in the pyarrow format, e.g. [('Chr', '==', 'chr1'), ('AC', '>', 10)].
+
+    Returns:
+        pd.DataFrame: Selected rows and columns; dictionary-encoded columns become categoricals.
+    """
+    return pd.read_parquet(dataset_dir, columns=columns, filters=filters)
+
+
+def get_output_file(vcf_file: str, output_dir: str = '', output_filename: str = '',
+                    compression: Optional[str] = None, output_format: str = 'tsv') -> str:
+    """
+    Build the path to the output table of a parser.
+
+    Args:
+        vcf_file (str): Path to the input VCF file.
+        output_dir (str): Directory to save the output file. Default is current working directory.
+        output_filename (str): Name of the output file. Defaults to the input VCF filename with '.tsv' extension.
+        compression (str, optional): Output compression mode, adds the '.gz' extension if set. Default is None.
+        output_format (str): 'tsv' or 'parquet'; Parquet datasets get the '.parquet' extension instead of '.tsv'.
+
+    Returns:
+        str: Path to the output file.
+    """
+    if output_format not in output_formats:
+        raise ValueError(f'Unknown output format: {output_format}. Choose one of {output_formats}')
+    if not output_dir:
+        output_dir = os.getcwd()
+
+    if output_filename == '':
+        output_filename = os.path.splitext(os.path.basename(vcf_file))[0] + '.tsv'
+    else:
+        if output_filename.endswith('.gz'):
+            output_filename = output_filename[:-len('.gz')]
+        if not output_filename.endswith('.tsv'):
+            output_filename += '.tsv'
+
+    if output_format == 'parquet':
+        output_filename = output_filename[:-len('.tsv')] + '.parquet'
+    elif compression:
+        output_filename += '.gz'
+
+    return os.path.join(output_dir, output_filename)
@@ -0,0 +1,235 @@
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import cyvcf2
+import pysam
+
+from info_fields import InfoDecoder
+from output_writers import TableWriter
+from parse_vcf_canonical import (
+    canonical_fields, headers, parse_line, parse_vcf, population_names, vcf_columns_dict, vep_names
+)
+from vep_fields import VepDecoder
+
+# Order of non-numeric chromosomes in the merged output
+chromosome_order = {'X': 23, 'Y': 24, 'M': 25, 'MT': 25}
+
+
+def chromosome_key(chrom: str) -> Tuple[int, str]:
+    """
+    Sorting key for chromosome names: chr1, chr2, ..., chr22, chrX, chrY, chrM, then other contigs.
+
+    Args:
+        chrom (str): Chromosome name with or without the 'chr' prefix.
+
+    Returns:
+        Tuple[int, str]: Key for natural chromosome ordering.
+    """
+    name = chrom[3:] if chrom.startswith('chr') else chrom
+    if name.isdigit():
+        return int(name), ''
+    return chromosome_order.get(name, 100), name
+
+
+def get_regions(vcf_file: str, region_size: int = 10_000_000) -> List[Tuple[str, int, int]]:
+    """
+    Split the chromosomes of a bgzipped and tabix-indexed VCF file into regions of a fixed size.
+
+    Args:
+        vcf_file (str): Path to the bgzipped VCF file with a tabix (.tbi) or CSI index.
+        region_size (int): Length of a region in base pairs. Default is 10 Mb.
+
+    Returns:
+        List[Tuple[str, int, int]]: Regions (chromosome, 1-based start, end) in chromosome order.
+    """
+    vcf = cyvcf2.VCF(vcf_file)
+    contig_lengths = dict(zip(vcf.seqnames, vcf.seqlens))
+    with pysam.TabixFile(vcf_file) as tabix_file:
+        indexed_contigs = sorted(tabix_file.contigs, key=chromosome_key)
+
+    regions = []
+    for chrom in indexed_contigs:
+        # Contigs without a length in the header are queried as a whole
+        length = contig_lengths.get(chrom) or 2 ** 31 - 1
+        for start in range(1, length + 1, region_size):
+            regions.append((chrom, start, min(start + region_size - 1, length)))
+    return regions
+
+
+def parse_chromosome_worker(vcf_file: str, part_file: str, flush_size: int) -> Dict:
+    """
+    Parse a single chromosome VCF file into a part file without header (run in a worker process).
+
+    Args:
+        vcf_file (str): Path to the VCF file.
+        part_file (str): Path to the part file.
+        flush_size (int): Number of rows buffered before writing.
+
+    Returns:
+        Dict: Worker statistics: task name, part file, process id, number of rows, input bytes and seconds.
+    """
+    start_time = time.perf_counter()
+    rows = parse_vcf(vcf_file, os.path.dirname(part_file), os.path.basename(part_file), flush_size,
+                     write_header=False)
+    return {
+        'task': os.path.basename(vcf_file), 'part_file': part_file, 'pid': os.getpid(), 'rows': rows,
+        'input_bytes': os.path.getsize(vcf_file), 'seconds': time.perf_counter() - start_time
+    }
+
+
+def parse_region_worker(vcf_file: str, region: Tuple[str, int, int], part_file: str, flush_size: int) -> Dict:
+    """
+    Parse a genomic region of an indexed VCF file into a part file without header (run in a worker process).
+    Records starting before the region (returned by the query because they overlap it) are skipped,
+    so that every record is parsed by exactly one worker.
+
+    Args:
+        vcf_file (str): Path to the bgzipped and indexed VCF file.
+        region (Tuple[str, int, int]): Chromosome, 1-based start and end of the region.
+        part_file (str): Path to the part file.
+        flush_size (int): Number of rows buffered before writing.
+
+    Returns:
+        Dict: Worker statistics: task name, part file, process id, number of records and rows, seconds.
+    """
+    start_time = time.perf_counter()
+    chrom, start, end = region
+    info_decoder = InfoDecoder.from_vcf(vcf_file, population_names)
+    vep_decoder = VepDecoder.from_vcf(vcf_file, canonical_fields + ['CANONICAL'], fallback_names=vep_names)
+
+    records = 0
+    with TableWriter(part_file, flush_size=flush_size) as table_writer:
+        for variant in cyvcf2.VCF(vcf_file)(f'{chrom}:{start}-{end}'):
+            if variant.POS < start:
+                continue
+            records += 1
+            line = str(variant).rstrip('\n').split('\t')
+            if line[vcf_columns_dict['CHROM']].startswith('chr') and line[vcf_columns_dict['FILTER']] == 'PASS':
+                table_writer.write_row(parse_line(line, info_decoder, vep_decoder))
+
+    return {
+        'task': f'{chrom}:{start}-{end}', 'part_file': part_file, 'pid': os.getpid(), 'records': records,
+        'rows': table_writer.rows_written, 'seconds': time.perf_counter() - start_time
+    }
+
+
+def merge_parts(part_files: List[str], output_file: str, compression: Optional[str] = None) -> None:
+    """
+    Concatenate part files in the given order into a single table with header.
+
+    Args:
+        part_files (List[str]): Part files without header, already in output order.
+        output_file (str): Path to the merged output file.
+        compression (str, optional): Output compression: None, 'gzip' or 'bgzip'. Default is None.
+    """
+    with TableWriter(output_file, headers, compression=compression) as table_writer:
+        for part_file in part_files:
+            table_writer.copy_from(part_file)
+
+
+def report_throughput(stats: List[Dict], wall_seconds: float, verbose: bool = False) -> None:
+    """
+    Print rows/sec of every worker process and of the whole run.
+
+    Args:
+        stats (List[Dict]): Statistics returned by the workers.
+        wall_seconds (float): Wall-clock duration of the run.
+        verbose (bool): Also print the statistics of every task. Default is False.
+    """
+    if verbose:
+        for task in stats:
+            print(f'{task["task"]:<28} pid {task["pid"]:<8} {task["rows"]:>10} rows '
+                  f'{task["seconds"]:8.1f} s {task["rows"] / max(task["seconds"], 1e-9):10.0f} rows/s')
+
+    per_worker = {}
+    for task in stats:
+        tasks, rows, seconds = per_worker.get(task['pid'], (0, 0, 0.0))
+        per_worker[task['pid']] = (tasks + 1, rows + task['rows'], seconds + task['seconds'])
+    for pid, (tasks, rows, seconds) in sorted(per_worker.items()):
+        print(f'Worker {pid}: {tasks} tasks, {rows} rows in {seconds:.1f} s ({rows / max(seconds, 1e-9):.0f} rows/s)')
+
+    total_rows = sum(task['rows'] for task in stats)
+    print(f'Total: {total_rows} rows in {wall_seconds:.1f} s ({total_rows / max(wall_seconds, 1e-9):.0f} rows/s) '
+          f'with {len(per_worker)} workers')
+
+
+def parse_chromosomes(vcf_files: List[str], output_file: str, processes: Optional[int] = None,
+                      flush_size: int = 10000, compression: Optional[str] = None,
+                      verbose: bool = False) -> List[Dict]:
+    """
+    Parse per-chromosome VCF files in parallel with `parse_vcf` and merge the results into one sorted table.
+
+    Args:
+        vcf_files (List[str]): Paths to the per-chromosome VCF files (e.g. gnomAD exomes chr1..chr22).
+        output_file (str): Path to the merged output table.
+        processes (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        flush_size (int): Number of rows buffered before writing. Default is 10000.
+        compression (str, optional): Output compression: None, 'gzip' or 'bgzip'. Default is None.
+        verbose (bool): Print the statistics of every task. Default is False.
+
+    Returns:
+        List[Dict]: Statistics of every worker task.
+    """
+    start_time = time.perf_counter()
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output_file)))
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            # Parts are named by task, as input files in different folders may have the same name
+            futures = [executor.submit(parse_chromosome_worker, vcf_file,
+                                       os.path.join(tmp_dir, f'{idx}.part.tsv'), flush_size)
+                       for idx, vcf_file in enumerate(vcf_files)]
+            stats = [future.result() for future in futures]
+
+        # Each chromosome file is sorted, so ordering the parts by their first record gives a sorted table
+        part_keys = {}
+        for task in stats:
+            with open(task['part_file']) as part:
+                first_line = part.readline().split('\t')
+            if len(first_line) > 1:
+                part_keys[task['part_file']] = (chromosome_key(first_line[0]), int(first_line[1]))
+        merge_parts(sorted(part_keys, key=part_keys.get), output_file, compression)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    report_throughput(stats, time.perf_counter() - start_time, verbose)
+    return stats
+
+
+def parse_regions(vcf_file: str, output_file: str, processes: Optional[int] = None,
+                  region_size: int = 10_000_000, flush_size: int = 10000,
+                  compression: Optional[str] = None, verbose: bool = False) -> List[Dict]:
+    """
+    Parse a single bgzipped and tabix-indexed VCF file in parallel by genomic regions
+    and merge the results into one sorted table.
+
+    Args:
+        vcf_file (str): Path to the bgzipped VCF file with a tabix (.tbi) or CSI index.
+        output_file (str): Path to the merged output table.
+        processes (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        region_size (int): Length of a region in base pairs. Default is 10 Mb.
+        flush_size (int): Number of rows buffered before writing. Default is 10000.
+        compression (str, optional): Output compression: None, 'gzip' or 'bgzip'. Default is None.
+        verbose (bool): Print the statistics of every task. Default is False.
+
+    Returns:
+        List[Dict]: Statistics of every worker task, in region order.
+    """
+    start_time = time.perf_counter()
+    regions = get_regions(vcf_file, region_size)
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output_file)))
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(parse_region_worker, vcf_file, region,
+                                       os.path.join(tmp_dir, f'{idx}.part.tsv'), flush_size)
+                       for idx, region in enumerate(regions)]
+            stats = [future.result() for future in futures]
+        merge_parts([task['part_file'] for task in stats], output_file, compression)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    report_throughput(stats, time.perf_counter() - start_time, verbose)
+    return stats
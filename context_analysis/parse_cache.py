@@ -0,0 +1,328 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from output_writers import read_parquet_table
+from parse_vcf_canonical import canonical_fields, parse_vcf, population_names
+from parse_vcf_canonical import parser_version as canonical_parser_version
+from parse_vcf_clinvar import ClinvarFilter, clinvar_record_fields, clinvar_vep_fields, parse_clinvar_vcf
+from parse_vcf_clinvar import parser_version as clinvar_parser_version
+
+# Bytes hashed at the start and at the end of an input file in the 'sample' hash mode
+sample_size = 1 << 20
+
+hash_modes = ('sample', 'full', 'none')
+
+
+def get_directory_size(path: str) -> int:
+    """
+    Total size of the files in a directory tree (or of a single file).
+
+    Args:
+        path (str): Path to a directory or a file.
+
+    Returns:
+        int: Size in bytes.
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+def touch(metadata_file: str) -> None:
+    """
+    Record an access to a cache entry: the modification time of its metadata file is the last access time
+    used for eviction. The time is set explicitly, as file system timestamps may be coarser than accesses.
+
+    Args:
+        metadata_file (str): Path to the metadata file of the entry.
+    """
+    now = time.time_ns()
+    os.utime(metadata_file, ns=(now, now))
+
+
+def fingerprint_file(input_file: str, hash_mode: str = 'sample') -> Dict:
+    """
+    Fingerprint of an input file: absolute path, size, modification time and a content hash.
+
+    Args:
+        input_file (str): Path to the input file.
+        hash_mode (str): 'sample' hashes the first and the last MiB (fast for multi-GB files), 'full' hashes
+            the whole file, 'none' relies on size and modification time only. Default is 'sample'.
+
+    Returns:
+        Dict: Fingerprint fields.
+    """
+    if hash_mode not in hash_modes:
+        raise ValueError(f'Unknown hash mode: {hash_mode}')
+    stat = os.stat(input_file)
+    fingerprint = {'path': os.path.abspath(input_file), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if hash_mode != 'none':
+        digest = hashlib.sha256()
+        with open(input_file, 'rb') as file:
+            if hash_mode == 'full' or stat.st_size <= 2 * sample_size:
+                for block in iter(lambda: file.read(sample_size), b''):
+                    digest.update(block)
+            else:
+                digest.update(file.read(sample_size))
+                file.seek(-sample_size, os.SEEK_END)
+                digest.update(file.read(sample_size))
+        fingerprint['sha256'] = digest.hexdigest()
+    return fingerprint
+
+
+class ParseCache:
+    """
+    Content-addressed on-disk cache of parser results.
+
+    An entry is keyed by the fingerprint of the input file (path, size, mtime and hash), the parser name and
+    version and the parser options (selected fields, filters, ...). Results are stored as Parquet datasets,
+    so a hit is read back as columns without parsing the VCF file again. When the cache grows over `max_bytes`,
+    least recently used entries are removed.
+    """
+
+    def __init__(self, cache_dir: str = os.path.join('~', '.cache', 'genvar'), max_bytes: int = 50 * 2 ** 30,
+                 hash_mode: str = 'sample', verbose: bool = True) -> None:
+        """
+        Args:
+            cache_dir (str): Cache directory. Default is ~/.cache/genvar.
+            max_bytes (int): Maximum total size of the entries. Default is 50 GiB.
+            hash_mode (str): Input hashing: 'sample', 'full' or 'none' (see `fingerprint_file`). Default is 'sample'.
+            verbose (bool): Print every hit, miss and eviction. Default is True.
+        """
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = max_bytes
+        self.hash_mode = hash_mode
+        self.verbose = verbose
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get_key(self, input_file: str, parser_name: str, parser_version: str, options: Dict) -> str:
+        """
+        Cache key of a parser run.
+
+        Args:
+            input_file (str): Path to the input file.
+            parser_name (str): Name of the parser.
+            parser_version (str): Version of the parser output.
+            options (Dict): Options that change the output (functions are identified by their qualified name).
+
+        Returns:
+            str: Hex digest of the key fields.
+        """
+        key_fields = {
+            'input': fingerprint_file(input_file, self.hash_mode),
+            'parser': parser_name,
+            'version': str(parser_version),
+            'options': options,
+        }
+        serialized = json.dumps(key_fields, sort_keys=True,
+                                default=lambda value: getattr(value, '__qualname__', repr(value)))
+        return hashlib.sha256(serialized.encode()).hexdigest()
+
+    def get_or_parse(self, input_file: str, parser_name: str, parser_version: str, options: Dict,
+                     run_parser: Callable[[str], str]) -> str:
+        """
+        Return the path of the cached result, running the parser on a miss.
+
+        Args:
+            input_file (str): Path to the input file.
+            parser_name (str): Name of the parser.
+            parser_version (str): Version of the parser output.
+            options (Dict): Options that change the output.
+            run_parser (Callable[[str], str]): Function that parses the input into the given directory
+                and returns the path of the result inside it.
+
+        Returns:
+            str: Path to the cached result (a Parquet dataset or a table file).
+        """
+        key = self.get_key(input_file, parser_name, parser_version, options)
+        entry_dir = os.path.join(self.cache_dir, key)
+        metadata_file = os.path.join(entry_dir, 'metadata.json')
+
+        if os.path.exists(metadata_file):
+            with open(metadata_file) as file:
+                metadata = json.load(file)
+            touch(metadata_file)
+            self.stats['hits'] += 1
+            if self.verbose:
+                print(f'Cache hit: {parser_name} {os.path.basename(input_file)} ({key[:12]})')
+            return os.path.join(entry_dir, metadata['result'])
+
+        self.stats['misses'] += 1
+        if self.verbose:
+            print(f'Cache miss: {parser_name} {os.path.basename(input_file)} ({key[:12]}), parsing')
+        start_time = time.perf_counter()
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp-')
+        try:
+            result = os.path.relpath(run_parser(tmp_dir), tmp_dir)
+            metadata = {
+                'input': os.path.abspath(input_file), 'parser': parser_name, 'version': str(parser_version),
+                'options': options, 'result': result, 'size': get_directory_size(tmp_dir),
+                'parse_seconds': time.perf_counter() - start_time,
+            }
+            with open(os.path.join(tmp_dir, 'metadata.json'), 'w') as file:
+                json.dump(metadata, file, default=lambda value: getattr(value, '__qualname__', repr(value)))
+            touch(os.path.join(tmp_dir, 'metadata.json'))
+            try:
+                os.replace(tmp_dir, entry_dir)
+            except OSError:
+                # Another process has written the same entry in the meantime
+                if not os.path.exists(metadata_file):
+                    raise
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        self.evict(keep=key)
+        return os.path.join(entry_dir, result)
+
+    def entries(self) -> List[Dict]:
+        """
+        Cache entries with their key, size and last access time, least recently used first.
+
+        Returns:
+            List[Dict]: Entries.
+        """
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            metadata_file = os.path.join(self.cache_dir, key, 'metadata.json')
+            if os.path.exists(metadata_file):
+                with open(metadata_file) as file:
+                    metadata = json.load(file)
+                entries.append({'key': key, 'size': metadata['size'], 'last_access': os.stat(metadata_file).st_mtime_ns,
+                                'input': metadata['input'], 'parser': metadata['parser']})
+        return sorted(entries, key=lambda entry: entry['last_access'])
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """
+        Remove least recently used entries until the cache fits into `max_bytes`.
+
+        Args:
+            keep (str, optional): Key of an entry that is never removed (the one just written). Defaults to None.
+        """
+        entries = self.entries()
+        total = sum(entry['size'] for entry in entries)
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            if entry['key'] == keep:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, entry['key']), ignore_errors=True)
+            total -= entry['size']
+            self.stats['evictions'] += 1
+            if self.verbose:
+                print(f'Cache eviction: {entry["parser"]} {os.path.basename(entry["input"])} ({entry["size"]} bytes)')
+
+    def clear(self) -> None:
+        """
+        Remove all entries.
+        """
+        for entry in self.entries():
+            shutil.rmtree(os.path.join(self.cache_dir, entry['key']), ignore_errors=True)
+
+    def report(self) -> None:
+        """
+        Print hits, misses, evictions and the size of the cache.
+        """
+        entries = self.entries()
+        requests = self.stats['hits'] + self.stats['misses']
+        hit_rate = self.stats['hits'] / requests if requests else 0.0
+        print(f'Cache {self.cache_dir}: {self.stats["hits"]} hits, {self.stats["misses"]} misses '
+              f'({hit_rate:.0%} hit rate), {self.stats["evictions"]} evictions, '
+              f'{len(entries)} entries, {sum(entry["size"] for entry in entries) / 2 ** 20:.1f} MiB')
+
+
+def cached_parse_vcf(vcf_file: str, cache: Optional[ParseCache] = None, columns: Optional[List[str]] = None,
+                     filters: Optional[List[tuple]] = None) -> pd.DataFrame:
+    """
+    `parse_vcf` through the cache: the VCF file is parsed only if it or the parser has changed.
+
+    Args:
+        vcf_file (str): Path to the VCF file.
+        cache (ParseCache, optional): Cache to use. Defaults to a cache in ~/.cache/genvar.
+        columns (List[str], optional): Columns to read from the result. Defaults to all columns.
+        filters (List[tuple], optional): Row filters in the pyarrow format, e.g. [('Chr', '==', 'chr1')].
+
+    Returns:
+        pd.DataFrame: Parsed variants.
+    """
+    def run_parser(output_dir: str) -> str:
+        parse_vcf(vcf_file, output_dir, 'result', output_format='parquet')
+        return os.path.join(output_dir, 'result.parquet')
+
+    cache = cache or ParseCache()
+    options = {'vep_fields': canonical_fields, 'info_fields': list(population_names)}
+    dataset = cache.get_or_parse(vcf_file, 'parse_vcf', canonical_parser_version, options, run_parser)
+    return read_parquet_table(dataset, columns, filters)
+
+
+def cached_parse_clinvar_vcf(vcf_file: str, cache: Optional[ParseCache] = None,
+                             columns: Optional[List[str]] = None,
+                             filters: Optional[List[tuple]] = None,
+                             record_filter: Optional[ClinvarFilter] = None) -> pd.DataFrame:
+    """
+    `parse_clinvar_vcf` through the cache: the VCF file is parsed only if it or the parser has changed.
+
+    Args:
+        vcf_file (str): Path to the ClinVar VCF file.
+        cache (ParseCache, optional): Cache to use. Defaults to a cache in ~/.cache/genvar.
+        columns (List[str], optional): Columns to read from the result. Defaults to all columns.
+        filters (List[tuple], optional): Row filters in the pyarrow format.
+        record_filter (ClinvarFilter, optional): Filter applied while parsing (part of the cache key).
+            Defaults to None.
+
+    Returns:
+        pd.DataFrame: Parsed variants.
+    """
+    def run_parser(output_dir: str) -> str:
+        parse_clinvar_vcf(vcf_file, output_dir, 'result', output_format='parquet', record_filter=record_filter)
+        return os.path.join(output_dir, 'result.parquet')
+
+    cache = cache or ParseCache()
+    options = {'vep_fields': clinvar_vep_fields, 'info_fields': clinvar_record_fields,
+               'record_filter': repr(record_filter)}
+    dataset = cache.get_or_parse(vcf_file, 'parse_clinvar_vcf', clinvar_parser_version, options, run_parser)
+    return read_parquet_table(dataset, columns, filters)
+
+
+def cached_vcf_parsing(vcf_file: str, cache: Optional[ParseCache] = None,
+                       row_filter: Optional[Callable[[List[str]], bool]] = None,
+                       output_format: str = 'tsv') -> str:
+    """
+    `vcf_parsing` of transcript_conservativity/code/vcf_parser.py through the cache: the VCF file is parsed only if
+    it, the parser, the row filter or the output format has changed. vcf_parser.py must be importable (its directory
+    on `sys.path`).
+
+    Args:
+        vcf_file (str): Path to the VCF file.
+        cache (ParseCache, optional): Cache to use. Defaults to a cache in ~/.cache/genvar.
+        row_filter (Callable[[List[str]], bool], optional): Pushdown filter of `vcf_parsing`, e.g. `is_lof_transcript`.
+            It is part of the cache key by its module and name, so it must be a named function. Defaults to None.
+        output_format (str): 'tsv' or 'parquet'. Defaults to 'tsv'.
+
+    Returns:
+        str: Path to the cached TSV table or Parquet dataset, to be read with `read_variants` or `info_collecting`.
+    """
+    from vcf_parser import parser_version, vcf_parsing
+
+    if row_filter is None:
+        filter_name = None
+    elif '<lambda>' in row_filter.__qualname__ or '<locals>' in row_filter.__qualname__:
+        raise ValueError(f'row_filter must be a module-level function, got {row_filter.__qualname__}')
+    else:
+        filter_name = f'{row_filter.__module__}.{row_filter.__qualname__}'
+
+    def run_parser(output_dir: str) -> str:
+        return vcf_parsing(vcf_file, row_filter=row_filter, output_format=output_format, output_dir=output_dir)
+
+    cache = cache or ParseCache()
+    options = {'row_filter': filter_name, 'output_format': output_format}
+    return cache.get_or_parse(vcf_file, 'vcf_parsing', parser_version, options, run_parser)
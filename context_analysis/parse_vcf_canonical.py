@@ -1,13 +1,28 @@
-import csv
-import gzip
-import os
-from typing import List, Dict
+from typing import Iterable, List, Dict, Optional
+
+from info_fields import InfoDecoder
+from output_writers import ParquetWriter, TableWriter, get_output_file
+from run_profile import RunProfile
+from table_index import index_parser_output
+from vcf_reader import iter_vcf_records
+from vep_fields import VepDecoder
+
+# Version of the parser output, part of the cache key (see parse_cache.py); increase when the output changes
+parser_version = '2'
 
 headers = [
     'Chr', 'Position', 'rsID', 'Ref', 'Alt', 'AC', 'Impact', 'Consequence',
     'Gene_symbol', 'Canonical_transcript', 'cDNA_position', 'LoF', 'LoF_flag', 'LoF_filter'
 ]
 
+# Column types of the Parquet output (other columns are strings), as in `canonical_schema` of
+# transcript_conservativity/code/variant_schema.py
+column_types = {
+    'Position': 'int32', 'Ref': 'category', 'Alt': 'category', 'AC': 'int32', 'Impact': 'category',
+    'Consequence': 'category', 'Gene_symbol': 'category', 'Canonical_transcript': 'category',
+    'LoF': 'category', 'LoF_flag': 'category', 'LoF_filter': 'category'
+}
+
 # Column names for VCF file
 vcf_columns = ['CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO']
 vcf_columns_dict = {col: idx for idx, col in enumerate(vcf_columns)}
@@ -19,6 +34,11 @@ vep_names = ('Allele|Consequence|IMPACT|SYMBOL|Gene|Feature_type|Feature|BIOTYPE
              'UNIPROT_ISOFORM|SOURCE|||DOMAINS|miRNA|HGVS_OFFSET|PUBMED|MOTIF_NAME|MOTIF_POS|HIGH_INF_POS|'
              'MOTIF_SCORE_CHANGE|TRANSCRIPTION_FACTORS|LoF|LoF_filter|LoF_flags|LoF_info').split('|')
 
+# VEP fields collected for canonical transcripts
+canonical_fields = ['IMPACT', 'Consequence', 'SYMBOL', 'Feature', 'cDNA_position', 'LoF', 'LoF_flags', 'LoF_filter']
+# VEP decoder used when the VCF header is not available
+canonical_decoder = VepDecoder(vep_names, canonical_fields + ['CANONICAL'])
+
 # Column names for population data
 population_names = (
     'AC', 'AC_afr', 'AC_amr', 'AC_nfe', 'AC_asj', 'AC_sas', 'AC_eas', 'AC_mid', 'AC_fin',
@@ -27,8 +47,14 @@ population_names = (
 )
 population_dict = {pop: idx for idx, pop in enumerate(population_names)}
 
+# INFO decoder used when the VCF header is not available
+population_decoder = InfoDecoder(dict.fromkeys(population_names, 'String'))
 
-def parse_vcf(vcf_file: str, output_dir: str = '', output_filename: str = '') -> None:
+
+def parse_vcf(vcf_file: str, output_dir: str = '', output_filename: str = '',
+              flush_size: int = 10000, compression: Optional[str] = None, write_header: bool = True,
+              output_format: str = 'tsv', index: bool = False, threads: Optional[int] = None,
+              profile: Optional[RunProfile] = None) -> int:
     """
     Parse VCF file and write relevant data to a TSV file.
 
@@ -36,40 +62,104 @@ def parse_vcf(vcf_file: str, output_dir: str = '', output_filename: str = '') ->
         vcf_file (str): Path to the VCF file.
         output_dir (str): Directory to save the output TSV file. Default is current working directory.
         output_filename (str): Name of the output TSV file. Defaults to the input VCF filename with '.tsv' extension.
+        flush_size (int): Number of rows buffered in memory before writing them to the output file. Default is 10000.
+        compression (str, optional): Output compression: None (plain TSV), 'gzip' or 'bgzip'. Default is None.
+        write_header (bool): Write the header line. Default is True.
+        output_format (str): 'tsv' or 'parquet'. Parquet output is a dataset directory partitioned by chromosome,
+            with categorical VEP columns and integer positions and allele counts. Default is 'tsv'.
+        index (bool): Index the output with tabix and a gene/transcript index for `IndexedTable` queries
+            (see table_index.py); requires compression='bgzip' and the header line. Default is False.
+        threads (int, optional): Number of threads decompressing the BGZF input (see vcf_reader.py).
+            Defaults to the available CPUs, at most 4.
+        profile (RunProfile, optional): Instrumentation of the run (see run_profile.py): times of the
+            decompress, split, population, canonical and write stages, counters of records read, PASS records kept,
+            canonical transcripts emitted and bytes in/out, progress lines and a JSON report. Default is None.
 
     Returns:
-        None
+        int: Number of variants written to the output table.
     """
-    if not output_dir:
-        output_dir = os.getcwd()
-
-    if output_filename == '':
-        output_filename = os.path.splitext(os.path.basename(vcf_file))[0] + '.tsv'
+    if index and (compression != 'bgzip' or not write_header or output_format != 'tsv'):
+        raise ValueError("Indexing requires a TSV output with compression='bgzip' and the header line")
+    output_file = get_output_file(vcf_file, output_dir, output_filename, compression, output_format)
+    if output_format == 'parquet':
+        table_writer = ParquetWriter(output_file, headers, column_types, 'Chr', flush_size)
     else:
-        if not output_filename.endswith('.tsv'):
-            output_filename += '.tsv'
-
-    output_file = os.path.join(output_dir, output_filename)
+        table_writer = TableWriter(output_file, headers if write_header else None, flush_size, compression)
+    info_decoder = InfoDecoder.from_vcf(vcf_file, population_names)
+    vep_decoder = VepDecoder.from_vcf(vcf_file, canonical_fields + ['CANONICAL'], fallback_names=vep_names)
+
+    if profile is not None:
+        profile.begin('parse_vcf', vcf_file, output_format=output_format, compression=compression,
+                      flush_size=flush_size, threads=threads)
+        records = profile.timed_iter(iter_vcf_records(vcf_file, threads, profile), 'split', 'records_read')
+        with table_writer:
+            parse_records_profiled(records, table_writer, info_decoder, vep_decoder, profile)
+    else:
+        with table_writer:
+            for line in iter_vcf_records(vcf_file, threads):
+                if line[vcf_columns_dict['CHROM']].startswith('chr') and line[vcf_columns_dict['FILTER']] == 'PASS':
+                    filtered_data = parse_line(line, info_decoder, vep_decoder)
+                    table_writer.write_row(filtered_data)
+
+    if index:
+        index_parser_output(output_file, 'parse_vcf')
+    if profile is not None:
+        profile.count('rows_written', table_writer.rows_written)
+        profile.finish(output_file)
+    return table_writer.rows_written
+
+
+def parse_records_profiled(records: Iterable[List[str]], table_writer, info_decoder: InfoDecoder,
+                           vep_decoder: VepDecoder, profile: RunProfile) -> None:
+    """
+    The parsing loop of `parse_vcf` with per-stage timers and counters; rows are the same as with `parse_line`.
 
-    with open(output_file, 'w', newline='', encoding='utf-8') as table_file:
-        writer = csv.writer(table_file, delimiter='\t')
-        writer.writerow(headers)
+    Args:
+        records (Iterable[List[str]]): VCF records.
+        table_writer: Opened `TableWriter` or `ParquetWriter`.
+        info_decoder (InfoDecoder): Decoder of the population INFO fields.
+        vep_decoder (VepDecoder): Decoder of the VEP annotation.
+        profile (RunProfile): Profile of the run.
+    """
+    population_stage = profile.stage('population')
+    canonical_stage = profile.stage('canonical')
+    write_stage = profile.stage('write')
+    for line in records:
+        if line[vcf_columns_dict['CHROM']].startswith('chr') and line[vcf_columns_dict['FILTER']] == 'PASS':
+            profile.count('pass_kept')
+            with population_stage:
+                population_data = get_population_data(line, info_decoder)
+            with canonical_stage:
+                transcript_info = get_canonical_info(line, vep_decoder)
+            profile.count('transcripts_emitted', len(transcript_info['Feature']))
+            with write_stage:
+                table_writer.write_row(build_row(line, population_data, transcript_info))
+
+
+def parse_line(line: List[str], info_decoder: Optional[InfoDecoder] = None,
+               vep_decoder: Optional[VepDecoder] = None) -> List[str]:
+    """
+    Process a line from VCF file.
 
-    with gzip.open(vcf_file, 'rt') as input_file:
-        vcf_reader = csv.reader(input_file, delimiter='\t')
+    Args:
+        line (List[str]): List representing a line from the VCF file.
+        info_decoder (InfoDecoder, optional): Decoder of the population INFO fields. Defaults to `population_decoder`.
+        vep_decoder (VepDecoder, optional): Decoder of the VEP annotation. Defaults to `canonical_decoder`.
 
-        for line in vcf_reader:
-            if line[vcf_columns_dict['CHROM']].startswith('chr') and line[vcf_columns_dict['FILTER']] == 'PASS':
-                filtered_data = parse_line(line)
-                write_to_output(output_file, filtered_data)
+    Returns:
+        List[str]: Processed data with selected information from the line.
+    """
+    return build_row(line, get_population_data(line, info_decoder), get_canonical_info(line, vep_decoder))
 
 
-def parse_line(line: List[str]) -> List[str]:
+def build_row(line: List[str], population_data: Dict[str, str], transcript_info: Dict[str, List[str]]) -> List[str]:
     """
-    Process a line from VCF file.
+    Build the output row of a VCF line from its decoded population data and canonical transcript information.
 
     Args:
         line (List[str]): List representing a line from the VCF file.
+        population_data (Dict[str, str]): Result of `get_population_data`.
+        transcript_info (Dict[str, List[str]]): Result of `get_canonical_info`.
 
     Returns:
         List[str]: Processed data with selected information from the line.
@@ -79,8 +169,7 @@ def parse_line(line: List[str]) -> List[str]:
     rs_id = line[vcf_columns_dict['ID']]
     ref = line[vcf_columns_dict['REF']]
     alt = line[vcf_columns_dict['ALT']]
-    population_dict.update(get_population_data(line))
-    transcript_info = get_canonical_info(line)
+    population_dict.update(population_data)
 
     filtered_data = [
         chrom,
@@ -102,71 +191,46 @@ def parse_line(line: List[str]) -> List[str]:
     return filtered_data
 
 
-def get_population_data(line: List[str]) -> Dict[str, str]:
+def get_population_data(line: List[str], info_decoder: Optional[InfoDecoder] = None) -> Dict[str, str]:
     """
     Extract population data from VCF line.
 
     Args:
         line (List[str]): List representing a line from the VCF file.
+        info_decoder (InfoDecoder, optional): Decoder of the population INFO fields. Defaults to `population_decoder`.
 
     Returns:
         Dict[str, str]: Dictionary containing variant population data.
     """
-    column_with_info = line[vcf_columns_dict['INFO']].split(';')
-    frequency = {}
-    for element in column_with_info:
-        for pop in population_dict:
-            if element.startswith(f'{pop}='):
-                frequency[pop] = element.split('=')[-1]
-    return frequency
+    if info_decoder is None:
+        info_decoder = population_decoder
+    return info_decoder.decode(line[vcf_columns_dict['INFO']], typed=False)
 
 
-def get_canonical_info(line: List[str]) -> Dict[str, List[str]]:
+def get_canonical_info(line: List[str], vep_decoder: Optional[VepDecoder] = None) -> Dict[str, List[str]]:
     """
     Extract canonical transcript information from VCF line.
 
     Args:
         line (List[str]): List representing a line from the VCF file.
+        vep_decoder (VepDecoder, optional): Decoder of the VEP annotation extracting `canonical_fields` and 'CANONICAL'.
+            Defaults to `canonical_decoder`.
 
     Returns:
         Dict[str, List[str]]: Dictionary containing information on canonical Ensemble transcript.
     """
-    transcript_info = {field: [] for field in ['IMPACT', 'Consequence', 'SYMBOL', 'Feature', 'cDNA_position', 'LoF', 'LoF_flags', 'LoF_filter']}
-    info = line[vcf_columns_dict['INFO']].split(';')
-    vep_info = info[-1].split('|')
-    feature_index = vep_names.index('Feature')
-    canonical_index = vep_names.index('CANONICAL')
-    symbol_index = vep_names.index('SYMBOL')
-    step = 47
-
-    for i in range(feature_index, len(vep_info), step):
-        transcript = vep_info[i]
-        canonical = vep_info[i + canonical_index - feature_index]
-        symbol = vep_info[i + symbol_index - feature_index]
-
-        if symbol and transcript.startswith('ENST') and canonical:
-            for field in transcript_info:
-                field_index = vep_names.index(field)
-                info = vep_info[i + field_index - feature_index]
+    if vep_decoder is None:
+        vep_decoder = canonical_decoder
+    transcript_info = {field: [] for field in canonical_fields}
+    feature_index = canonical_fields.index('Feature')
+    symbol_index = canonical_fields.index('SYMBOL')
+
+    vep_info = vep_decoder.get_annotation(line[vcf_columns_dict['INFO']])
+
+    for values in vep_decoder.decode(vep_info):
+        # The last decoded value is the CANONICAL flag
+        if values[symbol_index] and values[feature_index].startswith('ENST') and values[-1]:
+            for field, info in zip(canonical_fields, values):
                 if info:
-                    if field == 'Feature' or field == 'CANONICAL':
-                        transcript_info[field].append(transcript)
-                    else:
-                        transcript_info[field].append(info)
+                    transcript_info[field].append(info)
     return transcript_info
-
-
-def write_to_output(output_file: str, data: List[str]) -> None:
-    """
-    Write data to the output TSV file.
-
-    Args:
-        output_file (str): Path to the output TSV file.
-        data (List[str]): Data to be written to the file.
-
-    Returns:
-        None
-    """
-    with open(output_file, 'a', newline='', encoding='utf-8') as output_file:
-        tsv_writer = csv.writer(output_file, delimiter='\t')
-        tsv_writer.writerow(data)
@@ -1,13 +1,32 @@
-import csv
-import gzip
-import os
-from typing import List
+import warnings
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
 
-# csv.field_size_limit(sys.maxsize)
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from info_fields import InfoDecoder
+from output_writers import ParquetWriter, TableWriter, get_output_file
+from run_profile import RunProfile
+from table_index import index_parser_output
+from vcf_reader import iter_vcf_records
+from vep_fields import VepDecoder
+
+# Version of the parser output, part of the cache key (see parse_cache.py); increase when the output changes
+parser_version = '3'
 
 headers = ['CHROM', 'POS', 'ID', 'REF', 'ALT', 'CLNSIG', 'CLNVC', 'GENEINFO', 'MC',
            'Consequence', 'SYMBOL', 'Gene', 'Feature_type', 'Feature', 'BIOTYPE', 'cDNA_position', 'CANONICAL']
 
+# Column types of the Parquet output and of `load_clinvar_vcf` (other columns are strings), as in `clinvar_schema`
+# of transcript_conservativity/code/variant_schema.py
+column_types = {
+    'POS': 'int32', 'REF': 'category', 'ALT': 'category', 'CLNSIG': 'category', 'CLNVC': 'category',
+    'GENEINFO': 'category', 'MC': 'category', 'Consequence': 'category', 'SYMBOL': 'category',
+    'Gene': 'category', 'Feature_type': 'category', 'Feature': 'category', 'BIOTYPE': 'category',
+    'CANONICAL': 'category'
+}
+
 # Column names for Clinvar VCF file
 clinvar_columns = ['CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO']
 clinvar_columns_dict = {col: idx for idx, col in enumerate(clinvar_columns)}
@@ -20,7 +39,9 @@ clinvar_info_names = [
     'ONCREVSTAT', 'ONCCONF', 'ORIGIN', 'RS', 'SCIDN', 'SCIDNINCL', 'SCIDISDB', 'SCIDISDBINCL',
     'SCIREVSTAT', 'SCI', 'SCIINCL'
 ]
-clinvar_info_dict = {info: idx for idx, info in enumerate(clinvar_info_names)}
+
+# INFO fields written to the output table
+clinvar_record_fields = ['CLNSIG', 'CLNVC', 'GENEINFO', 'MC']
 
 # Column names for VEP data
 vep_names = ('Allele|Consequence|IMPACT|SYMBOL|Gene|Feature_type|Feature|BIOTYPE|EXON|INTRON|'
@@ -28,8 +49,117 @@ vep_names = ('Allele|Consequence|IMPACT|SYMBOL|Gene|Feature_type|Feature|BIOTYPE
              'Existing_variation|DISTANCE|STRAND|FLAGS|SYMBOL_SOURCE|HGNC_ID|CANONICAL').split('|')
 vep_names_dict = {name: idx for idx, name in enumerate(vep_names)}
 
+# VEP fields written to the output table
+clinvar_vep_fields = ['Consequence', 'SYMBOL', 'Gene', 'Feature_type', 'Feature', 'BIOTYPE', 'cDNA_position', 'CANONICAL']
+# VEP decoder used when the VCF header is not available
+clinvar_vep_decoder = VepDecoder(vep_names, clinvar_vep_fields, info_key='CSQ')
+clinvar_vep_index = {field: idx for idx, field in enumerate(clinvar_vep_fields)}
+
+# INFO decoder used when the VCF header is not available: the output fields and the VEP annotation
+clinvar_info_decoder = InfoDecoder(dict.fromkeys(clinvar_info_names + ['CSQ'], 'String'),
+                                   keys=clinvar_record_fields + ['CSQ'])
+
+# Clinical significance terms of pathogenic variants
+pathogenic_clnsig = ('Pathogenic', 'Likely_pathogenic')
+
+
+class MissingVepAnnotation(ValueError):
+    """
+    A record has no VEP annotation under the INFO key declared in the header.
+    """
+
+
+class ClinvarFilter:
+    """
+    Filter of ClinVar records applied during parsing, before rows are created.
+
+    Records are checked on CLNSIG and MC first, so the VEP annotation of rejected records is never split;
+    transcripts are then checked on Consequence and CANONICAL. Values are matched by terms: CLNSIG is split on
+    '/', '|' and ',' ('Pathogenic/Likely_pathogenic'), MC items are 'SO:0001587|nonsense' and Consequence terms
+    are joined with '&', so 'Pathogenic' does not match 'Conflicting_classifications_of_pathogenicity'.
+    """
+
+    def __init__(self, clnsig: Optional[Iterable[str]] = None, molecular_consequences: Optional[Iterable[str]] = None,
+                 consequences: Optional[Iterable[str]] = None, canonical_only: bool = False) -> None:
+        """
+        Args:
+            clnsig (Iterable[str], optional): Accepted CLNSIG terms, e.g. `pathogenic_clnsig`. Defaults to all.
+            molecular_consequences (Iterable[str], optional): Accepted MC terms, e.g. ['nonsense']. Defaults to all.
+            consequences (Iterable[str], optional): Accepted VEP consequences, e.g. ['stop_gained']. Defaults to all.
+            canonical_only (bool): Keep only canonical transcripts (CANONICAL=YES). Default is False.
+        """
+        self.clnsig = frozenset(clnsig) if clnsig is not None else None
+        self.molecular_consequences = frozenset(molecular_consequences) if molecular_consequences is not None else None
+        self.consequences = frozenset(consequences) if consequences is not None else None
+        self.canonical_only = canonical_only
+
+    def __repr__(self) -> str:
+        # Stable representation, used in the cache key of parse_cache.py
+        return (f'ClinvarFilter(clnsig={sorted(self.clnsig) if self.clnsig is not None else None}, '
+                f'molecular_consequences='
+                f'{sorted(self.molecular_consequences) if self.molecular_consequences is not None else None}, '
+                f'consequences={sorted(self.consequences) if self.consequences is not None else None}, '
+                f'canonical_only={self.canonical_only})')
+
+    def accepts_line(self, info: str) -> bool:
+        """
+        Cheap check on the raw INFO string: False if none of the accepted consequences occurs in it.
+
+        Args:
+            info (str): Content of the INFO column.
+
+        Returns:
+            bool: False if the record can be skipped without decoding.
+        """
+        return self.consequences is None or any(consequence in info for consequence in self.consequences)
+
+    def accepts_record(self, record_info: Dict[str, Optional[str]]) -> bool:
+        """
+        Check the decoded CLNSIG and MC values of a record.
+
+        Args:
+            record_info (Dict[str, Optional[str]]): Decoded INFO values of the record.
+
+        Returns:
+            bool: True if the record passes the filter.
+        """
+        if self.clnsig is not None:
+            terms = (record_info.get('CLNSIG') or '').replace('|', '/').replace(',', '/').split('/')
+            if self.clnsig.isdisjoint(terms):
+                return False
+        if self.molecular_consequences is not None:
+            terms = [item.partition('|')[2] for item in (record_info.get('MC') or '').split(',')]
+            if self.molecular_consequences.isdisjoint(terms):
+                return False
+        return True
 
-def parse_clinvar_vcf(vcf_file: str, output_dir: str = '', output_filename: str = '') -> None:
+    def accepts_transcript(self, vep_fields: List[str]) -> bool:
+        """
+        Check the VEP fields of a transcript.
+
+        Args:
+            vep_fields (List[str]): Values of `clinvar_vep_fields`.
+
+        Returns:
+            bool: True if the transcript passes the filter.
+        """
+        if self.canonical_only and vep_fields[clinvar_vep_index['CANONICAL']] != 'YES':
+            return False
+        if self.consequences is not None:
+            if self.consequences.isdisjoint(vep_fields[clinvar_vep_index['Consequence']].split('&')):
+                return False
+        return True
+
+
+# Filter of the pathogenic nonsense variants on canonical transcripts used in the NMD analysis
+nonsense_filter = ClinvarFilter(pathogenic_clnsig, ['nonsense'], ['stop_gained'], canonical_only=True)
+
+
+def parse_clinvar_vcf(vcf_file: str, output_dir: str = '', output_filename: str = '',
+                      flush_size: int = 10000, compression: Optional[str] = None, output_format: str = 'tsv',
+                      record_filter: Optional[ClinvarFilter] = None, index: bool = False,
+                      threads: Optional[int] = None, profile: Optional[RunProfile] = None,
+                      vep_key: Optional[str] = None) -> int:
     """
     Parse a ClinVar VCF file and write the parsed data to a TSV file.
 
@@ -37,83 +167,200 @@ def parse_clinvar_vcf(vcf_file: str, output_dir: str = '', output_filename: str
         vcf_file (str): Path to the input ClinVar VCF file.
         output_dir (str, optional): Directory where the output TSV file will be saved. Defaults to current working directory.
         output_filename (str, optional): Name of the output TSV file. Defaults to the input VCF filename with '.tsv' extension.
+        flush_size (int, optional): Number of rows buffered in memory before writing them to the output file. Defaults to 10000.
+        compression (str, optional): Output compression: None (plain TSV), 'gzip' or 'bgzip'. Defaults to None.
+        output_format (str, optional): 'tsv' or 'parquet'. Parquet output is a dataset directory partitioned by
+            chromosome, with categorical annotation columns. Defaults to 'tsv'.
+        record_filter (ClinvarFilter, optional): Filter applied while parsing, e.g. `nonsense_filter`.
+            Defaults to None (all records and transcripts).
+        index (bool, optional): Index the output with tabix and a gene/transcript index for `IndexedTable` queries
+            (see table_index.py); requires compression='bgzip'. Defaults to False.
+        threads (int, optional): Number of threads decompressing the BGZF input (see vcf_reader.py).
+            Defaults to the available CPUs, at most 4.
+        profile (RunProfile, optional): Instrumentation of the run (see run_profile.py): times of the
+            decompress, split, parse and write stages, counters of records read, records kept by the filter,
+            transcripts emitted and bytes in/out, progress lines and a JSON report. Defaults to None.
+        vep_key (str, optional): INFO key of the VEP annotation ('CSQ', 'vep'). Defaults to the key of the ##INFO
+            header line with a VEP Format string.
 
     Returns:
-        None
+        int: Number of rows written to the output table.
+
+    Raises:
+        ValueError: If the VEP key is not declared in the header. Records without VEP annotation are skipped
+            and counted (see `iter_clinvar_rows`).
     """
-    if output_dir == '':
-        output_dir = os.getcwd()
+    if index and (compression != 'bgzip' or output_format != 'tsv'):
+        raise ValueError("Indexing requires a TSV output with compression='bgzip'")
+    output_file = get_output_file(vcf_file, output_dir, output_filename, compression, output_format)
+    if output_format == 'parquet':
+        table_writer = ParquetWriter(output_file, headers, column_types, 'CHROM', flush_size)
+    else:
+        table_writer = TableWriter(output_file, headers, flush_size, compression)
 
-    if output_filename == '':
-        output_filename = os.path.splitext(os.path.basename(vcf_file))[0] + '.tsv'
+    if profile is not None:
+        profile.begin('parse_clinvar_vcf', vcf_file, output_format=output_format, compression=compression,
+                      flush_size=flush_size, record_filter=repr(record_filter), threads=threads)
+        # Stages nested in the rows iterator are subtracted, so 'write' is the time of the writer itself
+        with table_writer, profile.stage('write'):
+            table_writer.write_rows(iter_clinvar_rows(vcf_file, record_filter, threads, profile, vep_key))
     else:
-        if not output_filename.endswith('.tsv'):
-            output_filename += '.tsv'
+        with table_writer:
+            table_writer.write_rows(iter_clinvar_rows(vcf_file, record_filter, threads, vep_key=vep_key))
+    if index:
+        index_parser_output(output_file, 'parse_clinvar_vcf')
+    if profile is not None:
+        profile.count('rows_written', table_writer.rows_written)
+        profile.finish(output_file)
+    return table_writer.rows_written
+
+
+def iter_clinvar_rows(vcf_file: str, record_filter: Optional[ClinvarFilter] = None,
+                      threads: Optional[int] = None, profile: Optional[RunProfile] = None,
+                      vep_key: Optional[str] = None) -> Iterator[List[str]]:
+    """
+    Parse a ClinVar VCF file in a single pass, yielding output rows one by one. Records without VEP annotation
+    are skipped; their number is the 'records_without_vep' counter of the profile and a warning at the end.
+
+    Args:
+        vcf_file (str): Path to the input ClinVar VCF file.
+        record_filter (ClinvarFilter, optional): Filter applied while parsing. Defaults to None.
+        threads (int, optional): Number of threads decompressing the BGZF input. Defaults to `default_threads()`.
+        profile (RunProfile, optional): Profile timing the split and parse stages and counting records and rows.
+            Defaults to None.
+        vep_key (str, optional): INFO key of the VEP annotation. Defaults to the key detected in the header.
+
+    Yields:
+        List[str]: Row with `headers` values.
+    """
+    vep_decoder = VepDecoder.from_vcf(vcf_file, clinvar_vep_fields, vep_key, fallback_names=vep_names)
+    info_decoder = InfoDecoder.from_vcf(vcf_file, clinvar_record_fields + [vep_decoder.info_key])
+
+    unannotated = 0
+    if profile is None:
+        for line in iter_vcf_records(vcf_file, threads):
+            try:
+                rows = parse_vcf_line(line, info_decoder, vep_decoder, record_filter)
+            except MissingVepAnnotation:
+                unannotated += 1
+                continue
+            yield from rows
+    else:
+        parse_stage = profile.stage('parse')
+        for line in profile.timed_iter(iter_vcf_records(vcf_file, threads, profile), 'split', 'records_read'):
+            try:
+                with parse_stage:
+                    rows = parse_vcf_line(line, info_decoder, vep_decoder, record_filter)
+            except MissingVepAnnotation:
+                unannotated += 1
+                profile.count('records_without_vep')
+                continue
+            if rows:
+                profile.count('records_kept')
+                profile.count('transcripts_emitted', len(rows))
+            yield from rows
+    if unannotated:
+        warnings.warn(f'{unannotated} records of {vcf_file} without the VEP INFO field {vep_decoder.info_key} '
+                      f'were skipped')
+
+
+def load_clinvar_vcf(vcf_file: str, record_filter: Optional[ClinvarFilter] = None,
+                     batch_size: int = 100000) -> pd.DataFrame:
+    """
+    Parse a ClinVar VCF file directly into a dataframe. Rows are converted to typed columns in batches
+    (categorical annotation columns, integer positions), so the parsed rows are never kept as Python lists.
+
+    Args:
+        vcf_file (str): Path to the input ClinVar VCF file.
+        record_filter (ClinvarFilter, optional): Filter applied while parsing. Defaults to None.
+        batch_size (int): Number of rows converted at once. Default is 100000.
 
-    output_file = os.path.join(output_dir, output_filename)
+    Returns:
+        pd.DataFrame: Parsed variants with `headers` columns.
+    """
+    rows = iter_clinvar_rows(vcf_file, record_filter)
+    batches = [convert_batch(batch) for batch in iter(lambda: list(islice(rows, batch_size)), [])]
+    if not batches:
+        batches = [convert_batch([])]
 
-    with open(output_file, 'w', newline='', encoding='utf-8') as table_file:
-        writer = csv.writer(table_file, delimiter='\t')
-        writer.writerow(headers)
+    columns = {}
+    for column in headers:
+        if column_types.get(column) == 'category':
+            # Batches have different categories, which pd.concat would turn into strings
+            columns[column] = union_categoricals([batch[column] for batch in batches])
+        else:
+            columns[column] = pd.concat([batch[column] for batch in batches], ignore_index=True)
+    return pd.DataFrame(columns)
 
-    with gzip.open(vcf_file, 'rt') as input_file, open(output_file, 'a', newline='', encoding='utf-8') as output_file:
-        vcf_reader = csv.reader(input_file, delimiter='\t')
-        tsv_writer = csv.writer(output_file, delimiter='\t')
 
-        for line in vcf_reader:
-            parsed_data = parse_vcf_line(line)
-            for data in parsed_data:
-                tsv_writer.writerow(data)
+def convert_batch(rows: List[List[str]]) -> pd.DataFrame:
+    """
+    Convert a batch of parsed rows to a dataframe with `column_types`.
 
+    Args:
+        rows (List[List[str]]): Rows with `headers` values.
 
-def parse_vcf_line(line: List[str]) -> List[List[str]]:
+    Returns:
+        pd.DataFrame: Typed batch.
     """
-    Parse a single line of a VCF file.
+    batch = pd.DataFrame(rows, columns=headers)
+    for column, column_type in column_types.items():
+        if column_type == 'category':
+            batch[column] = batch[column].astype('category')
+        else:
+            batch[column] = pd.to_numeric(batch[column]).astype(column_type)
+    return batch
+
+
+def parse_vcf_line(line: List[str], info_decoder: Optional[InfoDecoder] = None,
+                   vep_decoder: Optional[VepDecoder] = None,
+                   record_filter: Optional[ClinvarFilter] = None) -> List[List[str]]:
+    """
+    Parse a single line of a VCF file. INFO values are decoded in one pass into a dictionary of this record,
+    so missing keys are None rather than values of a previous record.
 
     Args:
         line (List[str]): List representing a line from the VCF file.
+        info_decoder (InfoDecoder, optional): Decoder of `clinvar_record_fields` and the VEP INFO field.
+            Defaults to `clinvar_info_decoder`.
+        vep_decoder (VepDecoder, optional): Decoder of the VEP annotation. Defaults to `clinvar_vep_decoder`.
+        record_filter (ClinvarFilter, optional): Filter of records and transcripts. Defaults to None.
 
     Returns:
         List[List[str]]: Parsed data for variant in the line.
+
+    Raises:
+        MissingVepAnnotation: If the record has no VEP annotation.
     """
-    parsed_data = []
+    if line[clinvar_columns_dict['CHROM']].startswith('#'):
+        return []
 
-    if not line[clinvar_columns_dict['CHROM']].startswith('#'):
-        chrom = 'chr' + line[clinvar_columns_dict['CHROM']]
-        position = line[clinvar_columns_dict['POS']]
-        variation_id = line[clinvar_columns_dict['ID']]
-        ref = line[clinvar_columns_dict['REF']]
-        alt = line[clinvar_columns_dict['ALT']]
-
-        info = line[clinvar_columns_dict['INFO']].split(';')
-        for element in info:
-            for category in clinvar_info_dict:
-                if element.startswith(f'{category}='):
-                    value = element.split('=')
-                    clinvar_info_dict[category] = value[-1]
-
-        vep_info = info[-1].split(',')
-
-        for element in vep_info:
-            variant_info = element.split('|')
-
-            info_consequence = variant_info[vep_names_dict.get('Consequence')]
-            info_symbol = variant_info[vep_names_dict.get('SYMBOL')]
-            info_gene = variant_info[vep_names_dict.get('Gene')]
-            info_feature_type = variant_info[vep_names_dict.get('Feature_type')]
-            info_feature = variant_info[vep_names_dict.get('Feature')]
-            info_biotype = variant_info[vep_names_dict.get('BIOTYPE')]
-            info_cDNA = variant_info[vep_names_dict.get('cDNA_position')]
-            info_canonical = variant_info[vep_names_dict.get('CANONICAL')]
-
-            filtered_data = [
-                chrom, position, variation_id, ref, alt,
-                clinvar_info_dict['CLNSIG'], clinvar_info_dict['CLNVC'], clinvar_info_dict['GENEINFO'],
-                clinvar_info_dict['MC'],
-                info_consequence, info_symbol, info_gene, info_feature_type,
-                info_feature, info_biotype,
-                info_cDNA, info_canonical
-            ]
-            parsed_data.append(filtered_data)
+    info = line[clinvar_columns_dict['INFO']]
+    if record_filter is not None and not record_filter.accepts_line(info):
+        return []
 
+    if info_decoder is None:
+        info_decoder = clinvar_info_decoder
+    if vep_decoder is None:
+        vep_decoder = clinvar_vep_decoder
+    record_info = info_decoder.decode(info, typed=False)
+    if record_filter is not None and not record_filter.accepts_record(record_info):
+        return []
+
+    variant_data = [
+        'chr' + line[clinvar_columns_dict['CHROM']],
+        line[clinvar_columns_dict['POS']],
+        line[clinvar_columns_dict['ID']],
+        line[clinvar_columns_dict['REF']],
+        line[clinvar_columns_dict['ALT']],
+    ] + [record_info.get(field) for field in clinvar_record_fields]
+
+    vep = record_info.get(vep_decoder.info_key)
+    if vep is None:
+        raise MissingVepAnnotation(f'VEP INFO field {vep_decoder.info_key} not found in the record at '
+                         f'{line[clinvar_columns_dict["CHROM"]]}:{line[clinvar_columns_dict["POS"]]}')
+    parsed_data = []
+    for vep_fields in vep_decoder.decode(vep):
+        if record_filter is None or record_filter.accepts_transcript(vep_fields):
+            parsed_data.append(variant_data + vep_fields)
     return parsed_data
@@ -0,0 +1,324 @@
+import json
+import os
+import resource
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+
+# Number of items of a counted stream between two checks of the clock for progress and RSS samples
+check_every = 4096
+
+
+def current_rss_mb() -> float:
+    """
+    Resident set size of the current process (from /proc/self/statm, the peak RSS where it is not available).
+
+    Returns:
+        float: RSS in MB.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of the current process: VmHWM of /proc/self/status, which starts anew at exec
+    (unlike ru_maxrss, which keeps the peak of the parent process on Linux), or ru_maxrss where it is not available.
+
+    Returns:
+        float: Peak RSS in MB.
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+def path_size(path: str) -> int:
+    """
+    Size of a file, or the total size of the files of a directory (e.g. a Parquet dataset).
+
+    Args:
+        path (str): Path to the file or directory.
+
+    Returns:
+        int: Size in bytes, 0 if the path does not exist.
+    """
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+class StageTimer:
+    """
+    Reusable context manager accumulating the time of one stage of a `RunProfile`. Stages can be nested:
+    the time of inner stages is subtracted from the outer stage, so stage times add up to the profiled time.
+    """
+    __slots__ = ('profile', 'name', 'seconds', 'calls')
+
+    def __init__(self, profile: 'RunProfile', name: str) -> None:
+        """
+        Args:
+            profile (RunProfile): Profile the stage belongs to.
+            name (str): Stage name.
+        """
+        self.profile = profile
+        self.name = name
+        self.seconds = 0.0
+        self.calls = 0
+
+    def __enter__(self) -> 'StageTimer':
+        self.profile._stack.append([time.perf_counter(), 0.0])
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        stack = self.profile._stack
+        start, inner = stack.pop()
+        elapsed = time.perf_counter() - start
+        self.seconds += elapsed - inner
+        self.calls += 1
+        if stack:
+            stack[-1][1] += elapsed
+
+
+class RunProfile:
+    """
+    Opt-in instrumentation of a parser run: per-stage timers, counters (records read, PASS records kept,
+    transcripts emitted, bytes in/out), periodic progress with records/s and ETA, RSS samples and a JSON report.
+
+    Parsers accept a profile as `profile=`; without it they run their uninstrumented loop. Progress is based on
+    the 'bytes_in' counter (compressed input bytes) and the input size, or on 'records_read' and `total_records`.
+    """
+
+    def __init__(self, report_file: Optional[str] = None, progress_interval: Optional[float] = 30.0,
+                 rss_interval: float = 5.0, total_records: Optional[int] = None,
+                 stream: Optional[TextIO] = None) -> None:
+        """
+        Args:
+            report_file (str, optional): Path of the JSON report written when the run finishes. Defaults to none.
+            progress_interval (float, optional): Seconds between progress lines; None disables them. Default is 30.
+            rss_interval (float): Seconds between RSS samples. Default is 5.
+            total_records (int, optional): Expected number of records, for the ETA of inputs without a byte
+                position (e.g. read through cyvcf2). Defaults to the input size in bytes.
+            stream (TextIO, optional): Stream of the progress lines. Defaults to sys.stderr.
+        """
+        self.report_file = report_file
+        self.progress_interval = progress_interval
+        self.rss_interval = rss_interval
+        self.total_records = total_records
+        self.stream = stream
+        self.parser = None
+        self.input_file = None
+        self.output_file = None
+        self.total_bytes = None
+        self.parameters = {}
+        self.counters = defaultdict(int)
+        self.stages = {}
+        self.rss_samples = []
+        self.start_time = None
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        self._stack = []
+        self._start_cpu = None
+        self._perf_start = None
+        self._next_progress = None
+        self._next_rss = None
+
+    def begin(self, parser: str, input_file: str, **parameters: Any) -> None:
+        """
+        Start the run (called by the parser).
+
+        Args:
+            parser (str): Parser name.
+            input_file (str): Path to the input file; its size is the total of the 'bytes_in' counter.
+            **parameters (Any): Parameters of the run recorded in the report.
+        """
+        self.parser = parser
+        self.input_file = input_file
+        self.total_bytes = path_size(input_file) or None
+        self.parameters.update(parameters)
+        self.start_time = time.time()
+        self._start_cpu = time.process_time()
+        now = time.perf_counter()
+        self._perf_start = now
+        self._next_progress = now + self.progress_interval if self.progress_interval else float('inf')
+        self._next_rss = now
+        self.sample()
+
+    def stage(self, name: str) -> StageTimer:
+        """
+        Timer of a stage, created on first use.
+
+        Args:
+            name (str): Stage name, e.g. 'decompress' or 'write'.
+
+        Returns:
+            StageTimer: Context manager timing the stage.
+        """
+        timer = self.stages.get(name)
+        if timer is None:
+            timer = self.stages[name] = StageTimer(self, name)
+        return timer
+
+    def count(self, counter: str, value: int = 1) -> None:
+        """
+        Increase a counter.
+
+        Args:
+            counter (str): Counter name, e.g. 'pass_kept'.
+            value (int): Increment. Default is 1.
+        """
+        self.counters[counter] += value
+
+    def timed_iter(self, iterable: Iterable, stage: str, counter: Optional[str] = None) -> Iterator:
+        """
+        Iterate over a stream, timing the production of every item as a stage. When a counter is given, items
+        are counted and progress and RSS are checked every `check_every` items.
+
+        Args:
+            iterable (Iterable): Stream of items, e.g. VCF records.
+            stage (str): Stage name.
+            counter (str, optional): Counter of the items, e.g. 'records_read'. Defaults to none.
+
+        Yields:
+            Items of the stream.
+        """
+        timer = self.stage(stage)
+        iterator = iter(iterable)
+        counters = self.counters
+        while True:
+            with timer:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            if counter is not None:
+                counters[counter] += 1
+                if counters[counter] % check_every == 0:
+                    self.sample()
+            yield item
+
+    def sample(self) -> None:
+        """
+        Take an RSS sample and print a progress line when their intervals have passed.
+        """
+        now = time.perf_counter()
+        if now >= self._next_rss:
+            self.rss_samples.append((round(now - self._perf_start, 3), round(current_rss_mb(), 1)))
+            self._next_rss = now + self.rss_interval
+        if now >= self._next_progress:
+            print(self.progress_line(now - self._perf_start), file=self.stream or sys.stderr, flush=True)
+            self._next_progress = now + self.progress_interval
+
+    def fraction_done(self) -> Optional[float]:
+        """
+        Fraction of the input processed so far.
+
+        Returns:
+            float, optional: Fraction from the input bytes or the expected records, None if unknown.
+        """
+        if self.total_bytes and self.counters.get('bytes_in'):
+            return min(self.counters['bytes_in'] / self.total_bytes, 1.0)
+        if self.total_records:
+            return min(self.counters.get('records_read', 0) / self.total_records, 1.0)
+        return None
+
+    def progress_line(self, seconds: float) -> str:
+        """
+        Format the progress of the run.
+
+        Args:
+            seconds (float): Elapsed time.
+
+        Returns:
+            str: Records read, records/s, processed fraction and ETA.
+        """
+        records = self.counters.get('records_read', 0)
+        line = f'{self.parser}: {records} records in {seconds:.0f} s ({records / max(seconds, 1e-9):.0f} records/s)'
+        fraction = self.fraction_done()
+        if fraction:
+            eta = seconds * (1 - fraction) / fraction
+            line += f', {fraction:.1%} done, ETA {eta // 3600:.0f}:{eta % 3600 // 60:02.0f}:{eta % 60:02.0f}'
+        return line
+
+    def finish(self, output_file: Optional[str] = None) -> Dict[str, Any]:
+        """
+        End the run (called by the parser): record the output size and write the report if `report_file` is set.
+
+        Args:
+            output_file (str, optional): Path to the output table or dataset.
+
+        Returns:
+            Dict[str, Any]: Run report, see `report`.
+        """
+        self.wall_seconds = time.perf_counter() - self._perf_start
+        self.cpu_seconds = time.process_time() - self._start_cpu
+        self.output_file = output_file
+        if output_file is not None:
+            self.counters['bytes_out'] = path_size(output_file)
+        self._next_rss = 0
+        self.sample()
+        report = self.report()
+        if self.report_file:
+            with open(self.report_file, 'w') as report_file:
+                json.dump(report, report_file, indent=2)
+        return report
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Machine-readable summary of the run: stage times (exclusive of nested stages) and their share of the wall
+        time, counters, throughput and memory.
+
+        Returns:
+            Dict[str, Any]: Report; time that no stage accounts for is reported as the 'other' stage.
+        """
+        wall_seconds = self.wall_seconds if self.wall_seconds is not None else time.perf_counter() - self._perf_start
+        stages = {name: {'seconds': round(timer.seconds, 6), 'calls': timer.calls,
+                         'share': round(timer.seconds / wall_seconds, 4) if wall_seconds else 0.0}
+                  for name, timer in self.stages.items()}
+        other = max(wall_seconds - sum(timer.seconds for timer in self.stages.values()), 0.0)
+        stages['other'] = {'seconds': round(other, 6), 'calls': 0,
+                           'share': round(other / wall_seconds, 4) if wall_seconds else 0.0}
+        records = self.counters.get('records_read', 0)
+        return {
+            'parser': self.parser,
+            'input_file': self.input_file,
+            'output_file': self.output_file,
+            'parameters': self.parameters,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.start_time)),
+            'wall_seconds': round(wall_seconds, 3),
+            'cpu_seconds': round(self.cpu_seconds, 3) if self.cpu_seconds is not None else None,
+            'input_bytes': self.total_bytes,
+            'records_per_second': round(records / wall_seconds, 1) if wall_seconds else None,
+            'input_mb_per_second': (round(self.total_bytes / 2 ** 20 / wall_seconds, 2)
+                                    if wall_seconds and self.total_bytes else None),
+            'counters': dict(self.counters),
+            'stages': stages,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'rss_samples': self.rss_samples,
+        }
+
+    def summary(self) -> List[str]:
+        """
+        Human-readable lines of the report: one line per stage, sorted by time, then the counters.
+
+        Returns:
+            List[str]: Lines of the summary.
+        """
+        report = self.report()
+        lines = [f'{report["parser"]}: {report["wall_seconds"]:.2f} s, {report["records_per_second"] or 0:.0f} '
+                 f'records/s, peak RSS {report["peak_rss_mb"]:.0f} MB']
+        for name, stage in sorted(report['stages'].items(), key=lambda item: -item[1]['seconds']):
+            lines.append(f'  {name:<12} {stage["seconds"]:9.3f} s {stage["share"]:7.1%}')
+        lines.extend(f'  {name:<20} {value}' for name, value in report['counters'].items())
+        return lines
@@ -0,0 +1,207 @@
+import gzip
+from typing import Callable, Iterable, List, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class TranscriptStore:
+    """
+    Transcript sequences packed into one contiguous uint8 array (one byte per base) with an offset index.
+
+    The store is built once (from the gencode transcript FASTA, a pyfaidx `Fasta` or a dictionary) and then
+    answers batched queries for whole DataFrames: context windows and single bases are gathered with NumPy
+    fancy indexing instead of one FASTA access per variant. Bases are kept as bytes rather than 2-bit codes,
+    because transcript sequences may contain other letters than A/C/G/T (e.g. N).
+    """
+
+    def __init__(self, ids: List[str], sequences: np.ndarray, offsets: np.ndarray) -> None:
+        """
+        Args:
+            ids (List[str]): Transcript IDs in the order of the store.
+            sequences (np.ndarray): Concatenated sequences (uint8 ASCII codes).
+            offsets (np.ndarray): Start of every transcript in `sequences`, followed by the total length.
+        """
+        self.ids = pd.Index(ids)
+        self.sequences = sequences
+        self.offsets = offsets
+        self.lengths = np.diff(offsets)
+
+    @classmethod
+    def from_fasta(cls, fasta_file: str,
+                   key_function: Optional[Callable[[str], str]] = None) -> 'TranscriptStore':
+        """
+        Read a (gzipped) FASTA file into a store in a single pass.
+
+        Args:
+            fasta_file (str): Path to the FASTA file, e.g. gencode.v45.transcripts.fa.gz.
+            key_function (Callable[[str], str], optional): Function applied to the first word of every header
+                to get the transcript ID, as in pyfaidx. Defaults to None (the whole first word).
+                For gencode headers, `lambda x: x.split('.')[0]` gives version-less Ensembl IDs.
+
+        Returns:
+            TranscriptStore: Store with all sequences of the file.
+        """
+        ids, chunks, offsets = [], [], [0]
+        total = 0
+        opener = gzip.open if fasta_file.endswith('.gz') else open
+        with opener(fasta_file, 'rb') as fasta:
+            for line in fasta:
+                if line.startswith(b'>'):
+                    if ids:
+                        offsets.append(total)
+                    name = line[1:].split()[0].decode()
+                    ids.append(key_function(name) if key_function else name)
+                else:
+                    line = line.rstrip(b'\r\n')
+                    chunks.append(line)
+                    total += len(line)
+        if ids:
+            offsets.append(total)
+        sequences = np.frombuffer(b''.join(chunks), dtype=np.uint8)
+        return cls(ids, sequences, np.array(offsets, dtype=np.int64))
+
+    @classmethod
+    def from_mapping(cls, transcript_fasta: Mapping,
+                     ids: Optional[Iterable[str]] = None) -> 'TranscriptStore':
+        """
+        Build a store from a dictionary of sequences or an opened pyfaidx `Fasta`.
+
+        Args:
+            transcript_fasta (Mapping): Transcript sequences (str or pyfaidx records) by transcript ID.
+            ids (Iterable[str], optional): Transcripts to load; IDs missing from `transcript_fasta` are skipped.
+                Defaults to all transcripts.
+
+        Returns:
+            TranscriptStore: Store with the requested sequences.
+        """
+        if ids is None:
+            ids = transcript_fasta.keys()
+        loaded_ids, chunks = [], []
+        for transcript_id in dict.fromkeys(ids):
+            if transcript_id in transcript_fasta:
+                loaded_ids.append(transcript_id)
+                chunks.append(str(transcript_fasta[transcript_id][:]).encode())
+        offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+        np.cumsum([len(chunk) for chunk in chunks], out=offsets[1:])
+        return cls(loaded_ids, np.frombuffer(b''.join(chunks), dtype=np.uint8), offsets)
+
+    def save(self, path: str) -> None:
+        """
+        Save the store to a '.npz' file, so that the FASTA file is parsed only once.
+
+        Args:
+            path (str): Path to the output file.
+        """
+        np.savez(path, ids=np.array(self.ids, dtype=str), sequences=self.sequences, offsets=self.offsets)
+
+    @classmethod
+    def load(cls, path: str) -> 'TranscriptStore':
+        """
+        Load a store saved with `save`.
+
+        Args:
+            path (str): Path to the '.npz' file.
+
+        Returns:
+            TranscriptStore: Loaded store.
+        """
+        with np.load(path) as data:
+            return cls(list(data['ids']), data['sequences'], data['offsets'])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, transcript_id: str) -> bool:
+        return transcript_id in self.ids
+
+    def __getitem__(self, transcript_id: str) -> str:
+        """
+        Sequence of a single transcript, so that the store can be used in place of the `transcript_fasta` dictionary.
+        """
+        idx = self.ids.get_loc(transcript_id)
+        return self.sequences[self.offsets[idx]:self.offsets[idx + 1]].tobytes().decode()
+
+    def get_indices(self, transcript_ids: Iterable[str]) -> np.ndarray:
+        """
+        Find positions of transcripts in the store.
+
+        Args:
+            transcript_ids (Iterable[str]): Transcript IDs.
+
+        Returns:
+            np.ndarray: Index of every transcript, -1 for transcripts not in the store.
+        """
+        return self.ids.get_indexer(pd.Index(transcript_ids))
+
+    def get_windows(self, transcript_ids: Iterable[str], positions: Iterable,
+                    left_len: int, right_len: int) -> np.ndarray:
+        """
+        Gather the sequences [position - left_len, position + right_len) of many variants at once
+        (0-based slice bounds, so the variant at the 1-based `position` is the `left_len`-th base of the window).
+
+        Args:
+            transcript_ids (Iterable[str]): Transcript of every variant.
+            positions (Iterable): 1-based positions of the variants in the transcripts (cDNA positions).
+            left_len (int): The length of the left flanking region (including the variant).
+            right_len (int): The length of the right flanking region.
+
+        Returns:
+            np.ndarray: Object array of windows; None for unknown transcripts, missing positions and windows
+                that do not fit into the transcript (left_len < position < length - right_len is required).
+        """
+        idx = self.get_indices(transcript_ids)
+        positions = pd.to_numeric(pd.Series(list(positions)), errors='coerce').to_numpy(dtype=float)
+        found = idx >= 0
+        lengths = np.zeros(len(idx), dtype=np.int64)
+        lengths[found] = self.lengths[idx[found]]
+        with np.errstate(invalid='ignore'):
+            valid = found & (left_len < positions) & (positions < lengths - right_len)
+
+        windows = np.full(len(idx), None, dtype=object)
+        if valid.any():
+            starts = self.offsets[idx[valid]] + positions[valid].astype(np.int64) - left_len
+            gathered = self.sequences[starts[:, None] + np.arange(left_len + right_len)]
+            windows[valid] = np.ascontiguousarray(gathered).view(f'S{left_len + right_len}').ravel().astype(str)
+        return windows
+
+    def get_bases(self, transcript_ids: Iterable[str], positions: Iterable) -> np.ndarray:
+        """
+        Gather the bases at 1-based positions of many variants at once.
+
+        Args:
+            transcript_ids (Iterable[str]): Transcript of every variant.
+            positions (Iterable): 1-based positions of the variants in the transcripts.
+
+        Returns:
+            np.ndarray: Array of bases; '' for unknown transcripts and positions outside the transcripts.
+        """
+        idx = self.get_indices(transcript_ids)
+        positions = pd.to_numeric(pd.Series(list(positions)), errors='coerce').to_numpy(dtype=float)
+        found = idx >= 0
+        lengths = np.zeros(len(idx), dtype=np.int64)
+        lengths[found] = self.lengths[idx[found]]
+        with np.errstate(invalid='ignore'):
+            valid = found & (positions >= 1) & (positions <= lengths)
+
+        bases = np.full(len(idx), '', dtype='<U1')
+        if valid.any():
+            gathered = self.sequences[self.offsets[idx[valid]] + positions[valid].astype(np.int64) - 1]
+            bases[valid] = gathered.view('S1').astype(str)
+        return bases
+
+
+def get_transcript_store(transcript_fasta: Mapping, transcript_ids: Iterable[str]) -> TranscriptStore:
+    """
+    Return `transcript_fasta` if it is already a store, otherwise load only the given transcripts into a new one.
+
+    Args:
+        transcript_fasta (Mapping): TranscriptStore, pyfaidx `Fasta` or dictionary of sequences.
+        transcript_ids (Iterable[str]): Transcripts that will be queried.
+
+    Returns:
+        TranscriptStore: Store with the queried transcripts.
+    """
+    if isinstance(transcript_fasta, TranscriptStore):
+        return transcript_fasta
+    return TranscriptStore.from_mapping(transcript_fasta, transcript_ids)
@@ -0,0 +1,132 @@
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def matched_quotas(groups_a: Sequence, groups_b: Sequence) -> pd.Series:
+    """
+    Per-group quotas of a matched sampling of two sets: the smaller of the two group sizes, for groups present
+    in both sets (as the NMD notebooks balance pathogenic and benign variants per gene).
+
+    Args:
+        groups_a (Sequence): Group (e.g. gene symbol) of every row of the first set.
+        groups_b (Sequence): Group of every row of the second set.
+
+    Returns:
+        pd.Series: Quota by group.
+    """
+    counts_a = pd.Series(groups_a).value_counts()
+    counts_b = pd.Series(groups_b).value_counts()
+    common = counts_a.index.intersection(counts_b.index)
+    return np.minimum(counts_a[common], counts_b[common]).astype(np.int64)
+
+
+def stratified_sample_indices(groups: Sequence, quotas: pd.Series, n_replicates: int = 1,
+                              seed: Optional[int] = 42, batch_size: int = 100) -> np.ndarray:
+    """
+    Sample up to `quotas[group]` rows of every group without replacement, for many replicates at once.
+
+    Groups are factorized once. Groups with a quota at least as large as the group are taken whole; rows of other
+    groups are shuffled within their group by sorting random keys inside group blocks, and the first `quota` rows of
+    every group (a cumcount over the sorted codes, the same for all replicates) are taken. Replicates of a batch
+    are shuffled with one sort of a (batch, rows) array.
+
+    Args:
+        groups (Sequence): Group of every row.
+        quotas (pd.Series): Number of rows to sample by group; groups without a quota are not sampled.
+        n_replicates (int): Number of independent samples. Default is 1.
+        seed (int, optional): Random seed; the result does not depend on `batch_size`. Default is 42.
+        batch_size (int): Number of replicates shuffled at once. Default is 100.
+
+    Returns:
+        np.ndarray: Positions of the sampled rows of shape (n_replicates, sample size), sorted in every replicate.
+    """
+    codes, uniques = pd.factorize(pd.Series(groups))
+    # Rows with a missing group get the code -1, i.e. the appended zero quota
+    quota = np.append(quotas.reindex(uniques).fillna(0).to_numpy(dtype=np.int64), 0)
+    sizes = np.append(np.bincount(codes[codes >= 0], minlength=len(uniques)), 0)
+    row_quota, row_size = quota[codes], sizes[codes]
+    whole_rows = np.flatnonzero((row_quota > 0) & (row_quota >= row_size))
+    partial_rows = np.flatnonzero((row_quota > 0) & (row_quota < row_size))
+    partial_codes = codes[partial_rows]
+
+    # Rank of every position of the sorted codes within its group; the first `quota` ranks are taken
+    sorted_codes = np.sort(partial_codes)
+    group_sizes = np.bincount(sorted_codes, minlength=len(quota))
+    group_starts = np.cumsum(group_sizes) - group_sizes
+    ranks = np.arange(len(sorted_codes)) - group_starts[sorted_codes]
+    taken = ranks < quota[sorted_codes]
+
+    rng = np.random.default_rng(seed)
+    sample_size = len(whole_rows) + int(taken.sum())
+    samples = np.empty((n_replicates, sample_size), dtype=np.int64)
+    for start in range(0, n_replicates, batch_size):
+        stop = min(start + batch_size, n_replicates)
+        # Sorting random keys inside group blocks gives an independent shuffle of every group
+        keys = rng.random((stop - start, len(partial_rows)))
+        shuffled = np.lexsort((keys, np.broadcast_to(partial_codes, keys.shape)), axis=-1)
+        chosen = partial_rows[shuffled[:, taken]]
+        batch = np.concatenate([np.broadcast_to(whole_rows, (stop - start, len(whole_rows))), chosen], axis=1)
+        samples[start:stop] = np.sort(batch, axis=1)
+    return samples
+
+
+def stratified_sample(df: pd.DataFrame, group_column: str, quotas: pd.Series,
+                      seed: Optional[int] = 42) -> pd.DataFrame:
+    """
+    Sample up to `quotas[group]` rows of every group of a dataframe, replacing a loop of
+    `df[df[group_column] == group].sample(n=quota)` over the groups.
+
+    Args:
+        df (pd.DataFrame): Data.
+        group_column (str): Group column, e.g. 'Gene_symbol'.
+        quotas (pd.Series): Number of rows to sample by group.
+        seed (int, optional): Random seed. Default is 42.
+
+    Returns:
+        pd.DataFrame: Sampled rows in the order of `df`.
+    """
+    return df.iloc[stratified_sample_indices(df[group_column], quotas, 1, seed)[0]]
+
+
+def matched_sample_indices(df_a: pd.DataFrame, df_b: pd.DataFrame, group_column: str = 'Gene_symbol',
+                           n_replicates: int = 1, seed: Optional[int] = 42) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Replicates of a matched sampling of two sets: in every replicate both sets get the same number of rows
+    of every common group (`matched_quotas`). The sets are sampled with independent seeds spawned from `seed`.
+
+    Args:
+        df_a (pd.DataFrame): First set (e.g. pathogenic variants).
+        df_b (pd.DataFrame): Second set (e.g. benign variants).
+        group_column (str): Group column. Default is 'Gene_symbol'.
+        n_replicates (int): Number of replicates. Default is 1.
+        seed (int, optional): Random seed. Default is 42.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Positions of the sampled rows of both sets,
+            each of shape (n_replicates, sample size).
+    """
+    quotas = matched_quotas(df_a[group_column], df_b[group_column])
+    seed_a, seed_b = np.random.SeedSequence(seed).spawn(2)
+    return (stratified_sample_indices(df_a[group_column], quotas, n_replicates, seed_a),
+            stratified_sample_indices(df_b[group_column], quotas, n_replicates, seed_b))
+
+
+def matched_sample(df_a: pd.DataFrame, df_b: pd.DataFrame, group_column: str = 'Gene_symbol',
+                   seed: Optional[int] = 42) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Matched sampling of two sets: both get the same number of rows of every common group, the smaller
+    of the two group sizes, as the per-gene balancing of pathogenic and benign variants in the NMD notebooks.
+
+    Args:
+        df_a (pd.DataFrame): First set (e.g. pathogenic variants).
+        df_b (pd.DataFrame): Second set (e.g. benign variants).
+        group_column (str): Group column. Default is 'Gene_symbol'.
+        seed (int, optional): Random seed. Default is 42.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: Sampled rows of both sets in the order of the input dataframes.
+    """
+    indices_a, indices_b = matched_sample_indices(df_a, df_b, group_column, 1, seed)
+    return df_a.iloc[indices_a[0]], df_b.iloc[indices_b[0]]
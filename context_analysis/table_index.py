@@ -0,0 +1,324 @@
+import gzip
+import io
+import os
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+# Coordinate columns and columns of the gene/transcript index of the parser outputs
+table_layouts = {
+    'parse_vcf': {
+        'chrom_column': 'Chr', 'pos_column': 'Position',
+        'key_columns': {'gene': 'Gene_symbol', 'transcript': 'Canonical_transcript'},
+    },
+    'parse_clinvar_vcf': {
+        'chrom_column': 'CHROM', 'pos_column': 'POS',
+        'key_columns': {'gene': 'SYMBOL', 'transcript': 'Feature'},
+    },
+    # transcript_conservativity/code/vcf_parser.py
+    'vcf_parsing': {
+        'chrom_column': 'CHROM', 'pos_column': 'POS',
+        'key_columns': {'gene': 'SYMBOL', 'transcript': 'Feature'},
+    },
+}
+
+# Extension of the gene/transcript index written next to the table
+key_index_suffix = '.keys.tsv'
+key_index_columns = ['Kind', 'Column', 'Key', 'Chrom', 'Start', 'End', 'First_offset', 'End_offset', 'Rows']
+
+# Separator of multiple values in a cell (e.g. several canonical transcripts of a variant)
+value_separator = ', '
+
+
+def is_bgzf(table_file: str) -> bool:
+    """
+    Check whether a file is BGZF-compressed (a gzip file with the 'BC' extra subfield).
+
+    Args:
+        table_file (str): Path to the file.
+
+    Returns:
+        bool: True for bgzipped files.
+    """
+    with open(table_file, 'rb') as file:
+        magic = file.read(18)
+    return len(magic) == 18 and magic[:3] == b'\x1f\x8b\x08' and magic[3] & 4 and magic[12:14] == b'BC'
+
+
+def to_bgzf(table_file: str) -> str:
+    """
+    Compress a table with BGZF, which allows random access by virtual offsets.
+    Plain tables are compressed to a new '.gz' file, gzip tables are recompressed in place.
+
+    Args:
+        table_file (str): Path to a plain, gzip or bgzip table.
+
+    Returns:
+        str: Path to the bgzipped table.
+    """
+    import pysam
+
+    if is_bgzf(table_file):
+        return table_file
+    with open(table_file, 'rb') as file:
+        is_gzip = file.read(2) == b'\x1f\x8b'
+    if not is_gzip:
+        output_file = table_file + '.gz'
+        pysam.tabix_compress(table_file, output_file, force=True)
+        return output_file
+
+    tmp_file = table_file + '.tmp'
+    with gzip.open(table_file, 'rb') as input_file, pysam.BGZFile(tmp_file, 'wb') as output_file:
+        for chunk in iter(lambda: input_file.read(1 << 20), b''):
+            output_file.write(chunk)
+    os.replace(tmp_file, table_file)
+    return table_file
+
+
+def scan_table(table_file: str, chrom_column: str, pos_column: str,
+               key_columns: Dict[str, str]) -> Tuple[List[str], pd.DataFrame]:
+    """
+    Read a bgzipped table once, checking that it is sorted by coordinate and collecting the span of every key
+    (gene symbol, transcript ID, ...) as virtual offsets of its first row and of the row after its last one.
+
+    Args:
+        table_file (str): Path to the bgzipped table with a header line.
+        chrom_column (str): Name of the chromosome column.
+        pos_column (str): Name of the position column.
+        key_columns (Dict[str, str]): Indexed columns by key kind, e.g. {'gene': 'Gene_symbol'}.
+
+    Returns:
+        Tuple[List[str], pd.DataFrame]: Header of the table and the key index with `key_index_columns`.
+
+    Raises:
+        ValueError: If a column is missing or the table is not sorted by chromosome and position.
+    """
+    import pysam
+
+    spans = {}
+    with pysam.BGZFile(table_file, 'rb') as table:
+        header = table.readline().decode().rstrip('\r\n').split('\t')
+        missing = [column for column in [chrom_column, pos_column, *key_columns.values()] if column not in header]
+        if missing:
+            raise ValueError(f'Columns {missing} are not in the header of {table_file}')
+        chrom_idx = header.index(chrom_column)
+        pos_idx = header.index(pos_column)
+        key_indices = [(kind, column, header.index(column)) for kind, column in key_columns.items()]
+
+        seen_chroms = set()
+        chrom, last_pos, line_number = None, 0, 1
+        while True:
+            offset = table.tell()
+            line = table.readline()
+            if not line:
+                break
+            line_number += 1
+            fields = line.decode().rstrip('\r\n').split('\t')
+            pos = int(fields[pos_idx])
+            if fields[chrom_idx] != chrom:
+                chrom = fields[chrom_idx]
+                if chrom in seen_chroms:
+                    raise ValueError(f'{table_file} is not sorted: {chrom} is split at line {line_number}')
+                seen_chroms.add(chrom)
+            elif pos < last_pos:
+                raise ValueError(f'{table_file} is not sorted: position {pos} after {last_pos} at line {line_number}')
+            last_pos = pos
+            end_offset = table.tell()
+
+            for kind, column, idx in key_indices:
+                for key in fields[idx].split(value_separator):
+                    if not key:
+                        continue
+                    span = spans.get((kind, column, key, chrom))
+                    if span is None:
+                        spans[kind, column, key, chrom] = [pos, pos, offset, end_offset, 1]
+                    else:
+                        span[1] = pos
+                        span[3] = end_offset
+                        span[4] += 1
+
+    key_index = pd.DataFrame([(*key, *span) for key, span in spans.items()], columns=key_index_columns)
+    return header, key_index
+
+
+def index_table(table_file: str, chrom_column: str, pos_column: str,
+                key_columns: Optional[Dict[str, str]] = None, csi: bool = False) -> str:
+    """
+    Index a coordinate-sorted parser output for random access: the table is compressed with BGZF (if it is not yet),
+    indexed with tabix (or CSI for chromosomes longer than 2^29 bp) by chromosome and position, and the spans of
+    genes and transcripts are saved to a secondary index (`key_index_suffix`) used by `IndexedTable`.
+
+    Args:
+        table_file (str): Path to a plain, gzip or bgzip TSV table with a header line, e.g. written by `parse_vcf`.
+        chrom_column (str): Name of the chromosome column.
+        pos_column (str): Name of the position column (1-based).
+        key_columns (Dict[str, str], optional): Indexed columns by key kind, e.g. {'gene': 'Gene_symbol',
+            'transcript': 'Canonical_transcript'}; see `table_layouts`. Defaults to no secondary index.
+        csi (bool): Write a CSI index instead of a tabix one. Default is False.
+
+    Returns:
+        str: Path to the bgzipped table.
+
+    Raises:
+        ValueError: If the table is not sorted by chromosome and position.
+    """
+    import pysam
+
+    table_file = to_bgzf(table_file)
+    header, key_index = scan_table(table_file, chrom_column, pos_column, key_columns or {})
+    pos_idx = header.index(pos_column)
+    pysam.tabix_index(table_file, force=True, seq_col=header.index(chrom_column), start_col=pos_idx,
+                      end_col=pos_idx, line_skip=1, csi=csi)
+    if key_columns:
+        key_index.to_csv(table_file + key_index_suffix, sep='\t', index=False)
+    return table_file
+
+
+def index_parser_output(table_file: str, parser_name: str, csi: bool = False) -> str:
+    """
+    `index_table` with the columns of a parser output.
+
+    Args:
+        table_file (str): Path to the output table.
+        parser_name (str): 'parse_vcf', 'parse_clinvar_vcf' or 'vcf_parsing' (see `table_layouts`).
+        csi (bool): Write a CSI index instead of a tabix one. Default is False.
+
+    Returns:
+        str: Path to the bgzipped table.
+    """
+    if parser_name not in table_layouts:
+        raise ValueError(f'Unknown parser: {parser_name}. Choose one of {list(table_layouts)}')
+    return index_table(table_file, csi=csi, **table_layouts[parser_name])
+
+
+class IndexedTable:
+    """
+    Random access to a table indexed with `index_table`: rows of a region are read with the tabix index,
+    rows of a gene or a transcript are read from the span recorded in the secondary index, so only a few
+    BGZF blocks are decompressed instead of the whole table.
+    """
+
+    def __init__(self, table_file: str) -> None:
+        """
+        Args:
+            table_file (str): Path to the bgzipped table with its tabix/CSI index
+                (and the gene/transcript index for `gene`/`transcript` queries).
+        """
+        import pysam
+
+        self.table_file = table_file
+        self._tabix = pysam.TabixFile(table_file)
+        self._table = pysam.BGZFile(table_file, 'rb')
+        self.header = self._table.readline().decode().rstrip('\r\n').split('\t')
+        self.chromosomes = set(self._tabix.contigs)
+
+        self.spans = {}
+        key_index_file = table_file + key_index_suffix
+        if os.path.exists(key_index_file):
+            key_index = pd.read_csv(key_index_file, sep='\t', dtype={'Key': str, 'Chrom': str})
+            for kind, column, key, chrom, _, _, first_offset, end_offset, _ in key_index.itertuples(index=False):
+                self.spans.setdefault((kind, key), []).append(
+                    (self.header.index(column), int(first_offset), int(end_offset)))
+
+    def __enter__(self) -> 'IndexedTable':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Close the table handles.
+        """
+        self._tabix.close()
+        self._table.close()
+
+    def fetch_region(self, chrom: str, start: Optional[int] = None, end: Optional[int] = None) -> List[str]:
+        """
+        Lines of the variants with a position in a region.
+
+        Args:
+            chrom (str): Chromosome as written in the table.
+            start (int, optional): 1-based start of the region. Defaults to the chromosome start.
+            end (int, optional): 1-based inclusive end of the region. Defaults to the chromosome end.
+
+        Returns:
+            List[str]: Table lines without line endings.
+        """
+        if chrom not in self.chromosomes:
+            return []
+        start = None if start is None else max(start - 1, 0)
+        return [line.rstrip('\r') for line in self._tabix.fetch(chrom, start, end)]
+
+    def fetch_key(self, kind: str, key: str) -> List[str]:
+        """
+        Lines of the rows that contain a key (e.g. a gene symbol) in its column.
+
+        Args:
+            kind (str): Key kind, e.g. 'gene' or 'transcript'.
+            key (str): Key value.
+
+        Returns:
+            List[str]: Table lines without line endings.
+        """
+        lines = []
+        for idx, first_offset, end_offset in self.spans.get((kind, key), []):
+            self._table.seek(first_offset)
+            # Rows of other keys inside the span are skipped
+            while self._table.tell() < end_offset:
+                line = self._table.readline().decode().rstrip('\r\n')
+                if key in line.split('\t')[idx].split(value_separator):
+                    lines.append(line)
+        return lines
+
+    def to_frame(self, lines: List[str]) -> pd.DataFrame:
+        """
+        Convert table lines into a dataframe with the column types `pd.read_csv` infers for the whole table.
+
+        Args:
+            lines (List[str]): Table lines.
+
+        Returns:
+            pd.DataFrame: Rows with the table header.
+        """
+        if not lines:
+            return pd.DataFrame(columns=self.header)
+        return pd.read_csv(io.StringIO('\n'.join(lines)), sep='\t', names=self.header, header=None)
+
+    def region(self, chrom: str, start: Optional[int] = None, end: Optional[int] = None) -> pd.DataFrame:
+        """
+        Variants with a position in a region.
+
+        Args:
+            chrom (str): Chromosome as written in the table.
+            start (int, optional): 1-based start of the region. Defaults to the chromosome start.
+            end (int, optional): 1-based inclusive end of the region. Defaults to the chromosome end.
+
+        Returns:
+            pd.DataFrame: Rows of the region.
+        """
+        return self.to_frame(self.fetch_region(chrom, start, end))
+
+    def gene(self, symbol: str) -> pd.DataFrame:
+        """
+        Variants annotated with a gene symbol.
+
+        Args:
+            symbol (str): Gene symbol, e.g. 'TP53'.
+
+        Returns:
+            pd.DataFrame: Rows of the gene.
+        """
+        return self.to_frame(self.fetch_key('gene', symbol))
+
+    def transcript(self, transcript_id: str) -> pd.DataFrame:
+        """
+        Variants annotated with a transcript.
+
+        Args:
+            transcript_id (str): Ensembl transcript ID, e.g. 'ENST00000269305'.
+
+        Returns:
+            pd.DataFrame: Rows of the transcript.
+        """
+        return self.to_frame(self.fetch_key('transcript', transcript_id))
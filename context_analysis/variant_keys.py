@@ -0,0 +1,375 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Columns identifying a variant in the parsed gnomAD and ClinVar tables
+variant_columns = ['CHROM', 'POS', 'REF', 'ALT']
+
+join_types = ('inner', 'left', 'outer', 'anti', 'semi')
+
+# Layout of a 64-bit variant key (from the most significant bits):
+# chromosome code (5 bits) | position (28 bits) | fallback flag (1 bit) | alleles (30 bits).
+# Inline alleles are len(REF) (4 bits) | len(ALT) (4 bits) | REF + ALT bases, 2 bits per base (up to 11 bases);
+# other alleles (long indels, N, '*') are stored in the fallback table of the encoder and keyed by their index.
+chromosome_shift = 59
+position_shift = 31
+fallback_flag = 1 << 30
+max_position = (1 << 28) - 1
+max_inline_bases = 11
+
+# Codes of the human chromosomes; codes 26-31 are given to other contigs in order of appearance
+chromosome_codes = {str(chrom): chrom for chrom in range(1, 23)}
+chromosome_codes.update({'X': 23, 'Y': 24, 'M': 25, 'MT': 25})
+max_chromosome_code = 31
+
+# 2-bit code of every byte: A/C/G/T, 0 for the padding of fixed-width byte strings, 255 for other letters
+base_codes = np.full(256, 255, dtype=np.uint8)
+base_codes[0] = 0
+for code, base in enumerate(b'ACGT'):
+    base_codes[base] = code
+
+
+class VariantKeyEncoder:
+    """
+    Encoder of (CHROM, POS, REF, ALT) into sortable 64-bit integer keys.
+
+    SNVs and short indels are packed into the key itself; alleles that do not fit (more than 11 bases in total
+    or letters other than A/C/G/T) are numbered in a fallback table kept by the encoder. Keys of different
+    tables are comparable only when they are encoded by the same encoder, which `join_variants` takes care of.
+    Sorting the keys sorts variants by chromosome and position.
+    """
+
+    def __init__(self) -> None:
+        self.contigs: Dict[str, int] = {}
+        self.fallback_alleles: Dict[Tuple[str, str], int] = {}
+        self._fallback_list: List[Tuple[str, str]] = []
+
+    def get_chromosome_codes(self, chroms: Iterable) -> np.ndarray:
+        """
+        Encode chromosome names ('chr1' and '1' get the same code).
+
+        Args:
+            chroms (Iterable): Chromosome names.
+
+        Returns:
+            np.ndarray: Codes (uint64).
+
+        Raises:
+            ValueError: If there are more contigs than free codes.
+        """
+        labels, uniques = pd.factorize(np.asarray(chroms, dtype=object))
+        unique_codes = np.empty(len(uniques), dtype=np.uint64)
+        for idx, chrom in enumerate(uniques):
+            chrom = str(chrom)
+            name = chrom[3:] if chrom.startswith('chr') else chrom
+            code = chromosome_codes.get(name)
+            if code is None:
+                if name not in self.contigs:
+                    if 26 + len(self.contigs) > max_chromosome_code:
+                        raise ValueError(f'Too many contigs to encode: {chrom}')
+                    self.contigs[name] = 26 + len(self.contigs)
+                code = self.contigs[name]
+            unique_codes[idx] = code
+        return unique_codes[labels]
+
+    def encode(self, chroms: Iterable, positions: Iterable, refs: Iterable, alts: Iterable) -> np.ndarray:
+        """
+        Encode variants into 64-bit keys.
+
+        Args:
+            chroms (Iterable): Chromosomes.
+            positions (Iterable): 1-based positions (below 2^28).
+            refs (Iterable): Reference alleles.
+            alts (Iterable): Alternative alleles.
+
+        Returns:
+            np.ndarray: Keys (uint64).
+
+        Raises:
+            ValueError: If a position is missing or out of range.
+        """
+        positions = pd.to_numeric(pd.Series(positions), errors='coerce').to_numpy(dtype=float)
+        if np.isnan(positions).any() or (positions < 0).any() or (positions > max_position).any():
+            raise ValueError(f'Positions must be integers between 0 and {max_position}')
+        refs = np.asarray(refs, dtype=object)
+        alts = np.asarray(alts, dtype=object)
+
+        # Alleles as fixed-width byte strings: one byte more than fits inline, so longer alleles are detected
+        width = max_inline_bases + 1
+        shifts = 2 * np.arange(width, dtype=np.uint64)
+        packed, lengths, valid = [], [], np.ones(len(refs), dtype=bool)
+        for alleles in (refs, alts):
+            raw = alleles.astype(f'S{width}').view(np.uint8).reshape(-1, width)
+            codes = base_codes[raw]
+            valid &= (codes != 255).all(axis=1)
+            lengths.append((raw != 0).sum(axis=1).astype(np.uint64))
+            packed.append((np.where(codes == 255, 0, codes).astype(np.uint64) << shifts).sum(axis=1, dtype=np.uint64))
+        ref_lengths, alt_lengths = lengths
+
+        inline = valid & (ref_lengths >= 1) & (alt_lengths >= 1) & (ref_lengths + alt_lengths <= max_inline_bases)
+        payload = packed[0] | (packed[1] << (np.uint64(2) * ref_lengths))
+        payload |= (ref_lengths << np.uint64(26)) | (alt_lengths << np.uint64(22))
+        payload[~inline] = 0
+
+        for row in np.flatnonzero(~inline):
+            alleles = (str(refs[row]), str(alts[row]))
+            idx = self.fallback_alleles.get(alleles)
+            if idx is None:
+                idx = len(self._fallback_list)
+                self.fallback_alleles[alleles] = idx
+                self._fallback_list.append(alleles)
+            payload[row] = fallback_flag | idx
+
+        chrom_codes = self.get_chromosome_codes(chroms)
+        return ((chrom_codes << np.uint64(chromosome_shift))
+                | (positions.astype(np.uint64) << np.uint64(position_shift)) | payload)
+
+    def encode_frame(self, df: pd.DataFrame, columns: Sequence[str] = variant_columns) -> np.ndarray:
+        """
+        Encode the variants of a dataframe.
+
+        Args:
+            df (pd.DataFrame): Dataframe with chromosome, position, REF and ALT columns.
+            columns (Sequence[str]): Names of these columns. Default is `variant_columns`.
+
+        Returns:
+            np.ndarray: Keys (uint64) in the order of the rows.
+        """
+        chrom, pos, ref, alt = columns
+        return self.encode(df[chrom], df[pos], df[ref], df[alt])
+
+    def decode(self, keys: np.ndarray) -> pd.DataFrame:
+        """
+        Decode keys back into variants.
+
+        Args:
+            keys (np.ndarray): Keys produced by this encoder.
+
+        Returns:
+            pd.DataFrame: 'CHROM' (with the 'chr' prefix), 'POS', 'REF' and 'ALT' columns.
+        """
+        keys = np.asarray(keys, dtype=np.uint64)
+        names = {code: name for name, code in chromosome_codes.items() if name != 'MT'}
+        names.update({code: name for name, code in self.contigs.items()})
+        chrom_codes = (keys >> np.uint64(chromosome_shift)).astype(np.int64)
+        positions = ((keys >> np.uint64(position_shift)) & np.uint64(max_position)).astype(np.int64)
+
+        refs = np.empty(len(keys), dtype=object)
+        alts = np.empty(len(keys), dtype=object)
+        for idx, key in enumerate(keys.tolist()):
+            payload = key & ((1 << 31) - 1)
+            if payload & fallback_flag:
+                refs[idx], alts[idx] = self._fallback_list[payload & (fallback_flag - 1)]
+            else:
+                ref_length, alt_length = (payload >> 26) & 15, (payload >> 22) & 15
+                bases = ''.join('ACGT'[(payload >> (2 * i)) & 3] for i in range(ref_length + alt_length))
+                refs[idx], alts[idx] = bases[:ref_length], bases[ref_length:]
+        return pd.DataFrame({
+            'CHROM': ['chr' + names.get(code, str(code)) for code in chrom_codes],
+            'POS': positions, 'REF': refs, 'ALT': alts,
+        })
+
+
+class VariantIndex:
+    """
+    Sorted index of variant keys with the boundaries of every chromosome.
+
+    Lookups are binary searches in the sorted keys, so a batch of variants is matched against the index
+    in O(n log m) without building a hash table of strings.
+    """
+
+    def __init__(self, keys: np.ndarray) -> None:
+        """
+        Args:
+            keys (np.ndarray): Keys of the indexed rows (uint64), e.g. from `VariantKeyEncoder.encode_frame`.
+        """
+        keys = np.asarray(keys, dtype=np.uint64)
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+        # Rows of chromosome code c are sorted_keys[bounds[c]:bounds[c + 1]]
+        starts = np.arange(max_chromosome_code + 1, dtype=np.uint64) << np.uint64(chromosome_shift)
+        self.bounds = np.append(np.searchsorted(self.sorted_keys, starts), len(self.sorted_keys))
+
+    def __len__(self) -> int:
+        return len(self.sorted_keys)
+
+    def lookup_ranges(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the sorted positions of the rows matching every key.
+
+        Args:
+            keys (np.ndarray): Query keys.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Start and end of the matching rows in `order` for every key
+                (equal if the key is not indexed).
+        """
+        keys = np.asarray(keys, dtype=np.uint64)
+        starts = np.searchsorted(self.sorted_keys, keys, side='left')
+        ends = starts.copy()
+        if len(self.sorted_keys):
+            found = self.sorted_keys[np.minimum(starts, len(self.sorted_keys) - 1)] == keys
+            # The second search is needed only for the keys in the index
+            ends[found] = np.searchsorted(self.sorted_keys, keys[found], side='right')
+        return starts, ends
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        """
+        Check which keys are in the index.
+
+        Args:
+            keys (np.ndarray): Query keys.
+
+        Returns:
+            np.ndarray: Boolean mask.
+        """
+        start, end = self.lookup_ranges(keys)
+        return end > start
+
+    def region(self, chrom_code: int, start: int, end: int) -> np.ndarray:
+        """
+        Rows of the variants in a region of a chromosome.
+
+        Args:
+            chrom_code (int): Chromosome code (see `VariantKeyEncoder.get_chromosome_codes`).
+            start (int): 1-based start of the region.
+            end (int): 1-based end of the region (inclusive).
+
+        Returns:
+            np.ndarray: Row positions of the indexed variants, sorted by position.
+        """
+        chrom_keys = self.sorted_keys[self.bounds[chrom_code]:self.bounds[chrom_code + 1]]
+        base = np.uint64(chrom_code) << np.uint64(chromosome_shift)
+        low = base | (np.uint64(start) << np.uint64(position_shift))
+        high = base | (np.uint64(end + 1) << np.uint64(position_shift))
+        first = self.bounds[chrom_code] + np.searchsorted(chrom_keys, low, side='left')
+        last = self.bounds[chrom_code] + np.searchsorted(chrom_keys, high, side='left')
+        return self.order[first:last]
+
+
+def expand_ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    Concatenate the integer ranges [start, start + count) without a Python loop.
+
+    Args:
+        starts (np.ndarray): Starts of the ranges.
+        counts (np.ndarray): Lengths of the ranges.
+
+    Returns:
+        np.ndarray: Concatenated ranges.
+    """
+    total = int(counts.sum())
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + np.arange(total) - offsets
+
+
+def take_rows(df: pd.DataFrame, rows: np.ndarray) -> pd.DataFrame:
+    """
+    Select rows by position; positions -1 give missing values.
+
+    Args:
+        df (pd.DataFrame): Dataframe.
+        rows (np.ndarray): Row positions or -1.
+
+    Returns:
+        pd.DataFrame: Selected rows with a new RangeIndex.
+    """
+    return df.reset_index(drop=True).reindex(rows).reset_index(drop=True)
+
+
+def join_variants(left: pd.DataFrame, right: pd.DataFrame, how: str = 'inner',
+                  on: Sequence[str] = variant_columns, suffixes: Tuple[str, str] = ('_x', '_y'),
+                  coalesce: bool = False, indicator: bool = False,
+                  encoder: Optional[VariantKeyEncoder] = None, left_keys: Optional[np.ndarray] = None,
+                  right_keys: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """
+    Join two variant tables (e.g. gnomAD and ClinVar parses) on CHROM/POS/REF/ALT through 64-bit keys.
+
+    Rows of `left` keep their order, each followed by its matches in `right` (all pairs for duplicated keys,
+    as in `pd.merge`); for 'outer' joins, unmatched rows of `right` are appended in their order.
+
+    Args:
+        left (pd.DataFrame): Left table.
+        right (pd.DataFrame): Right table.
+        how (str): 'inner', 'left', 'outer', 'anti' (rows of `left` without a match, as the
+            `drop_duplicates(keep=False)` step of the NMD notebooks) or 'semi' (rows of `left` with a match).
+            Default is 'inner'.
+        on (Sequence[str]): Chromosome, position, REF and ALT columns of both tables. Default is `variant_columns`.
+        suffixes (Tuple[str, str]): Suffixes of other columns present in both tables. Default is ('_x', '_y').
+        coalesce (bool): Merge columns present in both tables into one, taking the right value where the left
+            one is missing (instead of the `_x`/`_y` pair filled by hand). Default is False.
+        indicator (bool): Add a '_merge' column ('both', 'left_only' or 'right_only'). Default is False.
+        encoder (VariantKeyEncoder, optional): Encoder shared by both tables. Defaults to a new encoder.
+        left_keys (np.ndarray, optional): Keys of `left` computed before with `encoder`, so that a table joined
+            several times is encoded once. Defaults to None (encoded here).
+        right_keys (np.ndarray, optional): Keys of `right` computed before with `encoder`. Defaults to None.
+
+    Returns:
+        pd.DataFrame: Joined table with a new RangeIndex.
+    """
+    if how not in join_types:
+        raise ValueError(f'Unknown join type: {how}. Choose one of {join_types}')
+    on = list(on)
+    if (left_keys is not None or right_keys is not None) and encoder is None:
+        raise ValueError('Precomputed keys require the encoder that produced them')
+    encoder = encoder or VariantKeyEncoder()
+    if left_keys is None:
+        left_keys = encoder.encode_frame(left, on)
+    if right_keys is None:
+        right_keys = encoder.encode_frame(right, on)
+    index = VariantIndex(right_keys)
+    starts, ends = index.lookup_ranges(left_keys)
+    counts = ends - starts
+
+    if how in ('anti', 'semi'):
+        mask = counts == 0 if how == 'anti' else counts > 0
+        return left[mask].reset_index(drop=True)
+
+    if how == 'inner':
+        left_rows = np.repeat(np.arange(len(left)), counts)
+        right_rows = index.order[expand_ranges(starts, counts)]
+    else:
+        # Unmatched left rows get one row with a missing right side
+        left_counts = np.maximum(counts, 1)
+        left_rows = np.repeat(np.arange(len(left)), left_counts)
+        right_rows = np.full(len(left_rows), -1, dtype=np.int64)
+        matched = np.repeat(counts > 0, left_counts)
+        right_rows[matched] = index.order[expand_ranges(starts, counts)]
+        if how == 'outer':
+            used = np.zeros(len(right), dtype=bool)
+            used[right_rows[matched]] = True
+            unmatched = np.flatnonzero(~used)
+            left_rows = np.concatenate([left_rows, np.full(len(unmatched), -1, dtype=np.int64)])
+            right_rows = np.concatenate([right_rows, unmatched])
+
+    has_left, has_right = left_rows >= 0, right_rows >= 0
+    columns = {}
+    for column in on:
+        left_values = left[column].to_numpy()[np.where(has_left, left_rows, 0)] if len(left) else None
+        right_values = right[column].to_numpy()[np.where(has_right, right_rows, 0)] if len(right) else None
+        if left_values is None:
+            columns[column] = right_values
+        elif right_values is None:
+            columns[column] = left_values
+        else:
+            columns[column] = np.where(has_left, left_values, right_values)
+    result = pd.DataFrame(columns, index=pd.RangeIndex(len(left_rows)))
+
+    left_other = take_rows(left.drop(columns=on), left_rows)
+    right_other = take_rows(right.drop(columns=on), right_rows)
+    shared = [column for column in left_other.columns if column in right_other.columns]
+    if coalesce:
+        for column in shared:
+            left_other[column] = left_other[column].fillna(right_other[column])
+        right_other = right_other.drop(columns=shared)
+    else:
+        left_other = left_other.rename(columns={column: column + suffixes[0] for column in shared})
+        right_other = right_other.rename(columns={column: column + suffixes[1] for column in shared})
+    result = pd.concat([result, left_other, right_other], axis=1)
+
+    if indicator:
+        result['_merge'] = pd.Categorical(np.where(has_left & has_right, 'both',
+                                                   np.where(has_left, 'left_only', 'right_only')),
+                                          categories=['left_only', 'right_only', 'both'])
+    return result
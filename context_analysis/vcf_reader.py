@@ -0,0 +1,220 @@
+import gzip
+import os
+import re
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+from run_profile import RunProfile
+
+# Bytes of compressed data read at once and decompressed by one task (about 64 BGZF blocks)
+chunk_size = 1 << 22
+
+# Number of VCF columns split by `iter_vcf_records` (CHROM ... INFO); FORMAT and sample columns are not split
+n_vcf_columns = 8
+
+# Start of the first line that is not a header line ('#...')
+data_start = re.compile(rb'(?m)^[^#]')
+
+
+def default_threads() -> int:
+    """
+    Default number of decompression threads: the available CPUs, at most 4
+    (decompression is rarely the bottleneck beyond that).
+
+    Returns:
+        int: Number of threads.
+    """
+    return max(1, min(4, len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1))
+
+
+def is_bgzf_header(header: bytes) -> bool:
+    """
+    Check whether bytes start with a BGZF block header (a gzip member with the 'BC' extra subfield).
+
+    Args:
+        header (bytes): At least the first 18 bytes of the file.
+
+    Returns:
+        bool: True for BGZF files.
+    """
+    return len(header) >= 18 and header[:4] == b'\x1f\x8b\x08\x04' and header[12:14] == b'BC'
+
+
+def split_bgzf_blocks(buffer: bytes) -> Tuple[List[Tuple[int, int]], int]:
+    """
+    Find complete BGZF blocks in a buffer using the block sizes stored in their headers.
+
+    Args:
+        buffer (bytes): Compressed data starting at a block boundary.
+
+    Returns:
+        Tuple[List[Tuple[int, int]], int]: Start and end of the deflate data of every complete block,
+            and the end of the last complete block.
+
+    Raises:
+        ValueError: If a block header is not a BGZF header.
+    """
+    blocks = []
+    pos = 0
+    while pos + 18 <= len(buffer):
+        if buffer[pos:pos + 4] != b'\x1f\x8b\x08\x04' or buffer[pos + 12:pos + 14] != b'BC':
+            raise ValueError(f'Invalid BGZF block header at offset {pos}')
+        extra_length = int.from_bytes(buffer[pos + 10:pos + 12], 'little')
+        block_size = int.from_bytes(buffer[pos + 16:pos + 18], 'little') + 1
+        if pos + block_size > len(buffer):
+            break
+        # Header (12 bytes + extra fields), deflate data, CRC32 and input size (8 bytes)
+        blocks.append((pos + 12 + extra_length, pos + block_size - 8))
+        pos += block_size
+    return blocks, pos
+
+
+def inflate_blocks(buffer: bytes, blocks: List[Tuple[int, int]]) -> bytes:
+    """
+    Decompress BGZF blocks (run in a worker thread: zlib releases the GIL).
+
+    Args:
+        buffer (bytes): Compressed data.
+        blocks (List[Tuple[int, int]]): Start and end of the deflate data of the blocks.
+
+    Returns:
+        bytes: Decompressed data of all blocks.
+    """
+    view = memoryview(buffer)
+    return b''.join([zlib.decompress(view[start:end], -zlib.MAX_WBITS) for start, end in blocks])
+
+
+def iter_bgzf_chunks(file, threads: int) -> Iterator[bytes]:
+    """
+    Decompress a BGZF stream in chunks of `chunk_size` compressed bytes, in parallel threads.
+    Chunks are returned in file order, and at most two chunks per thread are in flight.
+
+    Args:
+        file: Binary file object positioned at a block boundary.
+        threads (int): Number of decompression threads; 1 decompresses in the calling thread.
+
+    Yields:
+        bytes: Decompressed data.
+    """
+    def iter_tasks() -> Iterator[Tuple[bytes, List[Tuple[int, int]]]]:
+        leftover = b''
+        while True:
+            data = file.read(chunk_size)
+            buffer = leftover + data if leftover else data
+            blocks, end = split_bgzf_blocks(buffer)
+            if blocks:
+                yield buffer, blocks
+            leftover = buffer[end:]
+            if not data:
+                if leftover:
+                    raise ValueError('Truncated BGZF file')
+                return
+
+    if threads <= 1:
+        for buffer, blocks in iter_tasks():
+            yield inflate_blocks(buffer, blocks)
+        return
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = deque()
+        for buffer, blocks in iter_tasks():
+            pending.append(executor.submit(inflate_blocks, buffer, blocks))
+            if len(pending) >= 2 * threads:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_decompressed_chunks(vcf_file: str, threads: Optional[int] = None,
+                             profile: Optional[RunProfile] = None) -> Iterator[bytes]:
+    """
+    Read a VCF file in large decompressed chunks: BGZF files with parallel block decompression,
+    other gzip files with a single zlib stream, uncompressed files as they are.
+
+    Args:
+        vcf_file (str): Path to the VCF file.
+        threads (int, optional): Number of decompression threads for BGZF files. Defaults to `default_threads()`.
+        profile (RunProfile, optional): Profile counting the compressed bytes read ('bytes_in', including the
+            read-ahead of the decompression threads) and the decompressed bytes ('bytes_decompressed').
+
+    Yields:
+        bytes: Decompressed data.
+    """
+    with open(vcf_file, 'rb') as raw_file:
+        header = raw_file.read(18)
+        raw_file.seek(0)
+        if is_bgzf_header(header):
+            chunks = iter_bgzf_chunks(raw_file, threads or default_threads())
+        else:
+            file = gzip.GzipFile(fileobj=raw_file) if header[:2] == b'\x1f\x8b' else raw_file
+            chunks = iter(lambda: file.read(chunk_size), b'')
+        if profile is None:
+            yield from chunks
+            return
+        for chunk in chunks:
+            profile.counters['bytes_in'] = raw_file.tell()
+            profile.count('bytes_decompressed', len(chunk))
+            yield chunk
+
+
+def iter_vcf_lines(vcf_file: str, threads: Optional[int] = None,
+                   profile: Optional[RunProfile] = None) -> Iterator[str]:
+    """
+    Data lines of a VCF file. Header lines are skipped in bulk (they are never split into lines),
+    and every decompressed chunk is decoded and split at once.
+
+    Args:
+        vcf_file (str): Path to the VCF file (BGZF, gzip or uncompressed).
+        threads (int, optional): Number of decompression threads for BGZF files. Defaults to `default_threads()`.
+        profile (RunProfile, optional): Profile timing the decompression as the 'decompress' stage.
+
+    Yields:
+        str: Lines without the line break.
+    """
+    remainder = b''
+    in_header = True
+    chunks = iter_decompressed_chunks(vcf_file, threads, profile)
+    if profile is not None:
+        chunks = profile.timed_iter(chunks, 'decompress')
+    for chunk in chunks:
+        data = remainder + chunk if remainder else chunk
+        if in_header:
+            match = data_start.search(data)
+            if match is None:
+                # Keep only the last (possibly incomplete) header line
+                remainder = data[data.rfind(b'\n') + 1:]
+                continue
+            data = data[match.start():]
+            in_header = False
+        last_break = data.rfind(b'\n')
+        if last_break < 0:
+            remainder = data
+            continue
+        remainder = data[last_break + 1:]
+        yield from data[:last_break].decode().replace('\r', '').split('\n')
+    if remainder and not (in_header and remainder.startswith(b'#')):
+        yield remainder.decode().rstrip('\r')
+
+
+def iter_vcf_records(vcf_file: str, threads: Optional[int] = None,
+                     profile: Optional[RunProfile] = None) -> Iterator[List[str]]:
+    """
+    Records of a VCF file split into the first 8 columns (CHROM, POS, ID, REF, ALT, QUAL, FILTER, INFO),
+    without csv quoting rules: columns are split at tabs only, and INFO is kept as one string.
+
+    Args:
+        vcf_file (str): Path to the VCF file (BGZF, gzip or uncompressed).
+        threads (int, optional): Number of decompression threads for BGZF files. Defaults to `default_threads()`.
+        profile (RunProfile, optional): Profile of the run, see `iter_decompressed_chunks` and `iter_vcf_lines`.
+
+    Yields:
+        List[str]: Values of the first 8 columns.
+    """
+    for line in iter_vcf_lines(vcf_file, threads, profile):
+        if line:
+            fields = line.split('\t', n_vcf_columns)
+            if len(fields) > n_vcf_columns:
+                del fields[n_vcf_columns:]
+            yield fields
@@ -0,0 +1,235 @@
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from info_fields import info_header_pattern, read_header
+
+# Parser for the 'Format:' part of the VEP ##INFO header line
+vep_format_pattern = re.compile(r'Format: ([^"]*)"')
+
+
+def find_vep_info_key(info_lines: Dict[str, str]) -> str:
+    """
+    Find the INFO key of the VEP annotation: the ##INFO line with a 'Format:' string ('vep' in gnomAD,
+    'CSQ' in VEP output by default).
+
+    Args:
+        info_lines (Dict[str, str]): ##INFO header lines by key.
+
+    Returns:
+        str: INFO key.
+
+    Raises:
+        ValueError: If no line or several lines have a Format string.
+    """
+    keys = [key for key, line in info_lines.items() if vep_format_pattern.search(line)]
+    if len(keys) != 1:
+        found = ', '.join(keys) if keys else 'none'
+        raise ValueError(f'Expected one VEP INFO field with a Format string in the header, found {found}; '
+                         'pass the INFO key explicitly')
+    return keys[0]
+
+
+class VepDecoder:
+    """
+    Decoder of VEP annotations (the `vep`/`CSQ` INFO field) driven by the 'Format:' string of the VCF header.
+
+    Column indices of the requested fields are computed once. Each annotation is split per transcript on ','
+    and only up to the last requested field on '|', so the rest of the transcript record is never split.
+    """
+
+    def __init__(self, names: Sequence[str], fields: Iterable[str],
+                 fallback_names: Optional[Sequence[str]] = None, info_key: str = 'vep') -> None:
+        """
+        Args:
+            names (Sequence[str]): Names of the VEP fields in the order of the annotation.
+            fields (Iterable[str]): Fields to extract, returned in the given order.
+            fallback_names (Sequence[str], optional): Names used instead of `names` when the annotations
+                contain a different number of fields than `names` declares (as in the gnomAD v4.0 header,
+                which lists 46 fields for 48-field annotations). Defaults to None.
+            info_key (str): INFO key of the VEP annotation. Default is 'vep' (gnomAD); ClinVar annotated with VEP uses 'CSQ'.
+        """
+        self.info_key = info_key
+        self.fields = list(fields)
+        self.fallback_names = fallback_names
+        self._checked = False
+        self.set_names(names)
+
+    @classmethod
+    def from_header(cls, header_lines: Iterable[str], fields: Iterable[str], info_key: Optional[str] = None,
+                    fallback_names: Optional[Sequence[str]] = None) -> 'VepDecoder':
+        """
+        Build a decoder from the 'Format:' string of the VEP ##INFO header line.
+
+        Args:
+            header_lines (Iterable[str]): Lines of the VCF header.
+            fields (Iterable[str]): Fields to extract.
+            info_key (str, optional): INFO key of the VEP annotation. Defaults to the key of the ##INFO line
+                with a 'Format:' string (`find_vep_info_key`).
+            fallback_names (Sequence[str], optional): Names used when the ##INFO line of the key has no
+                Format string.
+
+        Returns:
+            VepDecoder: Decoder for the requested fields.
+
+        Raises:
+            ValueError: If the key is not declared in the header, or its line has no Format string and no fallback
+                names are given.
+        """
+        info_lines = {}
+        for line in header_lines:
+            match = info_header_pattern.match(line)
+            if match:
+                info_lines[match.group(1)] = line
+        if info_key is None:
+            info_key = find_vep_info_key(info_lines)
+        if info_key not in info_lines:
+            raise ValueError(f'VEP INFO field {info_key} is not declared in the VCF header')
+        match = vep_format_pattern.search(info_lines[info_key])
+        if match:
+            return cls(match.group(1).split('|'), fields, fallback_names, info_key)
+        if fallback_names is None:
+            raise ValueError(f'No VEP Format string found for INFO field {info_key}')
+        return cls(fallback_names, fields, fallback_names, info_key)
+
+    @classmethod
+    def from_vcf(cls, vcf_file: str, fields: Iterable[str], info_key: Optional[str] = None,
+                 fallback_names: Optional[Sequence[str]] = None) -> 'VepDecoder':
+        """
+        Build a decoder from the header of a VCF file.
+
+        Args:
+            vcf_file (str): Path to the VCF file.
+            fields (Iterable[str]): Fields to extract.
+            info_key (str, optional): INFO key of the VEP annotation. Defaults to the key detected in the header.
+            fallback_names (Sequence[str], optional): Names used when the header does not describe the annotations.
+
+        Returns:
+            VepDecoder: Decoder for the requested fields.
+        """
+        return cls.from_header(read_header(vcf_file), fields, info_key, fallback_names)
+
+    def set_names(self, names: Sequence[str]) -> None:
+        """
+        Set the VEP field names and recompute the indices of the requested fields.
+
+        Args:
+            names (Sequence[str]): Names of the VEP fields in the order of the annotation.
+
+        Raises:
+            ValueError: If a requested field is not among the names.
+        """
+        missing = [field for field in self.fields if field not in names]
+        if missing:
+            raise ValueError(f'VEP fields not found in the annotation format: {", ".join(missing)}')
+        self.names = list(names)
+        self.indices = [self.names.index(field) for field in self.fields]
+        self._last_index = max(self.indices)
+
+    def check_width(self, transcript: str) -> None:
+        """
+        Check that a transcript annotation has as many fields as the names declare,
+        switching to the fallback names if they match instead.
+
+        Args:
+            transcript (str): Annotation of a single transcript.
+
+        Raises:
+            ValueError: If neither the names nor the fallback names match the annotation width.
+        """
+        width = transcript.count('|') + 1
+        if width != len(self.names):
+            if self.fallback_names is not None and width == len(self.fallback_names):
+                self.set_names(self.fallback_names)
+            else:
+                raise ValueError(f'VEP annotation has {width} fields, but the format declares {len(self.names)}')
+        self._checked = True
+
+    def get_annotation(self, info: str) -> str:
+        """
+        Get the VEP annotation from the INFO column, where VEP writes it as the last element.
+
+        Args:
+            info (str): Content of the INFO column.
+
+        Returns:
+            str: Value of the VEP INFO field.
+
+        Raises:
+            ValueError: If the record has no VEP INFO field, so that a wrong key does not silently drop every row.
+        """
+        key, _, vep = info.rpartition(';')[2].partition('=')
+        if key == self.info_key:
+            return vep
+        prefix = self.info_key + '='
+        for element in info.split(';'):
+            if element.startswith(prefix):
+                return element[len(prefix):]
+        raise ValueError(f'VEP INFO field {self.info_key} not found in the record')
+
+    def decode(self, vep: str) -> List[List[str]]:
+        """
+        Extract the requested fields of every transcript in a VEP annotation.
+
+        Args:
+            vep (str): Value of the VEP INFO field (without the 'vep=' prefix).
+
+        Returns:
+            List[List[str]]: Requested fields per transcript, in the order of `fields`.
+        """
+        if not vep:
+            return []
+        transcripts = vep.split(',')
+        if not self._checked:
+            self.check_width(transcripts[0])
+        indices = self.indices
+        max_split = self._last_index + 1
+        decoded = []
+        for transcript in transcripts:
+            values = transcript.split('|', max_split)
+            decoded.append([values[i] if i < len(values) else '' for i in indices])
+        return decoded
+
+    def offsets(self, vep: bytes) -> List[List[Tuple[int, int]]]:
+        """
+        Find the (start, end) offsets of the requested fields of every transcript without copying the annotation.
+
+        Args:
+            vep (bytes): Value of the VEP INFO field.
+
+        Returns:
+            List[List[Tuple[int, int]]]: Offsets of the requested fields per transcript, in the order of `fields`.
+        """
+        if not vep:
+            return []
+        if not self._checked:
+            self.check_width(vep.split(b',', 1)[0].decode())
+        offsets = []
+        start = 0
+        while start <= len(vep):
+            end = vep.find(b',', start)
+            if end == -1:
+                end = len(vep)
+            bounds = []
+            field_start = start
+            for _ in range(self._last_index + 1):
+                field_end = vep.find(b'|', field_start, end)
+                if field_end == -1:
+                    field_end = end
+                bounds.append((field_start, field_end))
+                field_start = min(field_end + 1, end)
+            offsets.append([bounds[i] for i in self.indices])
+            start = end + 1
+        return offsets
+
+    def decode_views(self, vep: bytes) -> List[List[memoryview]]:
+        """
+        Zero-copy variant of `decode`: return memoryview slices of the annotation buffer.
+
+        Args:
+            vep (bytes): Value of the VEP INFO field.
+
+        Returns:
+            List[List[memoryview]]: Views of the requested fields per transcript, in the order of `fields`.
+        """
+        buffer = memoryview(vep)
+        return [[buffer[start:end] for start, end in transcript] for transcript in self.offsets(vep)]
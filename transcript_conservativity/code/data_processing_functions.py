@@ -1,22 +1,100 @@
-from typing import List
+import warnings
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 
+from variant_schema import IdPool, decategorize, read_table
 
-def info_collecting(input_files: List[str]) -> pd.DataFrame:
+population_ac = ['AC_afr', 'AC_amr', 'AC_nfe', 'AC_asj',
+                 'AC_sas', 'AC_eas', 'AC_mid', 'AC_fin']
+
+# Consequences kept by `info_filtering`
+lof_consequences = ['stop_gained', 'frameshift_variant',
+                    'splice_donor_variant', 'splice_acceptor_variant']
+
+# Columns read by `collect_transcripts` and their fixed types
+# (allele counts are parsed as floats: missing values are allowed
+# and parsing is much faster than with nullable integers)
+collected_dtypes = {'ALT': 'object', 'AC': 'float64'}
+collected_dtypes.update({pop: 'float64' for pop in population_ac})
+collected_dtypes.update({'Consequence': 'object', 'SYMBOL': 'object',
+                         'Gene': 'object', 'Feature_Type': 'category',
+                         'Feature': 'object', 'BIOTYPE': 'category'})
+# Missing counts are written as '.' by `vcf_parsing`
+collected_na_values = {column: ['.'] for column, dtype
+                       in collected_dtypes.items() if dtype == 'float64'}
+
+# Predicates of `filter_lof_variants` pushed down to Parquet datasets
+lof_parquet_filters = [('Feature_Type', '==', 'Transcript'),
+                       ('BIOTYPE', '==', 'protein_coding'),
+                       ('Consequence', 'in', lof_consequences)]
+
+# Handling of Ensembl IDs whose stable IDs match but versions differ:
+# 'ignore' - match on the stable ID, 'warn' - match and warn,
+# 'strict' - leave the values missing
+version_policies = ('ignore', 'warn', 'strict')
+
+
+def read_variants(file: str, columns: Optional[List[str]] = None,
+                  filters: Optional[List[tuple]] = None,
+                  compact: bool = False,
+                  pool: Optional[IdPool] = None) -> pd.DataFrame:
+    '''
+    Reads a table produced by `vcf_parsing`: a Parquet dataset
+    (with column projection and predicate pushdown) or a TSV file.
+
+    Args:
+    file (str): Path to the '.parquet' dataset or the TSV file.
+    columns (List[str], optional): Columns to read. Defaults to all columns.
+    filters (List[tuple], optional): Predicates in the pyarrow format,
+        e.g. [('BIOTYPE', '==', 'protein_coding')]. Only used for Parquet.
+    compact (bool): Read TSV files with the compact dtypes of
+        `vcf_parsing_schema` (see `read_table`): uint32 counts and
+        categorical annotations and IDs, so a groupby on them needs
+        `observed=True`. Default is False (types inferred by pandas).
+    pool (IdPool, optional): Pool of gene and transcript IDs of compact
+        TSV tables, see `read_table`. Defaults to a new pool.
+
+    Returns:
+    pd.DataFrame: DataFrame with the selected columns and rows.
+    '''
+    if file.rstrip('/').endswith('.parquet'):
+        return pd.read_parquet(file, columns=columns, filters=filters)
+    if compact:
+        return read_table(file, columns=columns, pool=pool)
+    return pd.read_csv(file, sep='\t', low_memory=False, usecols=columns)
+
+
+def info_collecting(input_files: List[str], compact: bool = False,
+                    pool: Optional[IdPool] = None) -> pd.DataFrame:
     '''
     Collects and combines information from
-    multiple input TSV files into a single DataFrame.
+    multiple input TSV files (or Parquet datasets) into a single DataFrame.
 
     Args:
     input_files (List[str]): List of input file names.
+    compact (bool): Load TSV files in one pass with the compact dtypes of
+        `vcf_parsing_schema` (uint32 counts, float32 frequencies,
+        categorical annotations and IDs), about 6 times less memory.
+        Categorical columns keep all categories after filtering, so
+        group them with `observed=True`. Default is False (types inferred
+        by pandas, as `pd.read_csv`).
+    pool (IdPool, optional): Pool of gene and transcript IDs of compact
+        tables, see `read_table`. Defaults to a new pool.
 
     Returns:
     pd.DataFrame: Combined DataFrame
         containing the information from all input files.
     '''
 
+    if all(file.rstrip('/').endswith('.parquet') for file in input_files):
+        return pd.concat([read_variants(file) for file in input_files],
+                         ignore_index=True)
+
+    if compact:
+        return read_table(input_files, pool=pool)
+
     combined_df = pd.read_csv(input_files[0], sep='\t', low_memory=False)
     for file in input_files[1:]:
         df = pd.read_csv(file, sep='\t', low_memory=False, header=None)
@@ -25,9 +103,343 @@ def info_collecting(input_files: List[str]) -> pd.DataFrame:
     return combined_df
 
 
+def first_max_rows(data: pd.DataFrame, grouped, column: str
+                   ) -> pd.DataFrame:
+    '''
+    Rows with the first maximum of a column in every group.
+
+    Args:
+    data (pd.DataFrame): Grouped data (with a unique index).
+    grouped: `data` grouped by the key.
+    column (str): Column to maximize.
+
+    Returns:
+    pd.DataFrame: Rows of `data` indexed by the group key. Groups in which
+        the column is missing in all rows have no row.
+    '''
+    max_idx = grouped[column].idxmax().dropna()
+    return data.loc[max_idx].set_index(max_idx.index)
+
+
+def aggregate_transcripts(gene_data: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Aggregates variants per transcript in a single groupby pass:
+    sums of AC and population ACs, gene name and ID, number of variants
+    and the consequence of the variant with the maximum AC.
+
+    Args:
+    gene_data (pd.DataFrame): Filtered variant data with 'Feature', 'AC',
+        population AC, 'SYMBOL', 'Gene', 'ALT' and 'Consequence' columns.
+
+    Returns:
+    pd.DataFrame: One row per transcript (sorted by transcript ID).
+        'Variant' is the total length of the ALT alleles,
+        i.e. the number of variants for SNVs.
+    '''
+    # Categories of the whole table would become empty groups
+    gene_data = decategorize(gene_data, ['ALT', 'Consequence', 'SYMBOL',
+                                         'Gene', 'Feature'])
+    grouped = gene_data.assign(
+        ALT_length=gene_data['ALT'].str.len()).groupby('Feature')
+
+    aggregations = {'AC': ('AC', 'sum')}
+    aggregations.update({pop: (pop, 'sum') for pop in population_ac})
+    aggregations.update({'Gene_name': ('SYMBOL', 'first'),
+                         'Gene_id': ('Gene', 'first'),
+                         'Variant': ('ALT_length', 'sum')})
+    transcripts_df_ac = grouped.agg(**aggregations)
+
+    # Missing ACs (NaN) are skipped, as by the sums
+    max_ac_rows = first_max_rows(gene_data, grouped, 'AC')
+    transcripts_df_ac['Max_AC_in_transcript'] = max_ac_rows['AC']
+    transcripts_df_ac['Consequence_of_max_AC'] = max_ac_rows['Consequence']
+
+    return transcripts_df_ac.rename_axis('Transcript_ID').reset_index()
+
+
+def merge_transcript_aggregates(partials: List[pd.DataFrame]
+                                ) -> pd.DataFrame:
+    '''
+    Merges partial results of `aggregate_transcripts` computed on
+    consecutive parts of the variant data (chunks, chromosome files)
+    into the result for the whole data.
+
+    Args:
+    partials (List[pd.DataFrame]): Partial aggregates in the order
+        of the variant data.
+
+    Returns:
+    pd.DataFrame: One row per transcript (sorted by transcript ID).
+    '''
+    combined = pd.concat(partials, ignore_index=True)
+    grouped = combined.groupby('Transcript_ID')
+
+    aggregations = {'AC': ('AC', 'sum')}
+    aggregations.update({pop: (pop, 'sum') for pop in population_ac})
+    aggregations.update({'Gene_name': ('Gene_name', 'first'),
+                         'Gene_id': ('Gene_id', 'first'),
+                         'Variant': ('Variant', 'sum')})
+    transcripts_df_ac = grouped.agg(**aggregations)
+
+    # The first maximum in data order, as `idxmax` on the whole data
+    max_ac_rows = first_max_rows(combined, grouped, 'Max_AC_in_transcript')
+    transcripts_df_ac['Max_AC_in_transcript'] = \
+        max_ac_rows['Max_AC_in_transcript']
+    transcripts_df_ac['Consequence_of_max_AC'] = \
+        max_ac_rows['Consequence_of_max_AC']
+
+    return transcripts_df_ac.reset_index()
+
+
+def filter_lof_variants(gene_data: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Keeps LoF variants (`lof_consequences`) in protein coding
+    Ensembl transcripts.
+
+    Args:
+    gene_data (pd.DataFrame): Variant data.
+
+    Returns:
+    pd.DataFrame: Filtered variant data.
+    '''
+    return gene_data[(gene_data['Feature_Type'] == 'Transcript') &
+                     (gene_data['BIOTYPE'] == 'protein_coding') &
+                     gene_data['Consequence'].isin(lof_consequences) &
+                     gene_data['Feature'].str.contains('ENST', na=False)]
+
+
+def iter_variant_chunks(file: str, chunksize: int = 200000,
+                        names: Optional[List[str]] = None
+                        ) -> Iterator[pd.DataFrame]:
+    '''
+    Yields LoF variants of a `vcf_parsing` table chunk by chunk,
+    reading only the `collected_dtypes` columns with fixed types.
+    Parquet datasets are read at once with the filters pushed down.
+
+    Args:
+    file (str): Path to the TSV file or the '.parquet' dataset.
+    chunksize (int): Number of TSV rows read at once. Default is 200000.
+    names (List[str], optional): Column names of a TSV file
+        without a header line. Defaults to None (header line is read).
+
+    Yields:
+    pd.DataFrame: Filtered variant data of a chunk.
+    '''
+    if file.rstrip('/').endswith('.parquet'):
+        yield filter_lof_variants(read_variants(
+            file, list(collected_dtypes), lof_parquet_filters))
+        return
+
+    chunks = pd.read_csv(
+        file, sep='\t', header=None if names else 0, names=names,
+        usecols=list(collected_dtypes), dtype=collected_dtypes,
+        na_values=collected_na_values, chunksize=chunksize)
+    for chunk in chunks:
+        yield filter_lof_variants(chunk)
+
+
+def collect_transcripts(input_files: List[str],
+                        chunksize: int = 200000) -> pd.DataFrame:
+    '''
+    Out-of-core alternative of `info_collecting` followed by the
+    aggregation of `info_filtering`: every file is streamed in chunks,
+    filtered and aggregated per transcript, and partial aggregates are
+    merged after each file, so only one chunk and the per-transcript
+    table are kept in memory. As in `info_collecting`, the first TSV file
+    has a header line; other TSV files may have it or not.
+
+    Args:
+    input_files (List[str]): List of input file names
+        (TSV files or Parquet datasets).
+    chunksize (int): Number of TSV rows read at once. Default is 200000.
+
+    Returns:
+    pd.DataFrame: Per-transcript aggregates (as `aggregate_transcripts`),
+        to be passed to `annotate_transcripts`.
+    '''
+    transcripts_df_ac = None
+    header = None
+    for file in input_files:
+        names = None
+        if not file.rstrip('/').endswith('.parquet'):
+            with open(file) as table:
+                first_line = table.readline().rstrip('\r\n').split('\t')
+            if header is None:
+                header = first_line
+            elif first_line != header:
+                names = header
+
+        partials = [] if transcripts_df_ac is None else [transcripts_df_ac]
+        for chunk in iter_variant_chunks(file, chunksize, names):
+            if len(chunk):
+                partial = aggregate_transcripts(chunk)
+                counts = ['AC', 'Variant'] + population_ac
+                # The maximum is missing for transcripts without any AC
+                if partial['Max_AC_in_transcript'].notna().all():
+                    counts.append('Max_AC_in_transcript')
+                partial[counts] = partial[counts].astype('int64')
+                partials.append(partial)
+        if partials:
+            transcripts_df_ac = merge_transcript_aggregates(partials)
+    return transcripts_df_ac
+
+
+def split_ensembl_ids(ids: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    '''
+    Splits Ensembl IDs into stable IDs and version suffixes,
+    e.g. 'ENST00000335137.4' into 'ENST00000335137' and '4'.
+
+    Args:
+    ids (pd.Series): Ensembl IDs with or without versions.
+
+    Returns:
+    Tuple[pd.Series, pd.Series]: Stable IDs and versions
+        ('' for IDs without a version).
+    '''
+    # An empty series gives a frame without columns
+    parts = ids.astype(str).str.partition('.').reindex(columns=range(3))
+    return parts[0], parts[2]
+
+
+def build_id_index(table: pd.DataFrame, id_column: str,
+                   value_columns: List[str]) -> pd.DataFrame:
+    '''
+    Builds a hash index of a lookup table (constraint metrics, expression)
+    on version-less Ensembl IDs. The first row of every ID is kept.
+
+    Args:
+    table (pd.DataFrame): Lookup table.
+    id_column (str): Column with the Ensembl IDs.
+    value_columns (List[str]): Columns to keep in the index.
+
+    Returns:
+    pd.DataFrame: Values and 'ID_version' indexed by the stable ID.
+    '''
+    stable_ids, versions = split_ensembl_ids(table[id_column])
+    index = table[value_columns].set_axis(stable_ids.values)
+    index['ID_version'] = versions.values
+    return index[~index.index.duplicated()]
+
+
+def attach_by_id(df: pd.DataFrame, id_column: str, index: pd.DataFrame,
+                 columns: Dict[str, str], version_policy: str = 'ignore'
+                 ) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    '''
+    Attaches columns of an index built by `build_id_index`
+    to a DataFrame by Ensembl ID, in one vectorized lookup.
+
+    Args:
+    df (pd.DataFrame): DataFrame to annotate.
+    id_column (str): Column of `df` with the Ensembl IDs.
+    index (pd.DataFrame): Index built by `build_id_index`.
+    columns (Dict[str, str]): Index columns and their names in the output.
+    version_policy (str): 'ignore', 'warn' or 'strict'
+        (see `version_policies`). Default is 'ignore'.
+
+    Returns:
+    Tuple[pd.DataFrame, Dict[str, int]]: Annotated copy of `df` and
+        match statistics: 'queried', 'matched' and 'version_mismatches'.
+    '''
+    stable_ids, versions = split_ensembl_ids(df[id_column])
+    matched = index.reindex(stable_ids.values)
+
+    found = matched['ID_version'].notna().values
+    index_versions = matched['ID_version'].fillna('').values
+    mismatch = found & (versions.values != '') & (index_versions != '') & \
+        (versions.values != index_versions)
+    if mismatch.any():
+        if version_policy == 'strict':
+            matched.loc[mismatch, list(columns)] = np.nan
+            found = found & ~mismatch
+        elif version_policy == 'warn':
+            warnings.warn(f'{mismatch.sum()} IDs of {id_column} '
+                          'match only without versions')
+
+    df = df.copy()
+    for column, name in columns.items():
+        df[name] = matched[column].values
+
+    stats = {'queried': len(df), 'matched': int(found.sum()),
+             'version_mismatches': int(mismatch.sum())}
+    return df, stats
+
+
+def report_match_rates(stats: Dict[str, Dict[str, int]]) -> None:
+    '''
+    Prints match rates of the lookup tables.
+
+    Args:
+    stats (Dict[str, Dict[str, int]]): Statistics of `attach_by_id`
+        per lookup table.
+    '''
+    for table, table_stats in stats.items():
+        rate = table_stats['matched'] / max(table_stats['queried'], 1)
+        print(f"{table}: {table_stats['matched']} of "
+              f"{table_stats['queried']} transcripts matched ({rate:.1%}), "
+              f"{table_stats['version_mismatches']} version mismatches")
+
+
+def annotate_transcripts(transcripts_df_ac: pd.DataFrame,
+                         constraint_file: str,
+                         expression_file: str,
+                         version_policy: str = 'ignore',
+                         verbose: bool = False) -> pd.DataFrame:
+    '''
+    Adds the AC/Variant metric, LOEUF, exon number and expression level
+    to per-transcript aggregates.
+
+    Args:
+    transcripts_df_ac (pd.DataFrame): Result of `aggregate_transcripts`
+        or `collect_transcripts`.
+    constraint_file (str): File path for constraint data.
+    expression_file (str): File path for expression data.
+    version_policy (str): Handling of transcript version mismatches:
+        'ignore', 'warn' or 'strict'. Default is 'ignore'.
+    verbose (bool): Print match rates of the constraint and expression
+        tables. Default is False.
+
+    Returns:
+    pd.DataFrame: Annotated per-transcript data.
+    '''
+
+    if version_policy not in version_policies:
+        raise ValueError(f'Unknown version policy: {version_policy}')
+
+    # Reading data
+    constraint_transcript = pd.read_csv(constraint_file, sep='\t')
+    expression_transcript = pd.read_csv(expression_file, sep='\t')
+
+    # AC/N metric
+    transcripts_df_ac = transcripts_df_ac.assign(**{
+        'AC/Variant': transcripts_df_ac['AC'] / transcripts_df_ac['Variant']})
+
+    # LOEUF metric, exon number and expression level
+    constraint_index = build_id_index(
+        constraint_transcript, 'transcript',
+        ['lof.oe_ci.upper', 'num_coding_exons'])
+    expression_index = build_id_index(
+        expression_transcript, 'ID_transcript', ['Max_median_expression'])
+
+    transcripts_df_ac, constraint_stats = attach_by_id(
+        transcripts_df_ac, 'Transcript_ID', constraint_index,
+        {'lof.oe_ci.upper': 'LOEUF_transcript',
+         'num_coding_exons': 'Exon_number'}, version_policy)
+    transcripts_df_ac, expression_stats = attach_by_id(
+        transcripts_df_ac, 'Transcript_ID', expression_index,
+        {'Max_median_expression': 'Max_median_expression'}, version_policy)
+
+    if verbose:
+        report_match_rates({'constraint': constraint_stats,
+                            'expression': expression_stats})
+
+    return transcripts_df_ac
+
+
 def info_filtering(gene_data: pd.DataFrame,
                    constraint_file: str,
-                   expression_file: str) -> pd.DataFrame:
+                   expression_file: str,
+                   version_policy: str = 'ignore',
+                   verbose: bool = False) -> pd.DataFrame:
     '''
     Filters and analyzes genomic data for specific information related to
     gene expression and constraints.
@@ -36,124 +448,141 @@ def info_filtering(gene_data: pd.DataFrame,
     gene_data (pd.DataFrame): DataFrame containing genomic data.
     constraint_file (str): File path for constraint data.
     expression_file (str): File path for expression data.
+    version_policy (str): Handling of transcript version mismatches:
+        'ignore', 'warn' or 'strict'. Default is 'ignore'.
+    verbose (bool): Print match rates of the constraint and expression
+        tables. Default is False.
 
     Returns:
     pd.DataFrame: Processed DataFrame
         containing the filtered and analyzed genomic information.
     '''
 
-    population_ac = ['AC_afr', 'AC_amr', 'AC_nfe', 'AC_asj',
-                     'AC_sas', 'AC_eas', 'AC_mid', 'AC_fin']
-    transcript_list = []
-    sum_ac = []
-    sum_population_ac = [[], [], [], [], [], [], [], []]
-    gene_names = []
-    gene_id = []
-    alt_sum = []
-    loeuf_values = []
-    exon_numbers = []
-    expression = []
-
-    # Reading data
-    constraint_transcript = pd.read_csv(constraint_file, sep='\t')
-    expression_transcript = pd.read_csv(expression_file, sep='\t')
-
     # Filtration dataframe
-    gene_data = gene_data[(gene_data['Feature_Type'] == 'Transcript') &
-                          (gene_data['BIOTYPE'] == 'protein_coding')]
-    values_to_filter = ['stop_gained', 'frameshift_variant',
-                        'splice_donor_variant', 'splice_acceptor_variant']
-    gene_data = gene_data[
-        gene_data['Consequence'].isin(values_to_filter)
-        ][gene_data['Feature'].str.contains('ENST')]
-
-    columns_to_keep = ['gene', 'gene_id', 'transcript', 'canonical',
-                       'lof.oe_ci.upper', 'num_coding_exons']
-    constraint_transcript_loeuf = constraint_transcript[columns_to_keep]
+    gene_data = filter_lof_variants(gene_data)
 
     # Collecting specific data
-    sum_ac_per_transcript = gene_data.groupby('Feature')['AC']
-    for key, group in sum_ac_per_transcript:
-        transcript_list.append(key)
-        unique_values = group.sum()
-        sum_ac.append(unique_values)
-
-    for idx, el in enumerate(population_ac):
-        sum_population = []
-        sum_AC_per_transcript = gene_data.groupby('Feature')[el]
-        for key, group in sum_AC_per_transcript:
-            unique_values = group.sum()
-            sum_population.append(unique_values)
-            sum_population_ac[idx].append(sum(sum_population))
-            sum_population = []
-
-    gene_name_per_transcript = gene_data.groupby('Feature')['SYMBOL']
-    for key, group in gene_name_per_transcript:
-        unique_values = group.unique()
-        gene_names.extend(unique_values)
-
-    gene_id_per_transcript = gene_data.groupby('Feature')['Gene']
-    for key, group in gene_id_per_transcript:
-        unique_values = group.unique()
-        gene_id.extend(unique_values)
-
-    alt_per_transcript = gene_data.groupby('Feature')['ALT']
-    for key, group in alt_per_transcript:
-        unique_values = len(group.sum())
-        alt_sum.append(unique_values)
-
-    max_ac_indices = gene_data.groupby('Feature')['AC'].idxmax()
-    result = gene_data.loc[max_ac_indices, ['Feature', 'Consequence', 'AC']]
-    freq_cons = list(result['Consequence'])
-    freq = list(result['AC'])
-
-    # New dataframe grouping
-    transcripts_df_ac = pd.DataFrame({
-        'Transcript_ID': transcript_list,
-        'AC': sum_ac,
-        'AC_afr': sum_population_ac[0],
-        'AC_amr': sum_population_ac[1],
-        'AC_nfe': sum_population_ac[2],
-        'AC_asj': sum_population_ac[3],
-        'AC_sas': sum_population_ac[4],
-        'AC_eas': sum_population_ac[5],
-        'AC_mid': sum_population_ac[6],
-        'AC_fin': sum_population_ac[7],
-        'Gene_name': gene_names,
-        'Gene_id': gene_id,
-        'Variant': alt_sum,
-        'Max_AC_in_transcript': freq,
-        'Consequence_of_max_AC': freq_cons
-        })
+    transcripts_df_ac = aggregate_transcripts(gene_data)
 
-    # AC/N metric
-    transcripts_df_ac['AC/Variant'] = transcripts_df_ac['AC'] /\
-        transcripts_df_ac['Variant']
-
-    # LOEUF metric and exon number
-    transcripts = transcripts_df_ac['Transcript_ID'].unique()
-    tr = []
-    for transcript in transcripts:
-        # LOEUF metric and exon number
-        loeuf = list(constraint_transcript[constraint_transcript['transcript'].str.contains(transcript)]['lof.oe_ci.upper'])
-        exon = list(constraint_transcript[constraint_transcript['transcript'].str.contains(transcript)]['num_coding_exons'])
-        # Expression level
-        expression_level = list(expression_transcript[expression_transcript['ID_transcript'].str.contains(transcript)]['Max_median_expression'])
-        if loeuf != []:
-            loeuf_values.append(loeuf[0])
-        else:
-            loeuf_values.append(np.nan)
-        if exon != []:
-            exon_numbers.append(exon[0])
-        else:
-            exon_numbers.append(np.nan)
-        if expression_level != []:
-            expression.append(expression_level[0])
-        else:
-            expression.append(np.nan)
-
-    transcripts_df_ac['LOEUF_transcript'] = loeuf_values
-    transcripts_df_ac['Exon_number'] = exon_numbers
-    transcripts_df_ac['Max_median_expression'] = expression
+    return annotate_transcripts(transcripts_df_ac, constraint_file,
+                                expression_file, version_policy, verbose)
 
-    return transcripts_df_ac
+
+def aggregate_genes(transcript_data: pd.DataFrame,
+                    gene_constraint_file: Optional[str] = None
+                    ) -> pd.DataFrame:
+    '''
+    Aggregates annotated transcripts per gene in one groupby pass,
+    as the gene loop of `all_chr_genvar_analysis.ipynb`: minimum, maximum
+    and range (max / min) of AC/Variant over the transcripts of the gene,
+    gene LOEUF and the median expression of the transcripts.
+
+    Args:
+    transcript_data (pd.DataFrame): Result of `annotate_transcripts`.
+        Transcripts without a gene name are grouped by gene ID.
+    gene_constraint_file (str, optional): Gene-level constraint metrics
+        ('gene' and 'oe_lof_upper' columns, e.g.
+        gnomad.v2.1.1.lof_metrics.by_gene.txt). Defaults to None
+        (LOEUF is missing).
+
+    Returns:
+    pd.DataFrame: 'Gene_name', 'AC/N_min', 'AC/N_max', 'AC/N_range',
+        'LOEUF' and 'Max_median_expression', sorted by descending range.
+    '''
+    gene_names = transcript_data['Gene_name'].fillna(
+        transcript_data['Gene_id'])
+    grouped = transcript_data.assign(Gene_name=gene_names).groupby(
+        'Gene_name', sort=False)
+    genes = grouped.agg(**{'AC/N_min': ('AC/Variant', 'min'),
+                           'AC/N_max': ('AC/Variant', 'max'),
+                           'Max_median_expression':
+                               ('Max_median_expression', 'median')})
+
+    # A single transcript (or equal ratios) gives the ratio itself
+    same = genes['AC/N_min'] == genes['AC/N_max']
+    genes['AC/N_range'] = genes['AC/N_max'].where(
+        same, genes['AC/N_max'] / genes['AC/N_min'])
+
+    if gene_constraint_file is not None:
+        constraint_gene = pd.read_csv(gene_constraint_file, sep='\t',
+                                      usecols=['gene', 'oe_lof_upper'])
+        loeuf = constraint_gene.drop_duplicates('gene').set_index('gene')
+        genes['LOEUF'] = loeuf['oe_lof_upper'].reindex(genes.index).values
+    else:
+        genes['LOEUF'] = np.nan
+
+    genes = genes.reset_index()[['Gene_name', 'AC/N_min', 'AC/N_max',
+                                 'AC/N_range', 'LOEUF',
+                                 'Max_median_expression']]
+    return genes.sort_values('AC/N_range', ascending=False, kind='stable',
+                             ignore_index=True)
+
+
+def assign_gene_groups(genes: pd.DataFrame, lower_percentile: float = 33.33,
+                       upper_percentile: float = 100,
+                       loeuf_bounds: Tuple[float, float] = (0.35, 0.75)
+                       ) -> pd.DataFrame:
+    '''
+    Adds the AC/N range groups and LOEUF groups of
+    `all_genes_analysis.ipynb`. Range groups: 0 - transcripts are similar
+    (range at most the lower percentile and above 1), 3 - range at least
+    the upper percentile, 2 - range below 1, 1 - other genes.
+    LOEUF groups: 0 - LoF intolerant, 1 - moderately tolerant,
+    2 - tolerant.
+
+    Args:
+    genes (pd.DataFrame): Result of `aggregate_genes`.
+    lower_percentile (float): Percentile of the ranges bounding group 0.
+        Default is 33.33.
+    upper_percentile (float): Percentile of the ranges bounding group 3.
+        Default is 100.
+    loeuf_bounds (Tuple[float, float]): LOEUF below the first bound is
+        intolerant, above the second bound tolerant.
+        Default is (0.35, 0.75).
+
+    Returns:
+    pd.DataFrame: Copy of `genes` with categorical 'range_group_custom'
+        and 'range_group_loeuf' columns (missing LOEUF has no group).
+    '''
+    ranges = genes['AC/N_range']
+    if ranges.notna().any():
+        lower, upper = np.nanpercentile(ranges, [lower_percentile,
+                                                 upper_percentile])
+    else:
+        lower = upper = np.nan
+    range_group = np.select(
+        [(ranges <= lower) & (ranges > 1), ranges >= upper, ranges < 1],
+        [0, 3, 2], default=1)
+
+    loeuf = genes['LOEUF']
+    loeuf_group = pd.Series(np.select(
+        [loeuf < loeuf_bounds[0], loeuf > loeuf_bounds[1]], [0, 2],
+        default=1), index=genes.index, dtype='Int64').mask(loeuf.isna())
+
+    return genes.assign(
+        range_group_custom=pd.Categorical(range_group),
+        range_group_loeuf=loeuf_group.astype('category'))
+
+
+def select_genes(genes: pd.DataFrame, min_log_range: float = 3,
+                 min_log_expression: float = 1.5,
+                 max_loeuf: float = 0.75) -> pd.DataFrame:
+    '''
+    Selects genes whose transcripts deviate from typical values,
+    as in `all_genes_analysis.ipynb`: a large AC/N range, a high
+    expression and a LoF intolerant gene (log1p of range and expression).
+
+    Args:
+    genes (pd.DataFrame): Result of `aggregate_genes`.
+    min_log_range (float): Minimum log1p of the AC/N range. Default is 3.
+    min_log_expression (float): Minimum log1p of the expression.
+        Default is 1.5.
+    max_loeuf (float): Maximum LOEUF. Default is 0.75.
+
+    Returns:
+    pd.DataFrame: Selected genes.
+    '''
+    return genes.loc[
+        (np.log1p(genes['AC/N_range']) >= min_log_range) &
+        (np.log1p(genes['Max_median_expression']) >= min_log_expression) &
+        (genes['LOEUF'] <= max_loeuf)].reset_index(drop=True)
@@ -0,0 +1,249 @@
+import gzip
+import io
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Leading identifier columns of the GTEx transcript TPM table
+# (transcript_id, gene_id); all other columns are samples
+n_id_columns = 2
+
+# Columns of the table read by `annotate_transcripts` and `info_filtering`
+output_columns = ['ID_transcript', 'ID_gene', 'Max_median_expression']
+
+
+def read_sample_tissues(annotation_file: str,
+                        tissue_column: str = 'SMTS') -> Dict[str, str]:
+    '''
+    Reads the tissue of every GTEx sample from the sample attributes table.
+
+    Args:
+    annotation_file (str): Path to the comma-separated sample annotation
+        (SAMPID and tissue columns).
+    tissue_column (str): Tissue column, 'SMTS' (tissue type) or 'SMTSD'
+        (detailed tissue). Default is 'SMTS'.
+
+    Returns:
+    Dict[str, str]: Tissue by sample ID.
+    '''
+    annotation = pd.read_csv(annotation_file,
+                             usecols=['SAMPID', tissue_column])
+    return dict(zip(annotation['SAMPID'], annotation[tissue_column]))
+
+
+def open_gtex_table(gtex_file: str) -> IO[bytes]:
+    '''
+    Opens a GTEx table in binary mode, decompressing gzipped files.
+
+    Args:
+    gtex_file (str): Path to the tab-separated table (optionally gzipped).
+
+    Returns:
+    IO[bytes]: File object.
+    '''
+    with open(gtex_file, 'rb') as file:
+        is_gzip = file.read(2) == b'\x1f\x8b'
+    return gzip.open(gtex_file, 'rb') if is_gzip else open(gtex_file, 'rb')
+
+
+def read_gtex_header(file: IO[bytes]) -> List[str]:
+    '''
+    Reads the column names of a GTEx table, skipping the version and
+    dimension lines of GCT files ('#1.2').
+
+    Args:
+    file (IO[bytes]): Table opened with `open_gtex_table`; it is left
+        at the first data line.
+
+    Returns:
+    List[str]: Column names.
+    '''
+    line = file.readline()
+    if line.startswith(b'#1.'):
+        file.readline()
+        line = file.readline()
+    return line.decode().rstrip('\r\n').split('\t')
+
+
+def tissue_groups(samples: List[str], sample_tissues: Dict[str, str]
+                  ) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    '''
+    Maps sample columns to tissues once: columns are reordered so that
+    the samples of every tissue are contiguous. Samples without annotation
+    are kept as tissues of their own, as the renaming in
+    `expression_data_collecting.ipynb` leaves them.
+
+    Args:
+    samples (List[str]): Sample columns in the order of the table.
+    sample_tissues (Dict[str, str]): Tissue by sample ID.
+
+    Returns:
+    Tuple[List[str], np.ndarray, np.ndarray]: Tissue names, the column
+        order and the boundaries of the tissues in the reordered columns.
+    '''
+    codes, tissues = pd.factorize(
+        pd.Series([sample_tissues.get(sample, sample) for sample in samples]))
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(tissues) + 1))
+    return list(tissues), order, bounds
+
+
+def max_median_block(values: np.ndarray, order: np.ndarray,
+                     bounds: np.ndarray) -> np.ndarray:
+    '''
+    Computes the maximum over tissues of the median expression in every
+    tissue for a block of transcripts.
+
+    Args:
+    values (np.ndarray): Float32 TPMs of shape (transcripts, samples).
+    order (np.ndarray): Column order of `tissue_groups`.
+    bounds (np.ndarray): Tissue boundaries of `tissue_groups`.
+
+    Returns:
+    np.ndarray: Max median expression of every transcript. Missing TPMs
+        (empty cells) are skipped as in `DataFrame.median`, and tissues
+        without any TPM of the transcript as in `DataFrame.max`.
+    '''
+    grouped = values[:, order]
+    max_median = np.full(len(values), np.nan, dtype=np.float32)
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        block = grouped[:, start:end]
+        median = np.median(block, axis=1)
+        # Only transcripts with missing TPMs take the slower nanmedian
+        missing = np.isnan(median)
+        if missing.any():
+            with warnings.catch_warnings():
+                # Tissues without any TPM stay NaN
+                warnings.simplefilter('ignore', RuntimeWarning)
+                median[missing] = np.nanmedian(block[missing], axis=1)
+        np.fmax(max_median, median, out=max_median)
+    return max_median
+
+
+def iter_line_chunks(file: IO[bytes], chunksize: int) -> Iterator[bytes]:
+    '''
+    Reads unparsed data lines in chunks, so that parsing can be done by
+    the worker processes.
+
+    Args:
+    file (IO[bytes]): Table positioned at the first data line.
+    chunksize (int): Number of lines per chunk.
+
+    Yields:
+    bytes: Lines of the chunk.
+    '''
+    while True:
+        lines = list(islice(file, chunksize))
+        if not lines:
+            return
+        yield b''.join(lines)
+
+
+def parse_expression_block(data: bytes, columns: List[str]
+                           ) -> Tuple[pd.DataFrame, np.ndarray]:
+    '''
+    Parses a chunk of GTEx table lines, reading the sample columns
+    directly as float32.
+
+    Args:
+    data (bytes): Data lines.
+    columns (List[str]): Column names of the table.
+
+    Returns:
+    Tuple[pd.DataFrame, np.ndarray]: Identifier columns and float32 TPMs.
+    '''
+    dtypes = dict.fromkeys(range(n_id_columns, len(columns)), np.float32)
+    dtypes.update(dict.fromkeys(range(n_id_columns), str))
+    chunk = pd.read_csv(io.BytesIO(data), sep='\t', header=None, dtype=dtypes)
+    ids = chunk.iloc[:, :n_id_columns].set_axis(
+        output_columns[:n_id_columns], axis=1)
+    return ids, chunk.iloc[:, n_id_columns:].to_numpy(dtype=np.float32)
+
+
+def chunk_max_median(data: bytes, columns: List[str], order: np.ndarray,
+                     bounds: np.ndarray) -> pd.DataFrame:
+    '''
+    Parses a chunk of GTEx table lines and computes the max median
+    expression of its transcripts (run in a worker process).
+
+    Args:
+    data (bytes): Data lines.
+    columns (List[str]): Column names of the table.
+    order (np.ndarray): Column order of `tissue_groups`.
+    bounds (np.ndarray): Tissue boundaries of `tissue_groups`.
+
+    Returns:
+    pd.DataFrame: Rows of the output table for the chunk.
+    '''
+    ids, values = parse_expression_block(data, columns)
+    return ids.assign(Max_median_expression=max_median_block(values, order,
+                                                             bounds))
+
+
+def max_median_expression(gtex_file: str, annotation_file: str,
+                          output_file: Optional[str] = None,
+                          tissue_column: str = 'SMTS',
+                          chunksize: int = 2000,
+                          processes: Optional[int] = None) -> pd.DataFrame:
+    '''
+    Builds the maximum median tissue expression of every transcript
+    (the table of `expression_data_collecting.ipynb`) from the GTEx
+    transcript TPMs without loading the whole table: rows are read in
+    chunks and medians are computed per chunk. Memory usage depends on
+    `chunksize` and the number of samples only.
+
+    Args:
+    gtex_file (str): Path to the GTEx transcript TPM table.
+    annotation_file (str): Path to the GTEx sample annotation.
+    output_file (str, optional): Path to the output TSV file, written
+        chunk by chunk. Defaults to no file.
+    tissue_column (str): Tissue column of the annotation. Default is 'SMTS'.
+    chunksize (int): Number of transcripts per chunk. Default is 2000.
+    processes (int, optional): Number of worker processes parsing chunks
+        and computing their medians while the table is read. Defaults to
+        the calling process only.
+
+    Returns:
+    pd.DataFrame: 'ID_transcript', 'ID_gene' and 'Max_median_expression'.
+    '''
+    sample_tissues = read_sample_tissues(annotation_file, tissue_column)
+    if output_file is not None:
+        pd.DataFrame(columns=output_columns).to_csv(output_file, sep='\t',
+                                                    index=False)
+    parts = []
+
+    def collect(part: pd.DataFrame) -> None:
+        if output_file is not None:
+            part.to_csv(output_file, sep='\t', index=False, header=False,
+                        mode='a')
+        parts.append(part)
+
+    with open_gtex_table(gtex_file) as file:
+        columns = read_gtex_header(file)
+        _, order, bounds = tissue_groups(columns[n_id_columns:],
+                                         sample_tissues)
+        chunks = iter_line_chunks(file, chunksize)
+        if processes is None or processes <= 1:
+            for data in chunks:
+                collect(chunk_max_median(data, columns, order, bounds))
+        else:
+            # Workers parse the chunks too; at most two chunks per process
+            # are read ahead
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                pending = deque()
+                for data in chunks:
+                    pending.append(executor.submit(
+                        chunk_max_median, data, columns, order, bounds))
+                    if len(pending) >= 2 * processes:
+                        collect(pending.popleft().result())
+                while pending:
+                    collect(pending.popleft().result())
+
+    if not parts:
+        return pd.DataFrame(columns=output_columns)
+    return pd.concat(parts, ignore_index=True)
@@ -0,0 +1,624 @@
+'''
+End-to-end transcript conservation pipeline:
+parse -> merge -> annotate -> aggregate -> stats.
+
+Every stage is split into tasks with declared input and output files.
+A task is skipped when its code version, parameters and the SHA-256 of
+its inputs are those of its last successful run and its outputs are
+unchanged, so after editing one chromosome or one threshold only the
+affected tasks run again. Tasks whose dependencies are finished run on
+a local process pool of at most `jobs` workers.
+
+Usage:
+    python pipeline.py --vcf ../data/chr*.vcf.bgz \
+        --constraint gnomad.v4.1.constraint_metrics.tsv \
+        --expression ../data/max_tissue_median_expr.tsv \
+        --gene-constraint gnomad.v2.1.1.lof_metrics.by_gene.txt \
+        --work-dir pipeline_output --jobs 4
+'''
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import partial
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from data_processing_functions import (aggregate_genes, annotate_transcripts,
+                                       assign_gene_groups, collect_transcripts,
+                                       merge_transcript_aggregates,
+                                       population_ac, select_genes,
+                                       version_policies)
+from vcf_parser import is_lof_transcript, parser_version, vcf_parsing
+
+stage_names = ('parse', 'merge', 'annotate', 'aggregate', 'stats')
+
+# Versions of the stage code, part of the task keys: a new version
+# runs the tasks of the stage (and of the stages depending on changed
+# outputs) again
+stage_versions = {'parse': parser_version, 'merge': '1', 'annotate': '1',
+                  'aggregate': '1', 'stats': '1'}
+
+# Columns of the per-transcript aggregates of `collect_transcripts`
+transcript_columns = (['Transcript_ID', 'AC'] + population_ac +
+                      ['Gene_name', 'Gene_id', 'Variant',
+                       'Max_AC_in_transcript', 'Consequence_of_max_AC'])
+
+# Thresholds of `assign_gene_groups` and `select_genes`
+default_thresholds = {'lower_percentile': 33.33, 'upper_percentile': 100,
+                      'min_log_range': 3, 'min_log_expression': 1.5,
+                      'max_loeuf': 0.75}
+
+state_file_name = '.pipeline_state.json'
+hash_block_size = 1 << 20
+
+
+class Task:
+    '''
+    A unit of work of the pipeline: a module-level function called as
+    `function(inputs, outputs, **params)` in a worker process.
+    '''
+
+    def __init__(self, name: str, stage: str, function: Callable,
+                 inputs: List[str], outputs: List[str],
+                 params: Optional[Dict] = None) -> None:
+        '''
+        Args:
+        name (str): Unique task name, e.g. 'parse:chr1'.
+        stage (str): Stage of the task, one of `stage_names`.
+        function (Callable): Function running the task.
+        inputs (List[str]): Input files; outputs of other tasks make
+            these tasks dependencies.
+        outputs (List[str]): Files written by the task.
+        params (Dict, optional): Keyword arguments of `function`, part of
+            the task key (must be JSON-serializable). Defaults to none.
+        '''
+        self.name = name
+        self.stage = stage
+        self.function = function
+        self.inputs = [os.path.abspath(path) for path in inputs]
+        self.outputs = [os.path.abspath(path) for path in outputs]
+        self.params = params or {}
+
+
+def input_label(vcf_file: str) -> str:
+    '''
+    Name of the tasks and tables of an input VCF file: its chromosome
+    ('chr1' in gnomad.exomes.v4.0.sites.chr1.vcf.bgz) or the file name
+    without extensions.
+
+    Args:
+    vcf_file (str): Path to the VCF file.
+
+    Returns:
+    str: Label of the file.
+    '''
+    file_name = os.path.basename(vcf_file)
+    match = re.search(r'(?:^|[._-])(chr[0-9XYMT]+)(?=[._-]|$)', file_name)
+    return match.group(1) if match else file_name.split('.')[0]
+
+
+def file_digest(path: str, memo: Optional[Dict] = None) -> str:
+    '''
+    SHA-256 of a file, or of the relative paths and contents of the files
+    of a directory. Digests are memoized by path, size and modification
+    time, so unchanged multi-GB inputs are hashed once.
+
+    Args:
+    path (str): Path to the file or directory.
+    memo (Dict, optional): Memo of earlier digests, updated in place.
+        Defaults to no memo.
+
+    Returns:
+    str: Hex digest.
+    '''
+    if os.path.isdir(path):
+        digest = hashlib.sha256()
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            for name in sorted(names):
+                file = os.path.join(root, name)
+                digest.update(os.path.relpath(file, path).encode())
+                digest.update(file_digest(file, memo).encode())
+        return digest.hexdigest()
+
+    stat = os.stat(path)
+    signature = [stat.st_size, stat.st_mtime_ns]
+    if memo is not None and memo.get(path, {}).get('signature') == signature:
+        return memo[path]['sha256']
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(hash_block_size), b''):
+            digest.update(block)
+    if memo is not None:
+        memo[path] = {'signature': signature, 'sha256': digest.hexdigest()}
+    return digest.hexdigest()
+
+
+def task_key(task: Task, memo: Dict) -> str:
+    '''
+    Key of a run of a task: stage version, function, parameters,
+    output paths and input digests.
+
+    Args:
+    task (Task): Task with existing inputs.
+    memo (Dict): Memo of `file_digest`.
+
+    Returns:
+    str: Hex digest.
+    '''
+    description = {'version': stage_versions[task.stage],
+                   'function': task.function.__name__,
+                   'params': task.params, 'outputs': task.outputs,
+                   'inputs': [file_digest(path, memo)
+                              for path in task.inputs]}
+    return hashlib.sha256(json.dumps(description, sort_keys=True)
+                          .encode()).hexdigest()
+
+
+def run_task(task: Task) -> float:
+    '''
+    Runs a task (in a worker process), with the outputs of the called
+    functions suppressed.
+
+    Args:
+    task (Task): Task to run.
+
+    Returns:
+    float: Wall time in seconds.
+    '''
+    start = time.perf_counter()
+    for output in task.outputs:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        task.function(task.inputs, task.outputs, **task.params)
+    return time.perf_counter() - start
+
+
+def write_table(table: pd.DataFrame, output_file: str) -> None:
+    '''
+    Writes a TSV table atomically, so that an interrupted task never
+    leaves a complete-looking output.
+
+    Args:
+    table (pd.DataFrame): Table to write.
+    output_file (str): Path to the TSV file.
+    '''
+    table.to_csv(output_file + '.tmp', sep='\t', index=False)
+    os.replace(output_file + '.tmp', output_file)
+
+
+def parse_chromosome(inputs: List[str], outputs: List[str],
+                     lof_only: bool = True, chunksize: int = 200000) -> None:
+    '''
+    Parse task: parses a VCF file with `vcf_parsing` and aggregates
+    its LoF variants per transcript with `collect_transcripts`.
+
+    Args:
+    inputs (List[str]): VCF file.
+    outputs (List[str]): Variant table and per-transcript aggregates.
+    lof_only (bool): Keep only rows used by `info_filtering` in the
+        variant table (`is_lof_transcript` pushdown). Default is True.
+    chunksize (int): Rows per chunk of `collect_transcripts`.
+        Default is 200000.
+    '''
+    variant_file, transcripts_file = outputs
+    # A directory per task keeps tables of VCF files with the same name
+    # (e.g. in different folders) apart
+    parse_dir = variant_file + '.parts'
+    os.replace(vcf_parsing(inputs[0],
+                           row_filter=is_lof_transcript if lof_only else None,
+                           output_dir=parse_dir),
+               variant_file)
+    os.rmdir(parse_dir)
+
+    transcripts = collect_transcripts([variant_file], chunksize)
+    if transcripts is None:
+        transcripts = pd.DataFrame(columns=transcript_columns)
+    write_table(transcripts, transcripts_file)
+
+
+def merge_chromosomes(inputs: List[str], outputs: List[str]) -> None:
+    '''
+    Merge task: combines the per-transcript aggregates of all chromosomes.
+
+    Args:
+    inputs (List[str]): Aggregates of `parse_chromosome` in chromosome
+        order.
+    outputs (List[str]): Merged aggregates.
+    '''
+    partials = [pd.read_csv(file, sep='\t') for file in inputs]
+    partials = [partial for partial in partials if len(partial)]
+    if partials:
+        transcripts = merge_transcript_aggregates(partials)
+    else:
+        transcripts = pd.DataFrame(columns=transcript_columns)
+    write_table(transcripts, outputs[0])
+
+
+def annotate(inputs: List[str], outputs: List[str],
+             version_policy: str = 'ignore') -> None:
+    '''
+    Annotate task: `annotate_transcripts` with the constraint and
+    expression tables.
+
+    Args:
+    inputs (List[str]): Merged aggregates, constraint and expression tables.
+    outputs (List[str]): Annotated transcripts.
+    version_policy (str): Version policy of `annotate_transcripts`.
+        Default is 'ignore'.
+    '''
+    transcripts_file, constraint_file, expression_file = inputs
+    transcripts = pd.read_csv(transcripts_file, sep='\t')
+    write_table(annotate_transcripts(transcripts, constraint_file,
+                                     expression_file, version_policy),
+                outputs[0])
+
+
+def aggregate(inputs: List[str], outputs: List[str]) -> None:
+    '''
+    Aggregate task: per-gene table of `aggregate_genes`.
+
+    Args:
+    inputs (List[str]): Annotated transcripts and optionally the
+        gene-level constraint table.
+    outputs (List[str]): Gene table.
+    '''
+    transcripts = pd.read_csv(inputs[0], sep='\t')
+    gene_constraint_file = inputs[1] if len(inputs) > 1 else None
+    write_table(aggregate_genes(transcripts, gene_constraint_file),
+                outputs[0])
+
+
+def gene_stats(inputs: List[str], outputs: List[str],
+               lower_percentile: float = 33.33, upper_percentile: float = 100,
+               min_log_range: float = 3, min_log_expression: float = 1.5,
+               max_loeuf: float = 0.75) -> None:
+    '''
+    Stats task: gene groups of `assign_gene_groups`, genes selected by
+    `select_genes` and a JSON summary (thresholds and group sizes).
+
+    Args:
+    inputs (List[str]): Gene table.
+    outputs (List[str]): Gene groups, selected genes and the summary.
+    lower_percentile, upper_percentile (float): Percentiles of the range
+        groups.
+    min_log_range, min_log_expression, max_loeuf (float): Thresholds of
+        the gene selection.
+    '''
+    groups_file, selected_file, summary_file = outputs
+    genes = assign_gene_groups(pd.read_csv(inputs[0], sep='\t'),
+                               lower_percentile, upper_percentile)
+    selected = select_genes(genes, min_log_range, min_log_expression,
+                            max_loeuf)
+    write_table(genes, groups_file)
+    write_table(selected, selected_file)
+
+    summary = {
+        'thresholds': {'lower_percentile': lower_percentile,
+                       'upper_percentile': upper_percentile,
+                       'min_log_range': min_log_range,
+                       'min_log_expression': min_log_expression,
+                       'max_loeuf': max_loeuf},
+        'genes': len(genes), 'selected_genes': len(selected),
+        'range_groups': {str(group): int(count) for group, count in
+                         genes['range_group_custom'].value_counts()
+                         .sort_index().items()},
+        'loeuf_groups': {str(group): int(count) for group, count in
+                         genes['range_group_loeuf'].value_counts()
+                         .sort_index().items()}}
+    with open(summary_file + '.tmp', 'w') as file:
+        json.dump(summary, file, indent=2)
+    os.replace(summary_file + '.tmp', summary_file)
+
+
+def build_tasks(vcf_files: List[str], constraint_file: str,
+                expression_file: str, work_dir: str,
+                gene_constraint_file: Optional[str] = None,
+                lof_only: bool = True, version_policy: str = 'ignore',
+                thresholds: Optional[Dict[str, float]] = None
+                ) -> List[Task]:
+    '''
+    Builds the tasks of the pipeline: one parse task per VCF file
+    (e.g. per chromosome) and one task for each later stage.
+
+    Args:
+    vcf_files (List[str]): VCF files, in chromosome order.
+    constraint_file (str): Transcript-level constraint metrics.
+    expression_file (str): Max median expression table.
+    work_dir (str): Directory of the outputs and the pipeline state.
+    gene_constraint_file (str, optional): Gene-level constraint metrics
+        for `aggregate_genes`. Defaults to None (LOEUF is missing).
+    lof_only (bool): Keep only LoF rows in the variant tables.
+        Default is True.
+    version_policy (str): Version policy of `annotate_transcripts`.
+        Default is 'ignore'.
+    thresholds (Dict[str, float], optional): Thresholds of the stats
+        stage overriding `default_thresholds`.
+
+    Returns:
+    List[Task]: Tasks in dependency order.
+    '''
+    if version_policy not in version_policies:
+        raise ValueError(f'Unknown version policy: {version_policy}')
+    labels = [input_label(file) for file in vcf_files]
+    duplicates = sorted({label for label in labels if labels.count(label) > 1})
+    if duplicates:
+        raise ValueError(f'Several VCF files of {", ".join(duplicates)}')
+
+    def path(name: str) -> str:
+        return os.path.join(work_dir, name)
+
+    tasks = []
+    for label, vcf_file in zip(labels, vcf_files):
+        tasks.append(Task(f'parse:{label}', 'parse', parse_chromosome,
+                          [vcf_file],
+                          [path(f'parsed/{label}.tsv'),
+                           path(f'parsed/{label}.transcripts.tsv')],
+                          {'lof_only': lof_only}))
+    tasks.append(Task('merge', 'merge', merge_chromosomes,
+                      [path(f'parsed/{label}.transcripts.tsv')
+                       for label in labels],
+                      [path('transcripts.tsv')]))
+    tasks.append(Task('annotate', 'annotate', annotate,
+                      [path('transcripts.tsv'), constraint_file,
+                       expression_file],
+                      [path('annotated_transcripts.tsv')],
+                      {'version_policy': version_policy}))
+    tasks.append(Task('aggregate', 'aggregate', aggregate,
+                      [path('annotated_transcripts.tsv')] +
+                      ([gene_constraint_file] if gene_constraint_file else []),
+                      [path('genes.tsv')]))
+    tasks.append(Task('stats', 'stats', gene_stats, [path('genes.tsv')],
+                      [path('gene_groups.tsv'), path('selected_genes.tsv'),
+                       path('summary.json')],
+                      {**default_thresholds, **(thresholds or {})}))
+    return tasks
+
+
+def dependency_order(dependencies: Dict[str, set]) -> List[str]:
+    '''
+    Orders tasks so that every task follows its dependencies; tasks of
+    the same depth keep their order.
+
+    Args:
+    dependencies (Dict[str, set]): Dependencies of every task.
+
+    Returns:
+    List[str]: Task names.
+    '''
+    order, done = [], set()
+    while len(order) < len(dependencies):
+        ready = [name for name in dependencies
+                 if name not in done and dependencies[name] <= done]
+        if not ready:
+            raise ValueError('Tasks have cyclic dependencies')
+        order.extend(ready)
+        done.update(ready)
+    return order
+
+
+class Pipeline:
+    '''
+    Runs tasks in dependency order on a process pool, skipping tasks that
+    are up to date. The state (task keys, output digests and the digest
+    memo) is kept in `state_file_name` of the work directory and saved
+    after every task, so an interrupted run keeps its finished tasks.
+    '''
+
+    def __init__(self, tasks: List[Task], work_dir: str, jobs: int = 1,
+                 force: bool = False) -> None:
+        '''
+        Args:
+        tasks (List[Task]): Tasks of the pipeline.
+        work_dir (str): Directory of the pipeline state.
+        jobs (int): Maximum number of tasks running at once; 1 runs
+            tasks in the calling process. Default is 1.
+        force (bool): Run all tasks, even if they are up to date.
+            Default is False.
+        '''
+        self.tasks = {task.name: task for task in tasks}
+        if len(self.tasks) != len(tasks):
+            raise ValueError('Task names must be unique')
+        self.jobs = jobs
+        self.force = force
+        self.state_file = os.path.join(work_dir, state_file_name)
+        os.makedirs(work_dir, exist_ok=True)
+
+        producers = {output: task.name for task in tasks
+                     for output in task.outputs}
+        self.dependencies = {task.name: {producers[path] for path in
+                                         task.inputs if path in producers}
+                             for task in tasks}
+        self.order = dependency_order(self.dependencies)
+
+        self.state = {'files': {}, 'tasks': {}}
+        if os.path.exists(self.state_file):
+            with open(self.state_file) as file:
+                self.state = json.load(file)
+
+    def save_state(self) -> None:
+        with open(self.state_file + '.tmp', 'w') as file:
+            json.dump(self.state, file, indent=1)
+        os.replace(self.state_file + '.tmp', self.state_file)
+
+    def is_up_to_date(self, task: Task, key: str) -> bool:
+        '''
+        Checks whether a task ran with the same key and its outputs were
+        not changed or removed since.
+
+        Args:
+        task (Task): Task with existing inputs.
+        key (str): Current key of the task.
+
+        Returns:
+        bool: True if the task can be skipped.
+        '''
+        record = self.state['tasks'].get(task.name)
+        if self.force or record is None or record['key'] != key:
+            return False
+        memo = self.state['files']
+        return all(os.path.exists(path) and
+                   file_digest(path, memo) == record['outputs'].get(path)
+                   for path in task.outputs)
+
+    def record(self, task: Task, key: str, seconds: float) -> None:
+        memo = self.state['files']
+        self.state['tasks'][task.name] = {
+            'key': key, 'seconds': round(seconds, 3),
+            'outputs': {path: file_digest(path, memo)
+                        for path in task.outputs}}
+        self.save_state()
+
+    def outdated(self) -> List[str]:
+        '''
+        Tasks that a run would execute: tasks whose key or outputs changed
+        and all tasks depending on them (assuming their outputs change).
+
+        Returns:
+        List[str]: Names of the tasks in dependency order.
+        '''
+        outdated = []
+        for name in self.order:
+            task = self.tasks[name]
+            if self.dependencies[name] & set(outdated) or \
+                    not all(os.path.exists(path) for path in task.inputs) or \
+                    not self.is_up_to_date(task,
+                                           task_key(task, self.state['files'])):
+                outdated.append(name)
+        return outdated
+
+    def run(self) -> Dict[str, str]:
+        '''
+        Runs the pipeline. A task starts when all its dependencies have
+        finished; it is skipped when it is up to date. Tasks depending on
+        a failed task are not run, other tasks go on.
+
+        Returns:
+        Dict[str, str]: Status of every task: 'skipped', 'done', 'failed'
+            or 'blocked'.
+        '''
+        status, running, keys = {}, {}, {}
+        memo = self.state['files']
+        start = time.perf_counter()
+
+        def finish(name: str, result: Callable[[], float]) -> None:
+            try:
+                seconds = result()
+            except Exception as error:
+                status[name] = 'failed'
+                print(f'[{name}] failed: {error!r}', flush=True)
+                return
+            self.record(self.tasks[name], keys.pop(name), seconds)
+            status[name] = 'done'
+            print(f'[{name}] done in {seconds:.1f} s', flush=True)
+
+        executor = ProcessPoolExecutor(self.jobs) if self.jobs > 1 else None
+        try:
+            while len(status) < len(self.tasks):
+                for name in self.order:
+                    if name in status or name in keys:
+                        continue
+                    dependencies = [status.get(dependency) for dependency
+                                    in self.dependencies[name]]
+                    if 'failed' in dependencies or 'blocked' in dependencies:
+                        status[name] = 'blocked'
+                        print(f'[{name}] blocked by a failed dependency')
+                        continue
+                    if not all(dependency in ('skipped', 'done')
+                               for dependency in dependencies):
+                        continue
+                    if executor is not None and len(running) >= self.jobs:
+                        break
+
+                    task = self.tasks[name]
+                    try:
+                        key = task_key(task, memo)
+                    except OSError as error:
+                        status[name] = 'failed'
+                        print(f'[{name}] failed: {error!r}')
+                        continue
+                    if self.is_up_to_date(task, key):
+                        status[name] = 'skipped'
+                        print(f'[{name}] up to date')
+                        continue
+                    # A task that fails or is interrupted is never up to date
+                    self.state['tasks'].pop(name, None)
+                    keys[name] = key
+                    print(f'[{name}] started', flush=True)
+                    if executor is None:
+                        finish(name, partial(run_task, task))
+                    else:
+                        running[executor.submit(run_task, task)] = name
+
+                if running:
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        finish(running.pop(future), future.result)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            self.save_state()
+
+        counts = list(status.values())
+        print(f'{counts.count("done")} tasks run, '
+              f'{counts.count("skipped")} up to date, '
+              f'{counts.count("failed")} failed, '
+              f'{counts.count("blocked")} blocked '
+              f'in {time.perf_counter() - start:.1f} s')
+        return status
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description='Transcript conservation pipeline: parse -> merge -> '
+                    'annotate -> aggregate -> stats, re-running only tasks '
+                    'whose inputs, parameters or code changed.')
+    parser.add_argument('--vcf', nargs='+', required=True,
+                        help='VCF files, one per chromosome, in order')
+    parser.add_argument('--constraint', required=True,
+                        help='transcript-level constraint metrics')
+    parser.add_argument('--expression', required=True,
+                        help='max median expression table')
+    parser.add_argument('--gene-constraint',
+                        help='gene-level constraint metrics (LOEUF)')
+    parser.add_argument('--work-dir', default='pipeline_output',
+                        help='directory of the outputs and the state')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='maximum number of tasks running at once')
+    parser.add_argument('--all-rows', action='store_true',
+                        help='keep all rows in the parsed variant tables')
+    parser.add_argument('--version-policy', default='ignore',
+                        choices=version_policies)
+    for name, value in default_thresholds.items():
+        parser.add_argument(f'--{name.replace("_", "-")}', type=float,
+                            default=value, help=f'default: {value}')
+    parser.add_argument('--force', action='store_true',
+                        help='run all tasks, even if they are up to date')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='list the tasks that would run')
+    args = parser.parse_args(argv)
+
+    tasks = build_tasks(
+        args.vcf, args.constraint, args.expression, args.work_dir,
+        args.gene_constraint, not args.all_rows, args.version_policy,
+        {name: getattr(args, name) for name in default_thresholds})
+    pipeline = Pipeline(tasks, args.work_dir, args.jobs, args.force)
+    if args.dry_run:
+        for name in pipeline.outdated():
+            print(name)
+        return 0
+    status = pipeline.run()
+    return int(any(value in ('failed', 'blocked')
+                   for value in status.values()))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
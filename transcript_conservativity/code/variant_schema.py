@@ -0,0 +1,322 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Column kinds and the dtypes they are loaded with:
+# 'count' - allele counts and numbers, uint32 (nullable UInt32 if values
+#     are missing); 'int' - positions, int32; 'frequency' - float32;
+# 'category' - low-cardinality strings (annotations), categorical;
+# 'id' - gene symbols, gene and transcript IDs, categorical over an
+#     `IdPool`; 'string' - other strings, object
+kind_dtypes = {'count': 'uint32', 'int': 'int32', 'frequency': 'float32',
+               'category': 'category', 'id': 'category', 'string': 'object'}
+
+populations = ['', '_afr', '_amr', '_nfe', '_asj', '_sas', '_eas', '_mid',
+               '_fin']
+
+# Output of `vcf_parsing` (vcf_parser.py)
+vcf_parsing_schema = {'CHROM': 'category', 'POS': 'int', 'ID': 'string',
+                      'REF': 'category', 'ALT': 'category'}
+vcf_parsing_schema.update({f'AC{pop}': 'count' for pop in populations})
+vcf_parsing_schema.update({f'AN{pop}': 'count' for pop in populations})
+vcf_parsing_schema.update({f'AF{pop}': 'frequency' for pop in populations})
+vcf_parsing_schema.update({
+    'Consequence': 'category', 'IMPACT': 'category', 'SYMBOL': 'id',
+    'Gene': 'id', 'Feature_Type': 'category', 'Feature': 'id',
+    'BIOTYPE': 'category', 'EXON': 'category', 'INTRON': 'category',
+    'ALLELE_NUM': 'count', 'VARIANT_CLASS': 'category',
+    'CANONICAL': 'category', 'LoF': 'category', 'LoF_filter': 'category',
+    'LoF_flags': 'category', 'LoF_info': 'string'})
+
+# Output of `parse_vcf` (context_analysis/parse_vcf_canonical.py)
+canonical_schema = {
+    'Chr': 'category', 'Position': 'int', 'rsID': 'string',
+    'Ref': 'category', 'Alt': 'category', 'AC': 'count',
+    'Impact': 'category', 'Consequence': 'category', 'Gene_symbol': 'id',
+    'Canonical_transcript': 'id', 'cDNA_position': 'string',
+    'LoF': 'category', 'LoF_flag': 'category', 'LoF_filter': 'category'}
+
+# Output of `parse_clinvar_vcf` (context_analysis/parse_vcf_clinvar.py)
+clinvar_schema = {
+    'CHROM': 'category', 'POS': 'int', 'ID': 'string', 'REF': 'category',
+    'ALT': 'category', 'CLNSIG': 'category', 'CLNVC': 'category',
+    'GENEINFO': 'id', 'MC': 'category', 'Consequence': 'category',
+    'SYMBOL': 'id', 'Gene': 'id', 'Feature_type': 'category', 'Feature': 'id',
+    'BIOTYPE': 'category', 'cDNA_position': 'string', 'CANONICAL': 'category'}
+
+
+class IdPool:
+    '''
+    Interned pool of string values (gene symbols, gene and transcript
+    IDs). Every value gets a stable code, so frames loaded with the same
+    pool share one set of categories: they are concatenated and joined
+    on codes without conversions to strings.
+    '''
+
+    def __init__(self) -> None:
+        self.values = []
+        self.codes = {}
+        self._dtype = None
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def add(self, values: Iterable[str]) -> np.ndarray:
+        '''
+        Adds values to the pool.
+
+        Args:
+        values (Iterable[str]): Unique values, e.g. categories of
+            a column read as categorical.
+
+        Returns:
+        np.ndarray: Codes of the values (int32).
+        '''
+        codes = self.codes
+        result = []
+        for value in values:
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(self.values)
+                self.values.append(value)
+                self._dtype = None
+            result.append(code)
+        return np.array(result, dtype=np.int32)
+
+    @property
+    def dtype(self) -> pd.CategoricalDtype:
+        '''
+        Categorical dtype with all values of the pool as categories.
+        '''
+        if self._dtype is None:
+            self._dtype = pd.CategoricalDtype(pd.Index(self.values,
+                                                       dtype=object))
+        return self._dtype
+
+    def encode(self, column: pd.Series) -> np.ndarray:
+        '''
+        Codes of a column (-1 for missing values), adding new values.
+        Only unique values are looked up in the pool.
+
+        Args:
+        column (pd.Series): String or categorical column.
+
+        Returns:
+        np.ndarray: Codes (int32).
+        '''
+        if not isinstance(column.dtype, pd.CategoricalDtype):
+            column = column.astype('category')
+        mapping = np.append(self.add(column.cat.categories), -1)
+        return mapping[column.cat.codes.to_numpy()]
+
+    def recategorize(self, df: pd.DataFrame) -> pd.DataFrame:
+        '''
+        Sets the categories of the pooled columns of a frame loaded
+        earlier to the current pool, e.g. before concatenating it with
+        frames loaded later. Codes are kept as they are.
+
+        Args:
+        df (pd.DataFrame): Frame loaded with this pool.
+
+        Returns:
+        pd.DataFrame: The same frame.
+        '''
+        for column in df.columns:
+            dtype = df[column].dtype
+            if (isinstance(dtype, pd.CategoricalDtype) and
+                    len(dtype.categories) <= len(self) and
+                    dtype.categories.equals(
+                        self.dtype.categories[:len(dtype.categories)])):
+                df[column] = pd.Categorical.from_codes(
+                    df[column].cat.codes, dtype=self.dtype)
+        return df
+
+
+def read_dtypes(schema: Dict[str, str]) -> Dict[str, str]:
+    '''
+    Dtypes passed to `pd.read_csv` for a schema. Counts are parsed as
+    floats (missing values are allowed, and parsing is much faster than
+    with nullable integers) and converted to integers afterwards.
+
+    Args:
+    schema (Dict[str, str]): Column kinds by column name.
+
+    Returns:
+    Dict[str, str]: Dtypes by column name.
+    '''
+    return {column: 'float64' if kind == 'count' else kind_dtypes[kind]
+            for column, kind in schema.items()}
+
+
+def count_arrays(values: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Converts parsed allele counts to uint32 values and a mask of missing
+    values.
+
+    Args:
+    values (pd.Series): Numeric or string values.
+
+    Returns:
+    Tuple[np.ndarray, np.ndarray]: Counts (0 where missing) and the mask.
+    '''
+    values = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+    missing = np.isnan(values)
+    return np.where(missing, 0, values).astype(np.uint32), missing
+
+
+def to_counts(counts: np.ndarray, missing: np.ndarray):
+    '''
+    Builds a count column: uint32, or nullable UInt32 if some values
+    are missing.
+
+    Args:
+    counts (np.ndarray): Counts as returned by `count_arrays`.
+    missing (np.ndarray): Mask of missing values.
+
+    Returns:
+    np.ndarray or pd.arrays.IntegerArray: Counts.
+    '''
+    if missing.any():
+        return pd.arrays.IntegerArray(counts, missing)
+    return counts
+
+
+def convert_frame(df: pd.DataFrame, schema: Dict[str, str],
+                  pool: Optional[IdPool] = None) -> pd.DataFrame:
+    '''
+    Converts the columns of a frame (e.g. a batch of parsed rows with
+    string values) to the dtypes of a schema in place.
+
+    Args:
+    df (pd.DataFrame): Frame to convert; columns not in the schema
+        are kept as they are.
+    schema (Dict[str, str]): Column kinds by column name.
+    pool (IdPool, optional): Pool of the 'id' columns. Defaults to
+        plain categoricals.
+
+    Returns:
+    pd.DataFrame: The same frame.
+    '''
+    for column, kind in schema.items():
+        if column not in df.columns:
+            continue
+        if kind == 'count':
+            df[column] = to_counts(*count_arrays(df[column]))
+        elif kind in ('int', 'frequency'):
+            df[column] = pd.to_numeric(
+                df[column], errors='coerce').astype(kind_dtypes[kind])
+        elif kind == 'id' and pool is not None:
+            df[column] = pd.Categorical.from_codes(pool.encode(df[column]),
+                                                   dtype=pool.dtype)
+        elif kind != 'string':
+            df[column] = df[column].astype(kind_dtypes[kind])
+    return df
+
+
+def concat_columns(parts: List, kind: str, pool: Optional[IdPool]):
+    '''
+    Concatenates converted chunks of a column.
+
+    Args:
+    parts (List): Chunks of the column: arrays, codes of pooled columns,
+        categoricals or pairs of `count_arrays`.
+    kind (str): Column kind.
+    pool (IdPool, optional): Pool of the 'id' columns.
+
+    Returns:
+    Column values.
+    '''
+    if kind == 'id':
+        return pd.Categorical.from_codes(np.concatenate(parts),
+                                         dtype=pool.dtype)
+    if kind == 'category':
+        return pd.api.types.union_categoricals(parts)
+    if kind == 'count':
+        return to_counts(*(np.concatenate(arrays) for arrays in zip(*parts)))
+    return np.concatenate(parts)
+
+
+def read_table(files, schema: Dict[str, str] = vcf_parsing_schema,
+               columns: Optional[List[str]] = None,
+               pool: Optional[IdPool] = None,
+               chunksize: int = 500000) -> pd.DataFrame:
+    '''
+    Loads parsed variant tables (TSV, plain or compressed) with the dtypes
+    of a schema in one pass: chunks are parsed with fixed dtypes and
+    converted right away, so string copies of the whole table are never
+    held in memory. The first file must have a header line; other files
+    may have it or not, as in `collect_transcripts`.
+
+    Args:
+    files (str or List[str]): Path to a table or several tables with the
+        same columns (e.g. one per chromosome).
+    schema (Dict[str, str]): Column kinds by column name. Columns not in
+        the schema are read as strings. Default is `vcf_parsing_schema`.
+    columns (List[str], optional): Columns to read. Defaults to all.
+    pool (IdPool, optional): Pool of the 'id' columns; pass the same pool
+        to several loads to share the categories of IDs. Defaults to
+        a new pool.
+    chunksize (int): Number of rows parsed at once. Default is 500000.
+
+    Returns:
+    pd.DataFrame: Loaded table.
+    '''
+    if isinstance(files, str):
+        files = [files]
+    pool = pool if pool is not None else IdPool()
+
+    header = pd.read_csv(files[0], sep='\t', nrows=0).columns.tolist()
+    columns = [column for column in header
+               if columns is None or column in columns]
+    kinds = {column: schema.get(column, 'string') for column in columns}
+    dtypes = read_dtypes(kinds)
+    # Missing numbers are written as '.' by VCF tools
+    na_values = {column: ['.'] for column, kind in kinds.items()
+                 if kind in ('count', 'int', 'frequency')}
+    parts = {column: [] for column in columns}
+
+    for file in files:
+        first_line = pd.read_csv(file, sep='\t', nrows=0).columns.tolist()
+        has_header = first_line == header
+        chunks = pd.read_csv(file, sep='\t', header=0 if has_header else None,
+                             names=header, usecols=columns, dtype=dtypes,
+                             na_values=na_values, chunksize=chunksize)
+        for chunk in chunks:
+            for column, kind in kinds.items():
+                values = chunk[column]
+                if kind == 'id':
+                    parts[column].append(pool.encode(values))
+                elif kind == 'count':
+                    parts[column].append(count_arrays(values))
+                elif kind == 'category':
+                    parts[column].append(values.array)
+                else:
+                    parts[column].append(values.to_numpy())
+
+    data = {}
+    for column, kind in kinds.items():
+        if parts[column]:
+            data[column] = concat_columns(parts[column], kind, pool)
+        else:
+            data[column] = pd.Series(dtype=kind_dtypes[kind])
+    return pd.DataFrame(data, columns=columns)
+
+
+def decategorize(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    '''
+    Converts categorical columns back to strings, e.g. before grouping a
+    filtered subset by a column whose categories are mostly unused.
+
+    Args:
+    df (pd.DataFrame): Data.
+    columns (List[str]): Columns to convert; missing columns are skipped.
+
+    Returns:
+    pd.DataFrame: Data with the columns converted (a copy if any).
+    '''
+    categorical = [column for column in columns if column in df.columns and
+                   isinstance(df[column].dtype, pd.CategoricalDtype)]
+    if not categorical:
+        return df
+    return df.astype({column: 'object' for column in categorical})
@@ -1,87 +1,444 @@
-import csv
 import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from itertools import islice
+from typing import (Callable, Dict, Iterable, Iterator, List, Optional, TextIO,
+                    Tuple)
 
 import cyvcf2
+import pandas as pd
 
+from variant_schema import convert_frame, vcf_parsing_schema
 
-def vcf_parsing(file_path: str) -> str:
+# Layout of the gnomAD v4.0 VEP annotation. The header Format string lists 46 fields,
+# while the records contain 48 (two unnamed fields after SOURCE)
+gnomad_vep_names = ('Allele|Consequence|IMPACT|SYMBOL|Gene|Feature_type|Feature|BIOTYPE|EXON|INTRON|HGVSc|HGVSp|'
+                    'cDNA_position|CDS_position|Protein_position|Amino_acids|Codons|ALLELE_NUM|DISTANCE|STRAND|FLAGS|'
+                    'VARIANT_CLASS|SYMBOL_SOURCE|HGNC_ID|CANONICAL|MANE_SELECT|MANE_PLUS_CLINICAL|TSL|APPRIS|CCDS|ENSP|'
+                    'UNIPROT_ISOFORM|SOURCE|||DOMAINS|miRNA|HGVS_OFFSET|PUBMED|MOTIF_NAME|MOTIF_POS|HIGH_INF_POS|'
+                    'MOTIF_SCORE_CHANGE|TRANSCRIPTION_FACTORS|LoF|LoF_filter|LoF_flags|LoF_info').split('|')
+
+# VEP fields to extract and their column names in the output table
+vep_columns = {
+    'Consequence': 'Consequence', 'IMPACT': 'IMPACT', 'SYMBOL': 'SYMBOL', 'Gene': 'Gene',
+    'Feature_type': 'Feature_Type', 'Feature': 'Feature', 'BIOTYPE': 'BIOTYPE', 'EXON': 'EXON',
+    'INTRON': 'INTRON', 'ALLELE_NUM': 'ALLELE_NUM', 'VARIANT_CLASS': 'VARIANT_CLASS',
+    'CANONICAL': 'CANONICAL', 'LoF': 'LoF', 'LoF_filter': 'LoF_filter',
+    'LoF_flags': 'LoF_flags', 'LoF_info': 'LoF_info'}
+
+# INFO fields to extract
+info_fields_to_extract = ['AC', 'AC_afr', 'AC_amr', 'AC_nfe',
+                          'AC_asj', 'AC_sas', 'AC_eas', 'AC_mid', 'AC_fin',
+                          'AN', 'AN_afr', 'AN_amr', 'AN_nfe', 'AN_asj',
+                          'AN_sas', 'AN_eas', 'AN_mid', 'AN_fin',
+                          'AF', 'AF_afr', 'AF_amr', 'AF_nfe', 'AF_asj',
+                          'AF_sas', 'AF_eas', 'AF_mid', 'AF_fin', 'vep']
+
+# Version of the `vcf_parsing` output, part of the cache key of
+# context_analysis/parse_cache.py; increase when the output changes
+parser_version = '3'
+
+column_names = ['CHROM', 'POS', 'ID', 'REF', 'ALT', 'AC', 'AC_afr',
+                'AC_amr', 'AC_nfe', 'AC_asj', 'AC_sas', 'AC_eas',
+                'AC_mid', 'AC_fin', 'AN', 'AN_afr', 'AN_amr', 'AN_nfe',
+                'AN_asj', 'AN_sas', 'AN_eas', 'AN_mid', 'AN_fin', 'AF',
+                'AF_afr', 'AF_amr', 'AF_nfe', 'AF_asj', 'AF_sas', 'AF_eas',
+                'AF_mid', 'AF_fin', 'Consequence', 'IMPACT', 'SYMBOL',
+                'Gene', 'Feature_Type', 'Feature', 'BIOTYPE', 'EXON',
+                'INTRON', 'ALLELE_NUM', 'VARIANT_CLASS', 'CANONICAL',
+                'LoF', 'LoF_filter', 'LoF_flags', 'LoF_info']
+
+# Consequences kept by `info_filtering`
+lof_consequences = {'stop_gained', 'frameshift_variant',
+                    'splice_donor_variant', 'splice_acceptor_variant'}
+vep_column_index = {column: idx
+                    for idx, column in enumerate(vep_columns.values())}
+
+
+def get_vep_field_mapping(vcf: cyvcf2.VCF, width: int) -> Dict[int, str]:
+    '''
+    Maps positions of VEP fields to output column names using the Format string of the VCF header.
+
+    Args:
+    vcf (cyvcf2.VCF): Opened VCF file.
+    width (int): Number of fields in a transcript annotation of the records.
+
+    Returns:
+    Dict[int, str]: Position of every field from `vep_columns` to its column name.
+    '''
+    description = vcf.get_header_type('vep').get('Description', '')
+    match = re.search(r'Format: ([^"]*)', description)
+    names = match.group(1).split('|') if match else []
+    if len(names) != width:
+        if len(gnomad_vep_names) != width:
+            raise ValueError(f'VEP annotation has {width} fields, '
+                             f'but the header Format string declares {len(names)}')
+        names = gnomad_vep_names
+    return {names.index(field): column for field, column in vep_columns.items()}
+
+
+def is_lof_transcript(vep_fields: List[str]) -> bool:
+    '''
+    Pushdown filter with the conditions of `info_filtering`: keeps LoF
+    consequences on protein-coding Ensembl transcripts.
+
+    Args:
+    vep_fields (List[str]): Values of the VEP fields in `vep_columns` order.
+
+    Returns:
+    bool: True if the row would be kept by `info_filtering`.
+    '''
+    return (vep_fields[vep_column_index['Feature_Type']] == 'Transcript' and
+            vep_fields[vep_column_index['BIOTYPE']] == 'protein_coding' and
+            vep_fields[vep_column_index['Consequence']] in lof_consequences and
+            'ENST' in vep_fields[vep_column_index['Feature']])
+
+
+def get_allele_indices(vcf: cyvcf2.VCF) -> Dict[str, int]:
+    '''
+    Finds the INFO fields with one value per allele using the VCF header.
+
+    Args:
+    vcf (cyvcf2.VCF): Opened VCF file.
+
+    Returns:
+    Dict[str, int]: Fields of `info_fields_to_extract` with Number=A
+        (offset 0) or Number=R (offset 1, the first value is for REF).
+    '''
+    offsets = {}
+    for field in info_fields_to_extract[:-1]:
+        try:
+            number = vcf.get_header_type(field).get('Number')
+        except KeyError:
+            continue
+        if number in ('A', 'R'):
+            offsets[field] = int(number == 'R')
+    return offsets
+
+
+def split_info_values(info_values: List, allele_offsets: Dict[int, int],
+                      n_alleles: int) -> List[List]:
+    '''
+    Splits the INFO values of a multi-allelic record into per-allele lists.
+    Values with one value per record (e.g. AN) are shared by all alleles.
+
+    Args:
+    info_values (List): Values of `info_fields_to_extract[:-1]` as returned
+        by cyvcf2 (tuples for per-allele fields of multi-allelic records).
+    allele_offsets (Dict[int, int]): Position of every per-allele field
+        in `info_values` to its offset (see `get_allele_indices`).
+    n_alleles (int): Number of ALT alleles.
+
+    Returns:
+    List[List]: INFO values of every ALT allele.
+    '''
+    alleles = [list(info_values) for _ in range(n_alleles)]
+    for idx, offset in allele_offsets.items():
+        values = info_values[idx]
+        if not isinstance(values, tuple):
+            continue
+        for allele in range(n_alleles):
+            try:
+                alleles[allele][idx] = values[allele + offset]
+            except IndexError:
+                alleles[allele][idx] = '.'
+    return alleles
+
+
+def iter_vcf_alleles(vcf: cyvcf2.VCF, region: Optional[str] = None,
+                     row_filter: Optional[Callable[[List[str]], bool]] = None,
+                     profile=None) -> Iterator[Tuple[tuple, List[List[str]]]]:
+    '''
+    Yields the ALT alleles of PASS variants one by one: the fields shared
+    by all output rows of an allele (position, alleles and population
+    counts) and the VEP fields of its transcripts.
+
+    Multi-allelic records are split: per-allele INFO fields (AC, AF)
+    take the value of the allele, and every VEP transcript annotation is
+    routed to the allele given by its ALLELE_NUM (annotations without
+    a valid ALLELE_NUM go to the first allele).
+
+    Args:
+    vcf (cyvcf2.VCF): Opened VCF file.
+    region (str, optional): Region to query (e.g. 'chr22:1-1000000'),
+        requires an indexed VCF file. Defaults to the whole file.
+    row_filter (Callable[[List[str]], bool], optional): Predicate on the
+        VEP fields of a transcript (in `vep_columns` order); transcripts
+        for which it returns False are dropped, as are alleles without
+        VEP annotation. Defaults to no filtering.
+    profile (optional): `RunProfile` of context_analysis/run_profile.py
+        timing the reading of records by cyvcf2 ('read') and counting
+        records read, PASS records kept and transcripts emitted.
+
+    Yields:
+    Tuple[tuple, List[List[str]]]: Values of the first 32 `column_names`
+        and VEP fields of every transcript of the allele.
+    '''
+    # Positions of VEP fields are taken from the header on the first annotation
+    vep_field_mapping = None
+    fields = info_fields_to_extract[:-1]
+    allele_offsets = {fields.index(field): offset
+                      for field, offset in get_allele_indices(vcf).items()}
+    allele_num_idx = vep_column_index['ALLELE_NUM']
+    variants = vcf(region) if region else vcf
+    if profile is not None:
+        variants = profile.timed_iter(variants, 'read', 'records_read')
+
+    for variant in variants:
+        if 'PASS' not in variant.FILTERS:
+            continue
+        if profile is not None:
+            profile.count('pass_kept')
+        get_info = variant.INFO.get
+        vep_annotation = get_info('vep')
+        if not vep_annotation and row_filter is not None:
+            continue
+        info_values = [get_info(field, '.') for field in fields]
+        alts = variant.ALT
+        n_alleles = max(len(alts), 1)
+        if n_alleles == 1:
+            allele_info = [info_values]
+        else:
+            allele_info = split_info_values(info_values, allele_offsets,
+                                            n_alleles)
+
+        # Handle multiple transcripts in vep if present
+        if vep_annotation:
+            vep_transcripts = vep_annotation.split(',')
+            if vep_field_mapping is None:
+                vep_field_mapping = get_vep_field_mapping(
+                    vcf, vep_transcripts[0].count('|') + 1)
+                max_split = max(vep_field_mapping) + 1
+            allele_rows = [[] for _ in range(n_alleles)]
+            for transcript in vep_transcripts:
+                split_transcript = transcript.split('|', max_split)
+                vep_fields = []
+                for key in vep_field_mapping.keys():
+                    try:
+                        vep_fields.append(split_transcript[key])
+                    except Exception:
+                        vep_fields.append('.')
+                if row_filter is not None and not row_filter(vep_fields):
+                    continue
+                allele = 0
+                if n_alleles > 1:
+                    try:
+                        allele = int(vep_fields[allele_num_idx]) - 1
+                    except ValueError:
+                        allele = 0
+                    if not 0 <= allele < n_alleles:
+                        allele = 0
+                allele_rows[allele].append(vep_fields)
+        else:
+            allele_rows = [[['.', '.']] for _ in range(n_alleles)]
+
+        for allele in range(n_alleles):
+            if allele_rows[allele]:
+                alt = alts[allele] if alts else '.'
+                if profile is not None:
+                    profile.count('transcripts_emitted',
+                                  len(allele_rows[allele]))
+                yield ((variant.CHROM, variant.POS, variant.ID, variant.REF,
+                        alt, *allele_info[allele]), allele_rows[allele])
+
+
+def iter_vcf_rows(vcf: cyvcf2.VCF, region: Optional[str] = None,
+                  row_filter: Optional[Callable[[List[str]], bool]] = None,
+                  profile=None) -> Iterator[list]:
+    '''
+    Yields output rows (one per allele and transcript annotation) of PASS
+    variants one by one, so that only a single record is kept in memory.
+
+    Args:
+    vcf (cyvcf2.VCF): Opened VCF file.
+    region (str, optional): Region to query (e.g. 'chr22:1-1000000'),
+        requires an indexed VCF file. Defaults to the whole file.
+    row_filter (Callable[[List[str]], bool], optional): Predicate on the
+        VEP fields of a transcript (in `vep_columns` order); rows for which
+        it returns False are not created. Variants without VEP annotation
+        are skipped when a filter is set. Defaults to no filtering.
+    profile (optional): Profile of the run, see `iter_vcf_alleles`.
+
+    Yields:
+    list: Row with `column_names` values.
+    '''
+    for shared_fields, vep_rows in iter_vcf_alleles(vcf, region, row_filter,
+                                                    profile):
+        for vep_fields in vep_rows:
+            yield [*shared_fields, *vep_fields]
+
+
+def format_tsv_field(value) -> str:
+    '''
+    Formats a value as `csv.writer` with a tab delimiter does.
+
+    Args:
+    value: Value of a field.
+
+    Returns:
+    str: Field text, quoted if it contains a tab, a quote or a newline.
+    '''
+    text = '' if value is None else str(value)
+    if '"' in text or '\t' in text or '\n' in text or '\r' in text:
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+def write_tsv(alleles: Iterable[Tuple[tuple, List[List[str]]]],
+              tsvfile: TextIO) -> None:
+    '''
+    Writes the rows of `iter_vcf_alleles` to a TSV file. The shared fields
+    of an allele are formatted once and reused for all of its transcripts;
+    the output is the same as with `csv.writer(tsvfile, delimiter='\\t')`.
+
+    Args:
+    alleles (Iterable[Tuple[tuple, List[List[str]]]]): Output of
+        `iter_vcf_alleles`.
+    tsvfile (TextIO): File opened for writing with newline=''.
+
+    Returns:
+    None
+    '''
+    tsvfile.write('\t'.join(column_names) + '\r\n')
+    for shared_fields, vep_rows in alleles:
+        # Values come from VCF columns, so they contain no tabs
+        # or newlines; only quotes need the csv formatting
+        prefix = '\t'.join(['' if value is None else str(value)
+                             for value in shared_fields]) + '\t'
+        if '"' in prefix:
+            prefix = '\t'.join(map(format_tsv_field, shared_fields)) + '\t'
+        lines = []
+        for vep_fields in vep_rows:
+            line = '\t'.join(vep_fields)
+            if '"' in line:
+                line = '\t'.join(map(format_tsv_field, vep_fields))
+            lines.append(prefix + line + '\r\n')
+        tsvfile.write(''.join(lines))
+
+
+def write_parquet(rows: Iterable[list], destination_dir: str,
+                  batch_size: int = 100000) -> None:
+    '''
+    Writes rows to a Parquet dataset partitioned by chromosome, converting
+    each batch of rows to the dtypes of `vcf_parsing_schema` (uint32 allele
+    counts, float32 frequencies, categorical annotations and IDs).
+
+    Args:
+    rows (Iterable[list]): Rows with `column_names` values.
+    destination_dir (str): Path to the dataset directory.
+    batch_size (int): Number of rows converted and written at once.
+        Default is 100000.
+
+    Returns:
+    None
+    '''
+    # The dataset directory exists even if there are no rows
+    os.makedirs(destination_dir, exist_ok=True)
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        batch_df = convert_frame(pd.DataFrame(batch, columns=column_names),
+                                 vcf_parsing_schema)
+        # Every batch is written as a new file in its chromosome partition
+        batch_df.to_parquet(destination_dir, partition_cols=['CHROM'],
+                            index=False)
+
+
+def vcf_parsing(file_path: str,
+                row_filter: Optional[Callable[[List[str]], bool]] = None,
+                output_format: str = 'tsv',
+                output_dir: str = 'processed_data',
+                profile=None) -> str:
     '''
     Parses the VCF file and extracts relevant data, then saves the processed data to a TSV file.
+    Rows are written while the file is read, so memory usage does not depend on the file size.
 
     Args:
     file_path (str): The path to the VCF file for parsing.
+    row_filter (Callable[[List[str]], bool], optional): Pushdown filter on
+        the VEP fields of a transcript, e.g. `is_lof_transcript` to keep
+        only rows used by `info_filtering`. Defaults to no filtering.
+    output_format (str): 'tsv' or 'parquet' (a dataset directory
+        partitioned by chromosome, see `write_parquet`). Default is 'tsv'.
+    output_dir (str): Output folder. Default is 'processed_data'.
+    profile (optional): `RunProfile` of context_analysis/run_profile.py
+        (opt-in instrumentation): times of the read (cyvcf2), parse
+        (INFO and VEP splitting) and write stages, counters, progress
+        lines and a JSON report. Default is None.
 
     Returns:
-    str: A message indicating the creation of the TSV file.
+    str: Path to the created TSV file or Parquet dataset
+        (`output_dir`/<file name without extensions>.`output_format`).
     '''
-    
-    folder_path = 'processed_data'
+    if output_format not in ('tsv', 'parquet'):
+        raise ValueError(f'Unknown output format: {output_format}')
+    file_name = file_path.split('/')[-1].split('.')[0]
+    folder_path = output_dir
     if not os.path.exists(folder_path):
         os.makedirs(folder_path)
         print(f'Folder "{folder_path}" created.')
     else:
         print(f'Folder "{folder_path}" exists.')
-    destination_file = f'processed_data/{file_path.split("/")
-                                         [-1].split(".")[0]}.tsv'
+    destination_file = f'{folder_path}/{file_name}.{output_format}'
     vcf = cyvcf2.VCF(file_path)
     print('VCF file downloaded')
-
-    # Define the columns to extract
-    info_fields_to_extract = ['AC', 'AC_afr', 'AC_amr', 'AC_nfe',
-                              'AC_asj', 'AC_sas', 'AC_eas', 'AC_mid', 'AC_fin',
-                              'AN', 'AN_afr', 'AN_amr', 'AN_nfe', 'AN_asj',
-                              'AN_sas', 'AN_eas', 'AN_mid', 'AN_fin',
-                              'AF', 'AF_afr', 'AF_amr', 'AF_nfe', 'AF_asj',
-                              'AF_sas', 'AF_eas', 'AF_mid', 'AF_fin', 'vep']
-    vep_field_mapping = {
-            1: 'Consequence', 2: 'IMPACT', 3: 'SYMBOL', 4: 'Gene',
-            5: 'Feature_Type', 6: 'Feature', 7: 'BIOTYPE', 8: 'EXON',
-            9: 'INTRON', 17: 'ALLELE_NUM', 21: 'VARIANT_CLASS',
-            24: 'CANONICAL', 44: 'LoF', 45: 'LoF_filter',
-            46: 'LoF_flags', 47: 'LoF_info'}
-
-    column_names = ['CHROM', 'POS', 'ID', 'REF', 'ALT', 'AC', 'AC_afr',
-                    'AC_amr', 'AC_nfe', 'AC_asj', 'AC_sas', 'AC_eas',
-                    'AC_mid', 'AC_fin', 'AN', 'AN_afr', 'AN_amr', 'AN_nfe',
-                    'AN_asj', 'AN_sas', 'AN_eas', 'AN_mid', 'AN_fin', 'AF',
-                    'AF_afr', 'AF_amr', 'AF_nfe', 'AF_asj', 'AF_sas', 'AF_eas',
-                    'AF_mid', 'AF_fin', 'Consequence', 'IMPACT', 'SYMBOL',
-                    'Gene', 'Feature_Type', 'Feature', 'BIOTYPE', 'EXON',
-                    'INTRON', 'ALLELE_NUM', 'VARIANT_CLASS', 'CANONICAL',
-                    'LoF', 'LoF_filter', 'LoF_flags', 'LoF_info']
     print('VCF parsing in progress...')
+    if profile is not None:
+        profile.begin('vcf_parsing', file_path, output_format=output_format,
+                      row_filter=getattr(row_filter, '__name__', None))
+        # Time of the row iterators is subtracted from the 'write' stage
+        write_stage = profile.stage('write')
+    else:
+        write_stage = nullcontext()
 
-    # Initialize an empty list to store the extracted data
-    data = []
-
-    # Iterate over each variant in the VCF file
-    for variant in vcf:
-        if 'PASS' in variant.FILTERS:
-            variant_data = [variant.CHROM, variant.POS,
-                            variant.ID, variant.REF, variant.ALT[0]]
-            info_data = [variant.INFO.get(field, '.')
-                         for field in info_fields_to_extract]
-            vep_annotation = variant.INFO.get('vep')
-
-    # Handle multiple transcripts in vep if present
-            if vep_annotation:
-                vep_transcripts = vep_annotation.split(',')
-                for transcript in vep_transcripts:
-                    split_transcript = transcript.split('|')
-                    vep_fields = []
-                    for key in vep_field_mapping.keys():
-                        try:
-                            vep_fields.append(split_transcript[key])
-                        except Exception:
-                            vep_fields.append('.')
-                    data.append(variant_data + info_data[:-1] + vep_fields)
-            else:
-                data.append(variant_data + info_data + ['.'])
+    if output_format == 'parquet':
+        if os.path.isdir(destination_file):
+            shutil.rmtree(destination_file)
+        rows = iter_vcf_rows(vcf, row_filter=row_filter, profile=profile)
+        if profile is not None:
+            rows = profile.timed_iter(rows, 'parse', 'rows_written')
+        with write_stage:
+            write_parquet(rows, destination_file)
+    else:
+        alleles = iter_vcf_alleles(vcf, row_filter=row_filter,
+                                   profile=profile)
+        if profile is not None:
+            alleles = profile.timed_iter(alleles, 'parse', 'alleles')
+        with open(destination_file, 'w', newline='') as tsvfile, \
+                write_stage:
+            # Write the data rows as they are parsed
+            write_tsv(alleles, tsvfile)
     print('Data collected')
-    with open(destination_file, 'w', newline='') as tsvfile:
-        writer = csv.writer(tsvfile, delimiter='\t')
-        # Write the header
-        writer.writerow(column_names)
-        # Write the data rows
-        writer.writerows(data)
-    return (f'{file_path.split("/")[-1].split(".")[0]}.tsv file created')
+    if profile is not None:
+        profile.finish(destination_file)
+    print(f'{file_name}.{output_format} file created')
+    return destination_file
+
+
+def vcf_parsing_parallel(file_paths: List[str],
+                         processes: Optional[int] = None,
+                         row_filter: Optional[Callable[[List[str]], bool]] = None
+                         ) -> List[str]:
+    '''
+    Parses several VCF files (e.g. one per chromosome) in parallel
+    with `vcf_parsing`, one file per worker process.
+
+    Args:
+    file_paths (List[str]): Paths to the VCF files for parsing.
+    processes (int, optional): Number of worker processes.
+        Defaults to the number of CPUs.
+    row_filter (Callable[[List[str]], bool], optional): Pushdown filter
+        passed to `vcf_parsing`, must be a module-level function.
+
+    Returns:
+    List[str]: Paths of the outputs of `vcf_parsing` in the order of
+        `file_paths`.
+    '''
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(partial(vcf_parsing, row_filter=row_filter),
+                                 file_paths))